@@ -2,6 +2,23 @@ from enum import Enum
 ROCKET_CONF = ('RocketTile', '~/experiment_4/fuzz_bin', 'rocket_tile_inst_reset', 1730)
 BOOM_CONF = ('BoomTile', '~/experiment_4/fuzz_bin_boom', 'boom_cov_reset', 18808)
 
+# coverage hash of the RTL host per toplevel (shake/xxhash/crc/fold),
+# shake reproduces the coverage numbers of earlier campaigns
+COV_HASH_BY_TOPLEVEL = { 'RocketTile': 'shake',
+                         'BoomTile': 'shake' }
+
+# sample coverage (fold hash) and PCs inside the design instead of from python
+# every cycle, the simulator is built into <bin_dir>_monitor
+HDL_MONITOR = False
+
+# service the TileLink channels of both tiles from one coroutine per clock
+# instead of one polling coroutine per channel
+DISPATCH = False
+
+# write simInputs (.si) in the binary format, the loaders read both formats
+# and SiConvert.py converts between them
+SI_BINARY = True
+
 class Feedback(Enum):
     COVERAGE_FB = 0
     PASS_FB = 1
@@ -13,3 +30,21 @@ DATA_EQ_REGISTERS = True
 DATA_GUIDANCE = False
 DATA_50_50 = True
 
+# size of the mutator's data seed LRU, the least recently used seed is
+# replaced (and its energy dropped) once it is full
+MAX_DATA_SEEDS = 100
+
+# number of inputs whose contract check and RTL results are kept to skip
+# duplicates (see src/result_cache.py)
+RESULT_CACHE_SIZE = 10000
+
+
+# seconds between two syncs of a worker with the campaign coordinator
+# (see src/campaign.py)
+CAMPAIGN_SYNC = 10
+
+# jobs the background artifact writer may fall behind before the fuzzer
+# waits for it, and seconds between two flushes of the logs
+# (see src/artifact_writer.py)
+ARTIFACT_QUEUE = 1024
+ARTIFACT_FLUSH = 5
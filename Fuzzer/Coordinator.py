@@ -0,0 +1,16 @@
+from src.campaign import campaignCoordinator, campaignServer
+
+def Coordinate(out, port, host='0.0.0.0', seed=None):
+    coordinator = campaignCoordinator(out, seed)
+    server = campaignServer((host, port), coordinator)
+
+    print('[Coordinator] Campaign {} on {}:{}, seed {}'.format(out, host, port, coordinator.seed))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    print('[Coordinator] {}'.format(coordinator.stats()))
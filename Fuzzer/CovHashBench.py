@@ -0,0 +1,52 @@
+import time
+import random
+import argparse
+
+from RTLSim.host import ROCKET_COV_LEN, BOOM_COV_LEN, COV_HASHES
+
+""" Coverage hash benchmark
+Replays a synthetic coverage trace (the reset vector with a few bits toggling
+per cycle) through every coverage hash and reports how many cycles per second
+cov_gen could sustain with it, ignoring the simulator itself.
+"""
+
+def gen_trace(cov_len, cycles, toggles):
+    val = (1 << cov_len) - 1
+    nbytes = (cov_len + 7) // 8
+    trace = []
+    for _ in range(cycles):
+        for _ in range(random.randint(0, toggles)):
+            val ^= 1 << random.randrange(cov_len)
+        trace.append(val.to_bytes(nbytes, byteorder='big'))
+    return trace
+
+def bench(cov_hash, trace):
+    coverage_map = set()
+    last_idx = 0
+
+    start = time.perf_counter()
+    for buff in trace:
+        idx = cov_hash(buff)
+        coverage_map.add(idx ^ last_idx)
+        last_idx = idx >> 1
+    end = time.perf_counter()
+
+    return (len(trace) / (end - start), len(coverage_map))
+
+parser = argparse.ArgumentParser(prog="CovHashBench",
+                                 description="Compare the coverage hashes of the RTL host")
+parser.add_argument('-c', '--cycles', type=int, default=100000, help='Cycles per trace')
+parser.add_argument('-t', '--toggles', type=int, default=8, help='Maximal coverage bits toggling per cycle')
+parser.add_argument('-s', '--seed', type=int, default=0, help='Seed of the synthetic trace')
+
+args = parser.parse_args()
+random.seed(args.seed)
+
+for (toplevel, cov_len) in [ ('RocketTile', ROCKET_COV_LEN), ('BoomTile', BOOM_COV_LEN) ]:
+    trace = gen_trace(cov_len, args.cycles, args.toggles)
+
+    print('[CovHashBench] {}, {} bits, {} cycles'.format(toplevel, cov_len, args.cycles))
+    print('{:<10}{:>15}{:>15}'.format('hash', 'cycles/s', 'cov_points'))
+    for name in COV_HASHES:
+        (rate, points) = bench(COV_HASHES[name](cov_len), trace)
+        print('{:<10}{:>15.0f}{:>15}'.format(name, rate, points))
@@ -1,18 +1,37 @@
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from itertools import repeat
 import time
-import random
+import rng
 from bitarray import bitarray
 from bitarray.util import int2ba
 
 from src.utils import *
 from src.multicore_manager import proc_state
+from src.cov_utils import covMap, sharedCovMap
+from src.result_cache import resultCache
+from src.campaign import campaignClient
+from src.artifact_writer import artifactWriter
 
-from Config import ROCKET_CONF, BOOM_CONF, DATA_GUIDANCE, Feedback, FEEDBACK
+from Config import ROCKET_CONF, BOOM_CONF, DATA_GUIDANCE, Feedback, FEEDBACK, RESULT_CACHE_SIZE, \
+    CAMPAIGN_SYNC, ARTIFACT_QUEUE, ARTIFACT_FLUSH
+
+def sync_campaign(client, mutator, last_coverage, debug):
+    """ Exchanges coverage, corpus entries and leaks with the coordinator """
+    (remote_cov, remote_corpus, accepted) = client.sync()
+
+    # points the other workers covered are not new here anymore
+    last_coverage.merge(remote_cov)
+    for (buf, cov, new_bits, exec_time) in remote_corpus:
+        (sim_input, _, _) = mutator.parse_siminput(buf)
+        mutator.add_corpus(sim_input, cov, new_bits, exec_time)
+
+    debug_print('[HSCFuzz] Campaign sync: {} remote cov_points, {} remote corpus entries, {} duplicate leaks'. \
+                format(len(remote_cov), len(remote_corpus), accepted.count(False)), debug)
 
 
 def Fuzz(target, template='Template', in_file=None, debug=True, record=True,
-        out='output', cov_log=None, contract='ct', isa='RV64I', trace_log=None, cores=0):
+        out='output', cov_log=None, contract='ct', isa='RV64I', trace_log=None, cores=0,
+        stop_on_leak=True, persistent=False, seed=None, coordinator=None, covmap=None):
     
     assert target in ['Rocket', 'Boom' ], \
         '{} is not toplevel'.format(target)
@@ -26,13 +45,26 @@ def Fuzz(target, template='Template', in_file=None, debug=True, record=True,
     else:
         toplevel, bin_dir, v_file, cov_len = BOOM_CONF
 
-    random.seed(time.time() * (proc_num + 1))
+    # A seeded run folds the results in submission order, always the oldest
+    # cores simulations at once, so what the corpus holds when an input is
+    # generated does not depend on which simulation finishes first. Remote
+    # corpus entries of a campaign arrive whenever they are synced.
+    ordered = seed is not None
+
+    client = None
+    if coordinator:
+        client = campaignClient(coordinator)
+        if seed is None:
+            seed = client.seed
+        print('[HSCFuzz] Joined campaign {} as worker {}'.format(coordinator, client.id))
+
+    campaign_seed = rng.seed(seed)
+    adapter_seed = rng.derive_seed(campaign_seed, 'adapter')
+    print('[HSCFuzz] Campaign seed {}'.format(campaign_seed))
 
     (mutator, preprocessor, hscHost) = \
         setupHSC(template, out, proc_num, debug, contract, isa, FEEDBACK == Feedback.NO_FB)
 
-    #if in_file: num_iter = 1
-    num_iter=1
     stop = [ proc_state.NORMAL ]
     lNum = 0
     cNum = 0
@@ -40,7 +72,19 @@ def Fuzz(target, template='Template', in_file=None, debug=True, record=True,
     htNum = 0
     cdNum = 0
 
-    last_coverage = bitarray(repeat(0,2 ** 24)) # UP
+    # fuzzers with their own output directories share coverage through covmap
+    if covmap:
+        last_coverage = sharedCovMap(covmap)
+    else:
+        last_coverage = covMap()
+
+    # inputs identical to one already generated are skipped
+    cache = resultCache(RESULT_CACHE_SIZE)
+    keys = {} # id -> content hash of the inputs in the RTL simulators
+    dupNum = 0
+
+    # logs, corpus entries and mismatches are written in the background
+    writer = artifactWriter(ARTIFACT_QUEUE, ARTIFACT_FLUSH)
 
     debug_print('[HSCFuzz] Start Fuzzing', debug)
 
@@ -49,196 +93,198 @@ def Fuzz(target, template='Template', in_file=None, debug=True, record=True,
     # number of retrieved fuzzing jobs
     rt = 0
 
-    flag = True
-    first = 0
-
-
     if cores == 0:
         cores = os.cpu_count()
     executor = ProcessPoolExecutor (max_workers=cores)
 
-    futures = []
+    # Inputs which passed the contract check and wait for (or run in) an RTL
+    # simulator. Keeping two per core hides the generation latency.
+    max_pending = 2 * cores
+    futures = {} # future -> (rtl input, data at submission)
 
     gen_done = False
     sim_tasks = 0
 
-    temp = 0
-    while not gen_done or rt < sim_tasks:
+    try:
+        while not gen_done or futures:
+
+            # Producer: generate, preprocess and contract-check until the queue is full
+            while not gen_done and len(futures) < max_pending:
+
+                candidates = []
+                for n in range(max_pending - len(futures)):
+                    assert_intr = False
+                    # if random.random() < prob_intr:
+                    #     assert_intr = True
+
+                    (sim_input, (data_a, data_b)) = mutator.get(assert_intr)
+
+                    key = sim_input.content_hash((data_a, data_b))
+                    if cache.lookup(key):
+                        dupNum += 1
+                        debug_print('[HSCFuzz] duplicate input skipped', debug)
+                        continue
+                    cache.entry(key)
+
+                    if debug:
+                        print('[HSCFuzz] Fuzz Instructions')
+                        for inst, INT in zip(sim_input.get_insts(), sim_input.ints + [0]):
+                            print('{:<50}{:04b}'.format(inst, INT))
+
+                    (hsc_input, rtl_input, symbols) = preprocessor.process(sim_input, data_a, data_b, assert_intr, id=it)
+
+                    if hsc_input and rtl_input:
+                        candidates.append((it, sim_input, (data_a, data_b), hsc_input, rtl_input, key))
+                        it += 1
+                    else:
+                        cache.put_hsc(key, proc_state.ERR_COMPILE)
+
+                rets = hscHost.run_batch([ hsc_input for (_, _, _, hsc_input, _, _) in candidates ], stop, cores)
+
+                for ((id, sim_input, data, hsc_input, rtl_input, key), ret) in zip(candidates, rets):
+                    cache.put_hsc(key, ret)
+                    if DATA_GUIDANCE:
+                        mutator.update_data_seed_energy(sim_input.get_seed(), ret==proc_state.ERR_CONTR_DIST or ret==proc_state.ERR_RV_EXC)
+                    if ret == proc_state.ERR_HSC_TIMEOUT: 
+                        writer.submit(save_mismatch, out, out + '/hsc_timeout', id, htNum)
+                        htNum += 1
+                        debug_print('[HSCHost] timeout', debug, True)
+                        continue
+                    elif ret == proc_state.ERR_CONTR_DIST: 
+                        # save_mismatch(out, out + '/contr_dist', id, cdNum)
+                        cleanup(rtl_input)
+                        cdNum += 1
+                        debug_print('[HSCHost] contract distinguishable', debug, True)
+                        continue
+                    elif ret == proc_state.ERR_RV_EXC:
+                        cleanup(rtl_input) # discard RISC-V-exception-triggering input
+                        debug_print('[HSCHost] input triggers RISC-V exception', debug, True)
+                        continue
+                    elif ret == proc_state.ERR_HSC_ASSERT: # temporary files stay available to debug sail
+                        debug_print('[HSCHost] non-zero exit code', debug, True)
+                        continue
+
+                    f = executor.submit(run_rtl_test, bin_dir, v_file, toplevel, rtl_input, id, sim_input, persistent,
+                                        adapter_seed)
+                    # the data seed may be replaced before the simulation finishes
+                    futures[f] = (rtl_input, data)
+                    keys[id] = key
+
+                    sim_tasks += 1
+                    mutator.update_phase(sim_tasks)
+
+            if not futures:
+                break
 
-        assert_intr = False
-        # if random.random() < prob_intr:
-        #     assert_intr = True
+            debug_print('[HSCFuzz] Iteration [{}]'.format(it), debug)
+
+            # Consumer: fold every simulation which finished in the meantime,
+            # or, seeded, the oldest ones once they all finished
+            if ordered:
+                done = list(futures)[:cores]
+                wait(done)
+            else:
+                (done, _) = wait(futures, return_when=FIRST_COMPLETED)
+            for f in done:
+                (rtl_input, data) = futures.pop(f)
+                rt += 1
+
+                (ret, cov_map, run_id, run_input, exec_time) = f.result()
+                key = keys.pop(run_id)
+                if ret == ERROR:
+                    debug_print('[RTLHost] exception {}'.format(run_id), debug, True)
+                    stop[0] = proc_state.ERR_RTL_SIM
+                    gen_done = True
+                    continue
 
-        while len(futures) < 32 and it < num_iter:
+                #TODO maybe adapt to interrupts
+                # if assert_intr and ret == NO_LEAK:
+                #     (intr_prv, epc) = checker.check_intr(symbols)
+                #     if epc != 0:
+                #         preprocessor.write_isa_intr(hsc_input, rtl_input, epc)
+                #         ret = run_isa_test(hscHost, hsc_input, stop, out, proc_num, True)
+                #         if ret == proc_state.ERR_HSC_TIMEOUT: continue
+                #         elif ret == proc_state.ERR_HSC_ASSERT: break
+                #     else: continue
 
-            (sim_input, (data_a, data_b)) = mutator.get(assert_intr)
+                if ret == LEAK:
+                    # if record:
+                    #     save_leak(out, out + '/leaks', run_id, lNum)
 
-            if debug:
-                print('[HSCFuzz] Fuzz Instructions')
-                for inst, INT in zip(sim_input.get_insts(), sim_input.ints + [0]):
-                    print('{:<50}{:04b}'.format(inst, INT))
+                    lNum += 1
+                    if client:
+                        client.add_leak(adapter_seed,
+                                        read_file(os.path.join(os.path.dirname(rtl_input), 'leaks', 'sim_input',
+                                                               'id_{}.si'.format(run_id))))
 
-            (hsc_input, rtl_input, symbols) = preprocessor.process(sim_input, data_a, data_b, assert_intr, id=it)
+                    debug_print('[HSCFuzz] Bug #{}-- {}'. \
+                                format(lNum, run_id), debug, True)
 
-            if hsc_input and rtl_input:
-                ret = hscHost.run_test(hsc_input, stop)
-                if DATA_GUIDANCE:
-                    mutator.update_data_seed_energy(sim_input.get_seed(), ret==proc_state.ERR_CONTR_DIST or ret==proc_state.ERR_RV_EXC)
-                if ret == proc_state.ERR_HSC_TIMEOUT: 
-                    save_mismatch(out, out + '/hsc_timeout', it, htNum)
-                    htNum += 1
-                    # if flag:
-                    #     first += 1
-                    debug_print('[HSCHost] timeout', debug, True)
-                    continue
-                elif ret == proc_state.ERR_CONTR_DIST: 
-                    # save_mismatch(out, out + '/contr_dist', it, cdNum)
-                    cleanup(rtl_input)
-                    cdNum += 1
-                    debug_print('[HSCHost] contract distinguishable', debug, True)
-                    it += 1 # we only want ever want to generate it many inputs
-                    num_iter += 1
-                    #if flag:
-                        #first += 1
-                    continue
-                elif ret == proc_state.ERR_RV_EXC:
-                    cleanup(rtl_input) # discard RISC-V-exception-triggering input
-                    debug_print('[HSCHost] input triggers RISC-V exception', debug, True)
-                    # if flag:
-                    #     first += 1
-                    continue
-                elif ret == proc_state.ERR_HSC_ASSERT: # exit, temporary files stay available to debug sail
-                    debug_print('[HSCHost] non-zero exit code', debug, True)
-                    # if flag:
-                    #     first += 1
-                    break
-            
-                f = executor.submit(run_rtl_test, bin_dir, v_file, toplevel, rtl_input, it, sim_input)
-                futures.append(f)
-
-                (ret1, cov_map1, run_id1, run_input1) = f.result()
-                if ret1 == LEAK: 
-                    temp = 1
-                    gen_done = True
-                    break
+                    if stop_on_leak:
+                        gen_done = True
 
+                elif ret == TIME_OUT:
 
-                # f1 = as_completed(f)
-                #(ret1, cov_map1, run_id1, run_input1) = f.result()
-                #if ret1 == LEAK: 
-                    
-                    #flag = False
-                #elif flag:
-                    #first += 1
+                    # if record:
+                    #     save_leak(out, out + '/rtl_timeout', run_id, rtNum)
 
+                    rtNum += 1
+                    debug_print('[HSCFuzz] Bug #{} -- {} [RTL Timeout]'. \
+                                format(rtNum, run_id), debug, True)
 
-                it += 1
-                num_iter += 1
-                sim_tasks += 1
+                cache.put_rtl(key, ret, cov_map)
 
-            mutator.update_phase(sim_tasks)
+                # real coverage parameters
+                new_coverage = last_coverage.merge(cov_map)
+                coverage = len(new_coverage)
 
-        debug_print('[HSCFuzz] Iteration [{}]'.format(it), debug)
-        for f in as_completed(futures):
+                debug_print("new_cov#:{}".format(coverage), debug, False)
 
-            (ret, cov_map, run_id, run_input) = f.result()
-            if ret == ERROR:
-                debug_print('[RTLHost] exception {}'.format(run_id), debug, True)
-                stop[0] = proc_state.ERR_RTL_SIM
-                break
-            
-            
-            
-            
-            #TODO maybe adapt to interrupts
-            # if assert_intr and ret == NO_LEAK:
-            #     (intr_prv, epc) = checker.check_intr(symbols)
-            #     if epc != 0:
-            #         preprocessor.write_isa_intr(hsc_input, rtl_input, epc)
-            #         ret = run_isa_test(hscHost, hsc_input, stop, out, proc_num, True)
-            #         if ret == proc_state.ERR_HSC_TIMEOUT: continue
-            #         elif ret == proc_state.ERR_HSC_ASSERT: break
-            #     else: continue
-
-            # cause = '-'
-            # match = False
-            # if ret == NO_LEAK: #TODO compare sail vs rtl
-            #    #match = checker.check(symbols)
-            #    match = True
-            # GG maybe add again if memory checks are interesting
-            # elif ret == ILL_MEM: 
-            #     match = True
-            #     debug_print('[HSCFuzz] Memory access outside DRAM -- {}'. \
-            #                 format(iNum), debug, True)
-            #     if record:
-            #         save_mismatch(out, proc_num, out + '/illegal',
-            #                       sim_input, (data_a, data_b), iNum)
-            #     iNum += 1
-
-            elif ret == LEAK: #not match or ret not in [NO_LEAK, ILL_MEM]:
-                # if record:
-                #     save_leak(out, out + '/leaks', run_id, lNum)
-
-                lNum += 1
-
-                debug_print('[HSCFuzz] Bug #{}-- {}'. \
-                            format(lNum, run_id), debug, True)
-                
-                
-            elif ret == TIME_OUT:
-
-                # if record:
-                #     save_leak(out, out + '/rtl_timeout', run_id, rtNum)
-
-                rtNum += 1
-                debug_print('[HSCFuzz] Bug #{} -- {} [RTL Timeout]'. \
-                            format(rtNum, run_id), debug, True)
-            
-            #leagacy fun stuff
-            # cov_bits = int2ba(cov_bits, length=cov_len, endian='big')
-            # cov_bits = ~cov_bits #change to 1 indicating a difference
-            # old_cov_bits = cov_bits | old_cov_bits
-            
-            # real coverage parameters
-            new_coverage = ~last_coverage & cov_map
-            coverage = new_coverage.count(1)
-            
-            # debug_print("old_cov:{}".format(old_cov_bits.count(1)), debug, False)
-            debug_print("new_cov#:{}".format(coverage), debug, False)
-                        
-            # sim_input.save(out + '/trace/id_{}.si'.format(rt), (data_a, data_b))
-            if record:
-                save_file(trace_log, 'a', '{:<10}\t{:<10}\t{:<10}\t{:<10}\n'.format(
-                    time.time() - start_time, run_id, coverage, cov_map.count(1)))
-
-            if new_coverage.any():
                 if record:
-                    save_file(cov_log, 'a', '{:<10}\t{:<10}\t{:<10}\t{:<10}\n'.
-                              format(time.time() - start_time, run_id,
-                                     coverage, cov_map.count(1)))
-                    run_input.save(out + '/corpus/id_{}.si'.format(cNum))
-
-                cNum += 1
-                if FEEDBACK == Feedback.COVERAGE_FB:
-                    mutator.add_corpus(run_input)
-                last_coverage = last_coverage | cov_map
-
-            if FEEDBACK == Feedback.PASS_FB:
-                mutator.add_corpus(run_input)
-
-            futures.remove(f)
-            rt += 1
-
-        if temp == 1:
-            break
-        
-        
-        debug_print('[HSCFuzz] Retrieving [{}]'.format(rt), debug)
-        
-        
+                    writer.append(trace_log, '{:<10}\t{:<10}\t{:<10}\t{:<10}\n'.format(
+                        time.time() - start_time, run_id, coverage, len(cov_map)))
+
+                if coverage:
+                    if record:
+                        writer.append(cov_log, '{:<10}\t{:<10}\t{:<10}\t{:<10}\n'.
+                                  format(time.time() - start_time, run_id,
+                                         coverage, len(cov_map)))
+                        writer.submit(run_input.save, out + '/corpus/id_{}.si'.format(cNum))
+
+                    cNum += 1
+                    if client:
+                        client.add_cov(new_coverage)
+                        client.add_corpus(run_input.dump(data), cov_map, coverage, exec_time)
+
+                    if FEEDBACK == Feedback.COVERAGE_FB:
+                        mutator.add_corpus(run_input, cov_map, coverage, exec_time)
+
+                if FEEDBACK == Feedback.PASS_FB:
+                    mutator.add_corpus(run_input, cov_map, coverage, exec_time)
+
+            if gen_done:
+                # Simulations which have not started yet are dropped, running ones are still folded
+                for f in [ f for f in futures if f.cancel() ]:
+                    cleanup(futures.pop(f)[0])
+
+            if client and client.due(CAMPAIGN_SYNC):
+                sync_campaign(client, mutator, last_coverage, debug)
+
+            debug_print('[HSCFuzz] Retrieving [{}]'.format(rt), debug)
+    finally:
+        # queued logs and corpus entries are written even if the loop fails,
+        # simulations which have not started yet are dropped with their inputs
+        for f in [ f for f in futures if f.cancel() ]:
+            cleanup(futures.pop(f)[0])
+        executor.shutdown(wait=True)
+        writer.close()
+
+    if client:
+        sync_campaign(client, mutator, last_coverage, debug)
+        client.close()
+
     #TODO remove trace or move sim_inputs as trace saving
-    print('[HSCFuzz] Stop Fuzzing, total {} cov_points'.format(last_coverage.count(1)))
+    print('[HSCFuzz] Stop Fuzzing, total {} cov_points'.format(last_coverage.count()))
     print('[HSCFuzz] {} sim, {} dist, {} leak'.format(rt, cdNum, lNum))
-    print('[HSCFuzz] {} cov, {} rto'.format(cNum, rtNum))
-    #print(first)
-
+    print('[HSCFuzz] {} cov, {} rto, {} dup'.format(cNum, rtNum, dupNum))
+    print('[HSCFuzz] Result cache: {}'.format(cache.stats()))
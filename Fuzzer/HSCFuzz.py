@@ -10,6 +10,7 @@ from src.multicore_manager import proc_state, procManager
 from Fuzzer import Fuzz
 from Minimizer import Minimize
 from Replay import Replay
+from Coordinator import Coordinate
 
 ### Multicore Fuzzing ###
 
@@ -49,7 +50,19 @@ parser.add_argument('-v', '--verbose', action='store_true', help='Verbose loggin
 parser.add_argument('-r', '--replay', default=None, help='SimInput to replay')
 parser.add_argument('-m', '--multi', type=int, default=0, help='Maximal number of parallel simulators')
 parser.add_argument('--minimize', action='store_true', help='Replay and minimize')
+parser.add_argument('--keep_going', action='store_true', help='Keep fuzzing after the first leak')
+parser.add_argument('--persistent', action='store_true', help='Keep one simulator running per worker')
 parser.add_argument('--no_guide', help='Random testing')
+parser.add_argument('-s', '--seed', type=int, default=None,
+                    help='Campaign seed (default: from the time). A seeded run folds simulation results in submission '
+                         'order and generates the same inputs for the same -m, unless it is a campaign worker')
+parser.add_argument('--covmap', default=None, metavar='PATH',
+                    help='Keep the coverage in this file, shared with every fuzzer given the same PATH '
+                         '(each with its own -o)')
+parser.add_argument('--coordinate', type=int, default=None, metavar='PORT',
+                    help='Coordinate a distributed campaign on this port instead of fuzzing')
+parser.add_argument('--coordinator', default=None, metavar='HOST:PORT',
+                    help='Fuzz as a worker of the campaign coordinated at HOST:PORT')
 
 args = parser.parse_args()
 
@@ -67,7 +80,7 @@ out = args.output
 # isa = parser.arg_map['isa'][0]
 
 if args.replay:
-    Replay(args.target, in_file=args.replay, contract=args.contract, debug=args.verbose)
+    Replay(args.target, in_file=args.replay, contract=args.contract, debug=args.verbose, seed=args.seed)
 else:
     if not os.path.isdir(out):
         os.makedirs(out)
@@ -130,9 +143,13 @@ else:
         save_file(trace_log, 'w', '{:<10}\t{:<10}\t{:<10}\t{:<10}\n'.
                 format('time', 'iter', 'new_bits', 'cov_bits'))
 
-    if args.minimize:
-        Minimize(args.target, out=out, contract=args.contract, isa=args.isa, debug=args.verbose) 
+    if args.coordinate:
+        Coordinate(out, args.coordinate, seed=args.seed)
+    elif args.minimize:
+        Minimize(args.target, out=out, contract=args.contract, isa=args.isa, debug=args.verbose,
+                 num_cores=args.multi, seed=args.seed, persistent=args.persistent)
     else:
         Fuzz(args.target , out=out, cov_log=cov_log,
             contract=args.contract, isa=args.isa, trace_log=trace_log, 
-            debug=args.verbose, cores=args.multi)
\ No newline at end of file
+            debug=args.verbose, cores=args.multi, stop_on_leak=not args.keep_going,
+            persistent=args.persistent, seed=args.seed, coordinator=args.coordinator, covmap=args.covmap)
\ No newline at end of file
@@ -3,7 +3,10 @@ import os
 import subprocess
 import filecmp
 import re
-from threading import Timer
+from collections import deque
+from queue import Queue
+from threading import Timer, Thread
+from concurrent.futures import ThreadPoolExecutor
 import psutil
 import signal
 from src.multicore_manager import proc_state
@@ -15,6 +18,60 @@ def find_exception(string):
     match = re.search(pattern, string, re.MULTILINE)
     return match
 
+# events of the streaming contract check, (kind, model, line)
+LINE = 0
+EXC = 1
+END = 2
+
+class traceStream():
+    """ A contract trace streamed through a FIFO
+    Sail writes the trace to a FIFO instead of a file, a reader thread
+    blocks on it and queues every line. The host holds a write end itself
+    until the model exited, so the reader sees EOF exactly then, also if
+    Sail never opened the trace. The lines read are kept, to leave the
+    trace as a file for debugging.
+    """
+    def __init__(self, name, n, events):
+        if os.path.lexists(name):
+            os.remove(name)
+        os.mkfifo(name)
+
+        self.name = name
+        self.n = n
+        self.events = events
+        self.lines = []
+
+        rfd = os.open(name, os.O_RDONLY | os.O_NONBLOCK)
+        self.wfd = os.open(name, os.O_WRONLY)
+        os.set_blocking(rfd, True)
+        self.fd = open(rfd, 'rb')
+
+        self.thread = Thread(target=self.read)
+        self.thread.start()
+
+    def read(self):
+        for line in self.fd:
+            self.lines.append(line)
+            self.events.put((LINE, self.n, line.rstrip(b'\n')))
+        self.fd.close()
+        self.events.put((END, self.n, None))
+
+    def release(self):
+        """ Drops the host's write end, once the model exited """
+        os.close(self.wfd)
+
+    def close(self, keep=False):
+        """ Removes the FIFO, keep writes the lines read until the model
+        stopped to a trace file of the same name instead
+        """
+        self.thread.join()
+        os.remove(self.name)
+
+        if keep:
+            fd = open(self.name, 'wb')
+            fd.writelines(self.lines)
+            fd.close()
+
 class hscInput():
     def __init__(self, binary_a, binary_b, max_cycles=0): #GG now with two binaries
         self.binary_a = binary_a
@@ -22,11 +79,12 @@ class hscInput():
         self.max_cycles = max_cycles
 
 class rvHSChost():
-    def __init__(self, sail, sail_args, hsc_outfiles ,debug=False):
+    def __init__(self, sail, sail_args, hsc_outfiles ,debug=False, stream=True):
         self.sail = sail
         self.sail_args = sail_args
         (self.out_a, self.out_b) = hsc_outfiles
         self.debug = debug
+        self.stream = stream
 
     def debug_print(self, message):
         if self.debug:
@@ -41,43 +99,167 @@ class rvHSChost():
 
         stop[0] = proc_state.ERR_HSC_TIMEOUT
 
-    def run_test(self, hsc_input: hscInput, stop):
+    def spawn(self, sail_args, binary, out):
+        if os.path.lexists(out): # a stale trace (or FIFO) must not be read
+            os.remove(out)
+
+        args = sail_args + [ binary, '-o', out ]
+        return subprocess.Popen(args, stdout=subprocess.PIPE)
+
+    def communicate(self, procs):
+        # drain all pipes at once, so no model blocks on a full stdout pipe
+        stdouts = [ None for proc in procs ]
+
+        def drain(n):
+            (stdouts[n], _) = procs[n].communicate()
+
+        threads = [ Thread(target=drain, args=(n,)) for n in range(len(procs)) ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return stdouts
+
+    def kill(self, procs):
+        for proc in procs:
+            if proc.poll() is None:
+                proc.kill()
+            proc.wait()
+
+    def compare_streams(self, sail_args, binaries, outs):
+        """ Streaming contract check
+        Compares both traces line by line while the models run and stops
+        them as soon as the traces are known to differ. The verdict only
+        depends on the complete traces and outputs, not on when the models
+        were stopped:
+         - traces differ in a line: ERR_CONTR_DIST
+         - one trace is a prefix of the other: ERR_HSC_ASSERT if the model
+           of the shorter one failed, else ERR_CONTR_DIST
+         - same traces: as the non-streaming check, exit code and exception
+           of a, then the same for b
+        Exceptions and failures after the traces differ are not reported.
+        On ERR_HSC_ASSERT, the traces read are left as files.
+        """
+        events = Queue()
+        traces = [ traceStream(out, n, events) for (n, out) in enumerate(outs) ]
+        procs = [ subprocess.Popen(sail_args + [ binary, '-o', out ], stdout=subprocess.PIPE)
+                  for (binary, out) in zip(binaries, outs) ]
+        excs = [ False, False ]
+
+        def scan(n):
+            for line in procs[n].stdout:
+                if not excs[n] and find_exception(line.decode()):
+                    excs[n] = True
+            procs[n].stdout.close()
+            procs[n].wait()
+            traces[n].release()
+
+        threads = [ Thread(target=scan, args=(n,)) for n in range(len(procs)) ]
+        for thread in threads:
+            thread.start()
+
+        lines = [ deque(), deque() ]
+        ended = [ False, False ]
+        ret = None
+        while ret is None and not all(ended):
+            (kind, n, line) = events.get()
+            if kind == END:
+                ended[n] = True
+            else:
+                lines[n].append(line)
+                while lines[0] and lines[1]:
+                    if lines[0].popleft() != lines[1].popleft():
+                        ret = proc_state.ERR_CONTR_DIST
+                        break
+
+            if ret is None:
+                for n in range(len(procs)):
+                    if ended[n] and lines[1 - n]: # the trace of n is shorter
+                        if procs[n].returncode != 0:
+                            ret = proc_state.ERR_HSC_ASSERT
+                        else:
+                            ret = proc_state.ERR_CONTR_DIST
+                        break
+
+        self.kill(procs)
+        for thread in threads:
+            thread.join()
+
+        if ret is None:
+            # both models exited by themselves, their stdout is scanned completely
+            ret = proc_state.NORMAL
+            for n in range(len(procs)):
+                if procs[n].returncode != 0:
+                    ret = proc_state.ERR_HSC_ASSERT
+                    break
+                if excs[n]: # if the program steps into an exception handler trap
+                    ret = proc_state.ERR_RV_EXC
+                    break
+
+        for trace in traces:
+            trace.close(ret == proc_state.ERR_HSC_ASSERT)
+
+        return ret
+
+    def run_test(self, hsc_input: hscInput, stop, hsc_outfiles=None):
+        if hsc_outfiles: (out_a, out_b) = hsc_outfiles
+        else: (out_a, out_b) = (self.out_a, self.out_b)
+
         sail_args = [ self.sail ] + self.sail_args 
         if hsc_input.max_cycles > 0:
             sail_args += [ '-l {}'.format(hsc_input.max_cycles) ]
 
         self.debug_print('[HSCHost] Start contract checking')     
-        args_a = sail_args + [ hsc_input.binary_a, '-o', self.out_a]
         # timer = Timer(HSC_TIME_LIMIT, self.timeout, [stop])
         # timer.start()
-        a_ret = subprocess.run(args_a, stdout=subprocess.PIPE) #TODO parallelize with other call for b
+        if self.stream:
+            return self.compare_streams(sail_args, [ hsc_input.binary_a, hsc_input.binary_b ], [ out_a, out_b ])
+
+        a_proc = self.spawn(sail_args, hsc_input.binary_a, out_a)
+        b_proc = self.spawn(sail_args, hsc_input.binary_b, out_b)
+
+        (a_stdout, b_stdout) = self.communicate([ a_proc, b_proc ])
         # timer.cancel()
         
         # if stop[0] == proc_state.ERR_HSC_TIMEOUT:
         #     stop[0] = proc_state.NORMAL
         #     return proc_state.ERR_HSC_TIMEOUT
         # el
-        if a_ret.returncode != 0:
+        if a_proc.returncode != 0:
             return proc_state.ERR_HSC_ASSERT
-        if find_exception(a_ret.stdout.decode()): # if the program steps into an exception handler trap
+        if find_exception(a_stdout.decode()): # if the program steps into an exception handler trap
             return proc_state.ERR_RV_EXC
 
-        args_b = sail_args + [ hsc_input.binary_b, '-o', self.out_b]
-        # timer = Timer(HSC_TIME_LIMIT, self.timeout, [stop])
-        # timer.start()
-        b_ret = subprocess.run(args_b, stdout=subprocess.PIPE)
-        # timer.cancel()
-
-        # if stop[0] == proc_state.ERR_HSC_TIMEOUT:
-        #     stop[0] = proc_state.NORMAL
-        #     return proc_state.ERR_HSC_TIMEOUT
-        # el
-        if b_ret.returncode != 0:
+        if b_proc.returncode != 0:
             return proc_state.ERR_HSC_ASSERT
-        if find_exception(b_ret.stdout.decode()): # if the program steps into an exception handler trap
+        if find_exception(b_stdout.decode()): # if the program steps into an exception handler trap
             return proc_state.ERR_RV_EXC
 
-        if filecmp.cmp(self.out_a, self.out_b, shallow=False):
+        if filecmp.cmp(out_a, out_b, shallow=False):
             return proc_state.NORMAL
         else:
             return proc_state.ERR_CONTR_DIST
+
+    def batch_outfiles(self, n):
+        (root_a, ext_a) = os.path.splitext(self.out_a)
+        (root_b, ext_b) = os.path.splitext(self.out_b)
+
+        return (root_a + '_{}'.format(n) + ext_a, root_b + '_{}'.format(n) + ext_b)
+
+    def run_batch(self, hsc_inputs: list, stop, workers=None):
+        """ Contract-checks many hscInputs on a pool of workers
+        Every input gets its own pair of trace files, results are returned in
+        input order with the same codes as run_test.
+        """
+        if not hsc_inputs:
+            return []
+
+        if not workers:
+            workers = len(hsc_inputs)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [ executor.submit(self.run_test, hsc_input, stop, self.batch_outfiles(n))
+                        for (n, hsc_input) in enumerate(hsc_inputs) ]
+
+            return [ f.result() for f in futures ]
@@ -9,7 +9,12 @@ parser = envParser()
 
 parser.add_option('toplevel', None, 'Toplevel module of DUT')
 parser.add_option('input', None, 'SimInput to simulate')
+parser.add_option('server', None, 'Unix socket to receive SimInputs from')
 parser.add_option('debug', 0, 'Debugging?')
+parser.add_option('cov_hash', 'shake', 'Coverage hash: shake/xxhash/crc/fold')
+parser.add_option('hdl_monitor', 0, 'Sample coverage and PCs in the design (hsc_monitor)?')
+parser.add_option('dispatch', 0, 'Service all TileLink channels from one coroutine?')
+parser.add_option('seed', -1, 'Seed of the TileLink arbitration (-1: unseeded)')
 
 parser.print_help()
 parser.parse_option()
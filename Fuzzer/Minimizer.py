@@ -1,19 +1,182 @@
 import os
-import math
-from copy import deepcopy
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import rng
 
 from RTLSim.host import NO_LEAK, TIME_OUT, LEAK
 from src.word import PREFIX, MAIN, SUFFIX
 
 from src.utils import *
 from src.multicore_manager import proc_state
+from src.result_cache import resultCache
+
+from Config import ROCKET_CONF, BOOM_CONF, RESULT_CACHE_SIZE
+
+""" Leak minimizer
+Delta debugging (ddmin) over the words of every part: each round splits the
+words which are not nop yet into n chunks and tests all "nop this chunk"
+candidates at once, preprocessing them one after another, contract-checking
+them with hscHost.run_batch and simulating them on a process pool. The
+leaking candidate with the most nops wins the round, candidates with fewer
+nops which did not start yet are cancelled as soon as it is known. Without a
+leaking candidate the granularity doubles until chunks are single words.
+
+Verdicts are kept in a resultCache keyed by the program contents and the
+adapter seed, as every leak is simulated under its own seed. Masks which
+lead to an already tested program (e.g. nops on nops) are not checked or
+simulated again.
+"""
+
+HSC_FAIL = [ proc_state.ERR_COMPILE, proc_state.ERR_HSC_TIMEOUT, proc_state.ERR_CONTR_DIST,
+             proc_state.ERR_RV_EXC, proc_state.ERR_HSC_ASSERT ]
+
+class ddMinimizer():
+    def __init__(self, mutator, preprocessor, hscHost, sim_conf, executor, workers,
+                 adapter_seed, persistent=False, debug=False):
+        self.mutator = mutator
+        self.preprocessor = preprocessor
+        self.hscHost = hscHost
+        (self.toplevel, self.bin_dir, self.v_file) = sim_conf
+        self.executor = executor
+        self.workers = workers
+        self.adapter_seed = adapter_seed
+        self.persistent = persistent
+        self.debug = debug
+
+        self.cache = resultCache(RESULT_CACHE_SIZE)
+        self.id = 0
+        self.tests = 0
+
+    def next_id(self):
+        self.id += 1
+        return self.id
+
+    def key(self, sim_input, data):
+        """ Cache key, the RTL verdict also depends on the adapter seed """
+        return (sim_input.content_hash(data), self.adapter_seed)
+
+    def test(self, candidates, assert_intr):
+        """ Returns the leaking (num_nop, mask, sim_input, data) candidate
+        with the most nops, None if no candidate leaks
+        """
+        best = None
+        pending = []
+        for cand in sorted(candidates, key=lambda cand: cand[0], reverse=True):
+            key = self.key(cand[2], cand[3])
+            entry = self.cache.lookup(key)
+            if entry is None or (entry.rtl is None and entry.hsc not in HSC_FAIL):
+                pending.append((key, cand))
+                continue
+
+            if entry.rtl == LEAK and (best is None or cand[0] > best[0]):
+                best = cand
+
+        if best:
+            pending = [ (key, cand) for (key, cand) in pending if cand[0] > best[0] ]
+
+        stop = [ proc_state.NORMAL ]
+        checked = []
+        for (key, cand) in pending:
+            (num_nop, mask, tmp_input, (data_a, data_b)) = cand
+            if self.debug:
+                print('[Minimizer] Candidate ({} nops)'.format(num_nop))
+                for inst in tmp_input.get_insts():
+                    print(inst)
+
+            (hsc_input, rtl_input, symbols) = self.preprocessor.process(tmp_input, data_a, data_b,
+                                                                        assert_intr, id=self.next_id())
+            if hsc_input and rtl_input:
+                checked.append((key, cand, hsc_input, rtl_input))
+            else:
+                self.cache.put_hsc(key, proc_state.ERR_COMPILE)
+
+        rets = self.hscHost.run_batch([ hsc_input for (_, _, hsc_input, _) in checked ], stop, self.workers)
+
+        futures = {}
+        for ((key, cand, hsc_input, rtl_input), ret) in zip(checked, rets):
+            self.cache.put_hsc(key, ret)
+            if ret in HSC_FAIL:
+                # nops can change the control flow, this does not help minimization
+                debug_print('[Minimizer] candidate fails contract check ({})'.format(proc_state.tpe[ret]), self.debug)
+                cleanup(rtl_input)
+                continue
 
-from Config import ROCKET_CONF, BOOM_CONF
+            f = self.executor.submit(run_rtl_test, self.bin_dir, self.v_file, self.toplevel, rtl_input,
+                                     self.next_id(), None, self.persistent, self.adapter_seed, False)
+            futures[f] = (key, cand, rtl_input)
+
+        while futures:
+            (done, _) = wait(futures, return_when=FIRST_COMPLETED)
+            for f in done:
+                (key, cand, _) = futures.pop(f)
+                self.tests += 1
+
+                (ret, cov_map, _, _, _) = f.result()
+                if ret != ERROR:
+                    self.cache.put_rtl(key, ret, cov_map)
+                if ret == LEAK and (best is None or cand[0] > best[0]):
+                    best = cand
+
+            if best:
+                # candidates with fewer nops can not win this round anymore
+                for f in [ f for f in futures if futures[f][1][0] <= best[0] and f.cancel() ]:
+                    cleanup(futures.pop(f)[2])
+
+        return best
+
+    def minimize_part(self, sim_input, part, assert_intr):
+        if part == PREFIX:
+            len_mask = sim_input.num_prefix
+        elif part == MAIN:
+            len_mask = sim_input.num_words
+        else: # SUFFIX
+            len_mask = sim_input.num_suffix
+
+        min_input = sim_input
+        min_mask = [ 0 for i in range(len_mask) ]
+
+        n = 2
+        while True:
+            active = [ k for k in range(len_mask) if not min_mask[k] ]
+            if not active:
+                break
+
+            n = min(n, len(active))
+            candidates = []
+            for j in range(n):
+                tmp_mask = min_mask.copy()
+                for k in active[j * len(active) // n:(j + 1) * len(active) // n]:
+                    tmp_mask[k] = 1
+
+                (tmp_input, data) = self.mutator.make_nop(sim_input, tmp_mask, part)
+                candidates.append((sum(tmp_mask), tmp_mask, tmp_input, data))
+
+            best = self.test(candidates, assert_intr)
+            if best:
+                (_, min_mask, min_input, _) = best
+                n = max(n - 1, 2)
+            elif n == len(active):
+                break
+            else:
+                n = min(2 * n, len(active))
+
+        return min_input
+
+    def minimize(self, sim_input, assert_intr):
+        min_input = sim_input
+        for part in [ PREFIX, MAIN, SUFFIX ]:
+            min_input = self.minimize_part(min_input, part, assert_intr)
+
+        (del_input, data) = self.mutator.delete_nop(min_input)
+        num_words = del_input.num_prefix + del_input.num_words + del_input.num_suffix
+        if self.test([ (-num_words, None, del_input, data) ], assert_intr):
+            min_input = del_input
+
+        return min_input
 
 def Minimize(target,
-             template='Template', out='output', num_cores=1, proc_num=0,
-             debug=False, contract='ct', isa='RV64I'):
-    
+             template='Template', out='output', num_cores=0, proc_num=0,
+             debug=False, contract='ct', isa='RV64I', seed=None, persistent=False):
+
     assert target in ['Rocket', 'Boom' ], \
         '{} is not toplevel'.format(target)
     proc_num = 0
@@ -23,9 +186,18 @@ def Minimize(target,
     else:
         toplevel, bin_dir, v_file, cov_len = BOOM_CONF
 
+    adapter_seed = rng.derive_seed(rng.seed(seed), 'adapter')
+
     (mutator, preprocessor, hscHost) = \
         setupHSC(template, out, proc_num, debug, contract, isa)
 
+    if num_cores == 0:
+        num_cores = os.cpu_count()
+    executor = ProcessPoolExecutor(max_workers=num_cores)
+
+    minimizer = ddMinimizer(mutator, preprocessor, hscHost, (toplevel, bin_dir, v_file), executor,
+                            num_cores, adapter_seed, persistent, debug)
+
     in_dir = out + '/leaks/sim_input'
     stop = [ proc_state.NORMAL ]
 
@@ -36,12 +208,17 @@ def Minimize(target,
     print('[HSCFuzz] Start Minimizing {}'.format(out))
 
     siNames = list(filter(lambda x: '.si' == x[-3:], [f for f in os.listdir(in_dir) if os.path.isfile(os.path.join(in_dir, f))]))
-    start = proc_num * ((len(siNames) // num_cores) + 1)
-    end = (proc_num + 1) * ((len(siNames) // num_cores) + 1)
-    for siName in siNames[start:end]:
+    for siName in siNames:
         print('[HSCFuzz] Minimizing {}'.format(siName))
 
         minName = min_dir + '/' + siName.split('.si')[0] + '_min.si'
+
+        # without -s every leak is simulated under the seed it was found with
+        leak_seed = load_seed(in_dir + '/' + siName)
+        if seed is None and leak_seed is not None:
+            minimizer.adapter_seed = leak_seed
+        else:
+            minimizer.adapter_seed = adapter_seed
         (sim_input, (data_a, data_b), assert_intr) = mutator.read_siminput(in_dir + '/' + siName)
 
         if debug:
@@ -49,100 +226,35 @@ def Minimize(target,
             for inst, INT in zip(sim_input.get_insts(), sim_input.ints + [0]):
                 print('{:<50}{:04b}'.format(inst, INT))
 
-        (hsc_input, rtl_input, symbols) = preprocessor.process(sim_input, data_a, data_b, assert_intr)
+        (hsc_input, rtl_input, symbols) = preprocessor.process(sim_input, data_a, data_b, assert_intr,
+                                                               id=minimizer.next_id())
 
         ret = hscHost.run_test(hsc_input, stop)
 
         if ret == proc_state.ERR_CONTR_DIST:
             print('[Minimizer] {} contr dist'.format(siName))
+            cleanup(rtl_input)
             continue
 
-        (ret, coverage, _, _) = run_rtl_test(bin_dir, v_file, toplevel, rtl_input, 0, None)
-        
+        (ret, coverage, _, _, _) = run_rtl_test(bin_dir, v_file, toplevel, rtl_input, minimizer.next_id(), None,
+                                                persistent, minimizer.adapter_seed, False)
+
         if ret != LEAK:
             print('[Minimizer] {} leak not reproducible'.format(siName))
             continue
 
-        min_input = deepcopy(sim_input)
-
-        for part in [ PREFIX, MAIN, SUFFIX ]:
-            if part == PREFIX:
-                len_mask = min_input.num_prefix
-            elif part == MAIN:
-                len_mask = min_input.num_words
-            else: # SUFFIX
-                len_mask = min_input.num_suffix
-
-            if len_mask == 0:
-                continue
-
-            nop_mask = [ 0 for i in range(len_mask) ]
-            min_mask = deepcopy(nop_mask)
-
-            for i in range(int(math.log(len_mask, 2))):
-                num_nop = len_mask // min(pow(2, i+1), len_mask)
-                num_test = len_mask // num_nop
-                rest = num_nop + (len_mask % num_nop)
-
-                delete_nop = 1 if part == SUFFIX and (i == int(math.log(len_mask, 2)) - 1) else 0
-                for j in range(num_test + delete_nop):
-
-                    if j < num_test:
-                        tmp_mask = []
-                        tmp_mask += [ 0 for k in range(num_nop * j) ]
-
-                        if j != num_test - 1:
-                            tmp_mask += [ 1 for k in range(num_nop) ]
-                            tmp_mask += [ 0 for k in range(len_mask - num_nop * (j + 1)) ]
-                        else:
-                            tmp_mask += [ 1 for k in range(rest) ]
-
-                        for (n, tup) in enumerate(zip(tmp_mask, min_mask)):
-                            tmp_mask[n] = tup[0] | tup[1]
-
-                        if tmp_mask == min_mask:
-                            continue
-
-                        (tmp_input, (data_a, data_b)) = mutator.make_nop(min_input, tmp_mask, part)
-
-                    else:
-                        (tmp_input, (data_a, data_b)) = mutator.delete_nop(min_input)
-
-                    if debug:
-                        print('[HSCFuzz] Minimized Instructions')
-                        for inst in tmp_input.get_insts():
-                            print(inst)
-
-                    (isa_input, rtl_input, symbols) = preprocessor.process(tmp_input, data_a, data_b, assert_intr)
-
-                    if isa_input and rtl_input:
-                        ret = hscHost.run_test(isa_input, stop)
-                        if ret == proc_state.ERR_HSC_TIMEOUT: continue # this should not happen as execution time with no-ops should be lower
-                        if ret == proc_state.ERR_CONTR_DIST:
-                            print('[Minimizer] {} minimize leads to contr dist'.format(siName))
-                            continue # this can happen as e.g. control flow can change, however in this case does not help with minimization
-                        if ret == proc_state.ERR_HSC_ASSERT: # this should not happen as replacing a command with no-ops should not lead to faults
-                            print('[Minimizer] {} minimize leads to Sail non-zero exit'.format(siName))
-                            break
-
-                        (ret, coverage, _, _) = run_rtl_test(bin_dir, v_file, toplevel, rtl_input, 0, None)
+        minimizer.cache.put_rtl(minimizer.key(sim_input, (data_a, data_b)), ret, coverage)
 
-                        # GG not handling interrupt at the moment
-                        # if assert_intr and ret == NO_LEAK:
-                        #     (intr_prv, epc) = checker.check_intr(isa_input, rtl_input, epc)
-                        #     if epc != 0:
-                        #         ret = hscHost.run_test(isa_input, stop)
-                        #         if ret == proc_state.ERR_ISA_TIMEOUT: continue
-                        #     else: continue
+        min_input = minimizer.minimize(sim_input, assert_intr)
+        min_input.save(minName, (data_a, data_b))
+        save_seed(minName, minimizer.adapter_seed)
 
-                        if ret == LEAK:
-                            min_input = tmp_input
-                            min_mask = tmp_mask
+        print('[Minimizer] {}: {} -> {} main words ({} simulations)'.format(
+            siName, sim_input.num_words, len([ word for word in min_input.words if word.insts != ['nop'] ]),
+            minimizer.tests))
 
-                    else:
-                        stop[0] = proc_state.ERR_COMPILE
-                        break
+    print('[Minimizer] Result cache: {}'.format(minimizer.cache.stats()))
 
-                min_input.save(minName, (data_a, data_b))
+    executor.shutdown(wait=True)
 
     debug_print('[HSCFuzz] Stop Minimizing', debug)
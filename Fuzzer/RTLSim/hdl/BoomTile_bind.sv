@@ -0,0 +1,10 @@
+// HSC monitor of the BoomTile, signals as in infos/BoomTile_info.txt
+bind BoomTile hsc_monitor #(.COV_LEN(18808)) hsc_monitor (
+  .clock(clock),
+  .reset(reset),
+  .cov(cov_BoomTile),
+  .pc_a(core.rob_a_io_commit_uops_0_debug_pc),
+  .pc_b(core.rob_b_io_commit_uops_0_debug_pc),
+  .valid_a(core.rob_a_io_commit_valids_0),
+  .valid_b(core.rob_a_io_commit_valids_0)
+);
@@ -0,0 +1,10 @@
+// HSC monitor of the RocketTile, signals as in infos/RocketTile_info.txt
+bind RocketTile hsc_monitor #(.COV_LEN(1730)) hsc_monitor (
+  .clock(clock),
+  .reset(reset),
+  .cov(cov_RocketTile),
+  .pc_a(core.a_wb_reg_pc),
+  .pc_b(core.b_wb_reg_pc),
+  .valid_a(core.a_wb_reg_valid),
+  .valid_b(core.b_wb_reg_valid)
+);
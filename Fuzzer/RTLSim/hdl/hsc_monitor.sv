@@ -0,0 +1,88 @@
+/*
+ * HSC monitor
+ * Samples the coverage output and the committed PCs of both tiles inside the
+ * simulation, so the RTL host does not have to read them every cycle.
+ *  - coverage: the coverage vector is xor-folded in halves down to IDX_BITS
+ *    (the 'fold' coverage hash of RTLSim/host.py) and the AFL-style edge
+ *    idx ^ (last_idx >> 1) is appended to the hit log
+ *  - leak: sticky, set on the first PC validity or PC value difference
+ * Everything is cleared while reset is high.
+ */
+module hsc_monitor #(
+  parameter COV_LEN = 1730,
+  parameter PC_LEN = 40,
+  parameter IDX_BITS = 24,
+  parameter MAX_HITS = 262144
+) (
+  input                clock,
+  input                reset,
+  input  [COV_LEN-1:0] cov,
+  input  [PC_LEN-1:0]  pc_a,
+  input  [PC_LEN-1:0]  pc_b,
+  input                valid_a,
+  input                valid_b
+);
+
+  function automatic integer fold_width(input integer width);
+    fold_width = (width + 1) / 2 > IDX_BITS ? (width + 1) / 2 : IDX_BITS;
+  endfunction
+
+  function automatic integer stage_width(input integer stage);
+    integer i;
+    begin
+      stage_width = COV_LEN;
+      for (i = 0; i < stage; i = i + 1)
+        stage_width = fold_width(stage_width);
+    end
+  endfunction
+
+  function automatic integer num_stages(input integer width);
+    begin
+      num_stages = 0;
+      while (width > IDX_BITS) begin
+        width = fold_width(width);
+        num_stages = num_stages + 1;
+      end
+    end
+  endfunction
+
+  localparam STAGES = num_stages(COV_LEN);
+
+  wire [COV_LEN-1:0] fold [0:STAGES];
+  assign fold[0] = cov;
+
+  genvar k;
+  generate
+    for (k = 0; k < STAGES; k = k + 1) begin : g_fold
+      localparam HALF = stage_width(k + 1);
+      assign fold[k+1] = (fold[k] & ({COV_LEN{1'b1}} >> (COV_LEN - HALF))) ^ (fold[k] >> HALF);
+    end
+  endgenerate
+
+  wire [IDX_BITS-1:0] idx = fold[STAGES][IDX_BITS-1:0];
+
+  reg [IDX_BITS-1:0] hits [0:MAX_HITS-1];
+  reg [31:0]         hit_count;
+  reg [IDX_BITS-1:0] last_idx;
+  reg [COV_LEN-1:0]  cov_bits;
+  reg                leak;
+
+  always @(posedge clock) begin
+    if (reset) begin
+      hit_count <= 0;
+      last_idx <= 0;
+      cov_bits <= {COV_LEN{1'b1}};
+      leak <= 1'b0;
+    end else begin
+      if (hit_count < MAX_HITS)
+        hits[hit_count] <= idx ^ last_idx;
+      hit_count <= hit_count + 1;
+      last_idx <= idx >> 1;
+      cov_bits <= cov_bits & cov;
+
+      if (valid_a != valid_b || (valid_a && pc_a != pc_b))
+        leak <= 1'b1;
+    end
+  end
+
+endmodule
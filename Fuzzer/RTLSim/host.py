@@ -2,14 +2,16 @@ import sys
 import cocotb
 
 from cocotb.decorators import coroutine
-from cocotb.triggers import Timer, RisingEdge
-from bitarray import bitarray
+from cocotb.triggers import Timer, RisingEdge, ClockCycles
 from hashlib import shake_128
 import hashlib
+import zlib
 import xxhash
 from itertools import repeat
 from reader.tile_reader import tileSrcReader
+from cov_utils import to_cov
 from adapters.tile_adapter import tileAdapter
+from adapters.memory import rtlMemory
 
 NO_LEAK = 0
 LEAK = 1
@@ -21,6 +23,44 @@ DRAM_BASE = 0x80000000
 ROCKET_COV_LEN = 1730
 BOOM_COV_LEN = 18808
 
+PROBE_CYCLES = 100
+
+COV_IDX_BITS = 24 # UP
+COV_IDX_MASK = (1 << COV_IDX_BITS) - 1
+
+def shake_hash(width):
+    """ Original coverage hash, keeps coverage numbers comparable to older campaigns """
+    return lambda buff: int.from_bytes(shake_128(buff).digest(COV_IDX_BITS // 8), byteorder='big')
+
+def xxhash_hash(width):
+    return lambda buff: xxhash.xxh3_64_intdigest(buff) & COV_IDX_MASK
+
+def crc_hash(width):
+    return lambda buff: zlib.crc32(buff) & COV_IDX_MASK
+
+def fold_hash(width):
+    """ Xor-folds the coverage vector in halves down to COV_IDX_BITS,
+    the shifts and masks of every step are computed once per width
+    """
+    steps = []
+    while width > COV_IDX_BITS:
+        half = max((width + 1) // 2, COV_IDX_BITS)
+        steps.append((half, (1 << half) - 1))
+        width = half
+
+    def fold(buff):
+        val = int.from_bytes(buff, byteorder='big')
+        for (shift, mask) in steps:
+            val = (val & mask) ^ (val >> shift)
+        return val
+
+    return fold
+
+COV_HASHES = { 'shake': shake_hash,
+               'xxhash': xxhash_hash,
+               'crc': crc_hash,
+               'fold': fold_hash }
+
 class rtlInput(): #GG now with two data sections
     def __init__(self, hexfile, intrfile, data_a, data_b, symbols, max_cycles):
         self.hexfile = hexfile
@@ -31,7 +71,8 @@ class rtlInput(): #GG now with two data sections
         self.max_cycles = max_cycles
 
 class rvRTLhost():
-    def __init__(self, dut, toplevel, rtl_sig_file, debug=False):
+    def __init__(self, dut, toplevel, rtl_sig_file, debug=False, cov_hash='shake', hdl_monitor=False,
+                 dispatch=False):
         source_info = 'infos/' + toplevel + '_info.txt'
         reader = tileSrcReader(source_info)
 
@@ -56,16 +97,26 @@ class rvRTLhost():
         self.cov_output = getattr(dut, "cov_" + toplevel)
 
         self.dut = dut
-        self.adapter = tileAdapter(dut, port_names, monitor, self.debug)
+        self.adapter = tileAdapter(dut, port_names, monitor, self.debug, dispatch)
 
-        self.coverage_map = bitarray(repeat(0,2 ** 24)) #UP
+        self.coverage_map = set()
         self.last_idx = 0
         self.coverage_bits = -1
 
         if toplevel == "RocketTile":
-            self.cov_reset_val = int('1' * ROCKET_COV_LEN, 2)
+            cov_len = ROCKET_COV_LEN
         else:
-            self.cov_reset_val = int('1' * BOOM_COV_LEN, 2)
+            cov_len = BOOM_COV_LEN
+        self.cov_reset_val = int('1' * cov_len, 2)
+
+        assert cov_hash in COV_HASHES, '{} is not a coverage hash'.format(cov_hash)
+        self.cov_hash = COV_HASHES[cov_hash](cov_len)
+
+        # hsc_monitor (RTLSim/hdl) bound into the toplevel samples coverage
+        # and PCs, coverage then always uses the fold hash
+        self.monitor = None
+        if hdl_monitor:
+            self.monitor = getattr(dut, 'hsc_monitor')
 
     def debug_print(self, message):
         if self.debug:
@@ -73,7 +124,7 @@ class rvRTLhost():
 
     def set_bootrom(self):
         bootrom_addrs = []
-        memory = {}
+        memory = rtlMemory()
         bootrom = [ 0x00000297, # auipc t0, 0x0
                     0x02028593, # addi a1, t0, 32
                     0xf1402573, # csrr a0, mhartid
@@ -122,13 +173,13 @@ class rvRTLhost():
         reset.value = 0
     
     def cov_gen(self):
-        idx = int.from_bytes(shake_128(self.cov_output.value.buff).digest(3), byteorder='big')
+        idx = self.cov_hash(self.cov_output.value.buff)
 
 
         # comment in to debug coverage
         #self.debug_print('idx: {}'.format(idx ^ self.last_idx))
         
-        self.coverage_map[idx ^ self.last_idx] = 1
+        self.coverage_map.add(idx ^ self.last_idx)
         self.last_idx = idx >> 1
 
         if self.coverage_bits != -1:
@@ -147,6 +198,30 @@ class rvRTLhost():
             return False
         return True
 
+    def read_monitor(self):
+        """ Reads leak, coverage and coverage bits of the test from hsc_monitor """
+        hit_count = int(self.monitor.hit_count.value)
+        max_hits = len(self.monitor.hits)
+        if hit_count > max_hits:
+            self.debug_print('[RTLHost] hsc_monitor dropped {} hits'.format(hit_count - max_hits))
+
+        hits = self.monitor.hits
+        self.coverage_map = set([ int(hits[i].value) for i in range(min(hit_count, max_hits)) ])
+        self.coverage_bits = self.monitor.cov_bits.value
+
+        return bool(self.monitor.leak.value)
+
+    def read_tohost(self, memory_a, memory_b, tohost_addr):
+        tohost_a = memory_a[tohost_addr]
+        tohost_b = memory_b[tohost_addr] 
+        if tohost_a: # or tohost_b: # one core terminated TODO either wait for other to finish, maybe get and ouput pc from other one
+            self.debug_print('a done')
+        elif tohost_b:
+            self.debug_print('b done')
+        else:
+            self.adapter.probe_tohost(tohost_addr)
+        return (tohost_a, tohost_b)
+
     def save_signature(self, memory, sig_start, sig_end, data_addrs, sig_file):
         fd = open(sig_file, 'w')
         for i in range(sig_start, sig_end, 16):
@@ -163,14 +238,14 @@ class rvRTLhost():
     def get_covsum(self):
         #cov_mask = (1 << len(self.cov_output)) - 1
         #print("ATTENTION {}".format(self.cov_output.value))
-        return (self.coverage_bits, self.coverage_map)
+        return (self.coverage_bits, to_cov(self.coverage_map))
 
     @coroutine
     def run_test(self, rtl_input: rtlInput, assert_intr: bool):
 
         self.debug_print('[RTLHost] Start RTL simulation')
 
-        self.coverage_map = bitarray(repeat(0,2 ** 24)) # UP
+        self.coverage_map = set()
         self.last_idx = 0
         self.coverage_bits = -1
 
@@ -185,8 +260,8 @@ class rvRTLhost():
         _end = symbols['_end_main']
 
         (bootrom_addrs, memory) = self.set_bootrom()
-        for (i, addr) in enumerate(range(_start, _end + 36, 8)):
-            memory[addr] = int(lines[i], 16)
+        num_words = len(range(_start, _end + 36, 8))
+        memory.write_block(_start, [ int(line, 16) for line in lines[:num_words] ])
 
         tohost_addr = symbols['tohost']
         sig_start = symbols['begin_signature']
@@ -197,7 +272,7 @@ class rvRTLhost():
             memory[addr] = 0
 
         memory_a = memory
-        memory_b = memory.copy()
+        memory_b = memory.fork()
 
         data_a = rtl_input.data_a #GG now handling two different data sections
         data_b = rtl_input.data_b
@@ -208,11 +283,9 @@ class rvRTLhost():
             data_end = symbols['_end_data{}'.format(n)]
             data_addrs.append((data_start, data_end))
 
-            for i, addr in enumerate(range(data_start // 8 * 8, data_end // 8 * 8, 8)):
-                word = data_a[i + offset]
-                memory_a[addr] = word
-                word = data_b[i + offset]
-                memory_b[addr] = word
+            num_words = len(range(data_start // 8 * 8, data_end // 8 * 8, 8))
+            memory_a.write_block(data_start // 8 * 8, data_a[offset:offset + num_words])
+            memory_b.write_block(data_start // 8 * 8, data_b[offset:offset + num_words])
 
             offset += (data_end - data_start) // 8
 
@@ -235,23 +308,27 @@ class rvRTLhost():
 
         leak = False
 
+        tohost_a = tohost_b = 0
+
         self.adapter.start(memory_a, memory_b, ints)
-        for i in range(max_cycles):
-            yield clkedge
-            self.cov_gen()
-            pc_equal = self.check_pc_eq()
-            leak = leak or not pc_equal
-            if i % 100 == 0:
-                tohost_a = memory_a[tohost_addr]
-                tohost_b = memory_b[tohost_addr] 
-                if tohost_a: # or tohost_b: # one core terminated TODO either wait for other to finish, maybe get and ouput pc from other one
-                    self.debug_print('a done')
+        if self.monitor:
+            # only wake up to probe tohost, sampling happens in the design
+            for i in range(0, max_cycles, PROBE_CYCLES):
+                yield ClockCycles(clk, min(PROBE_CYCLES, max_cycles - i))
+                (tohost_a, tohost_b) = self.read_tohost(memory_a, memory_b, tohost_addr)
+                if tohost_a or tohost_b:
                     break
-                elif tohost_b:
-                    self.debug_print('b done')
-                    break
-                else:
-                    self.adapter.probe_tohost(tohost_addr)
+            leak = self.read_monitor()
+        else:
+            for i in range(max_cycles):
+                yield clkedge
+                self.cov_gen()
+                pc_equal = self.check_pc_eq()
+                leak = leak or not pc_equal
+                if i % PROBE_CYCLES == 0:
+                    (tohost_a, tohost_b) = self.read_tohost(memory_a, memory_b, tohost_addr)
+                    if tohost_a or tohost_b:
+                        break
 
         yield self.adapter.stop()
         clk_driver.kill()
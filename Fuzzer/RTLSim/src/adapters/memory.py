@@ -0,0 +1,139 @@
+from array import array
+
+""" DUT memory
+Word (64 bit) addressed memory of one tile, replacing the address -> word
+dict. Aligned words live in lazily allocated pages of PAGE_WORDS words,
+unaligned addresses fall back to a sparse overlay. A fork shares all pages
+with its parent and each side copies a page on its first write to it, so
+memory_b only holds the pages where it differs from memory_a.
+
+Like the dict it replaces, reading a word which was never written raises
+KeyError, get() and read_block() do not.
+"""
+
+WORD_BYTES = 8
+WORD_MASK = (1 << 64) - 1
+
+PAGE_BITS = 12
+PAGE_WORDS = (1 << PAGE_BITS) // WORD_BYTES
+
+class rtlMemory():
+    __slots__ = ('pages', 'shared', 'overlay')
+
+    def __init__(self):
+        self.pages = {} # page number -> (words, valid)
+        self.shared = set() # pages also referenced by a fork
+        self.overlay = {}
+
+    def locate(self, addr):
+        idx = addr >> 3
+        return (idx // PAGE_WORDS, idx % PAGE_WORDS)
+
+    def writable_page(self, page_num):
+        page = self.pages.get(page_num)
+        if page is None:
+            page = (array('Q', bytes(PAGE_WORDS * WORD_BYTES)), bytearray(PAGE_WORDS))
+            self.pages[page_num] = page
+        elif page_num in self.shared:
+            page = (array('Q', page[0]), bytearray(page[1]))
+            self.pages[page_num] = page
+            self.shared.discard(page_num)
+        return page
+
+    def __getitem__(self, addr):
+        if addr & (WORD_BYTES - 1):
+            return self.overlay[addr]
+
+        (page_num, offset) = self.locate(addr)
+        page = self.pages.get(page_num)
+        if page is None or not page[1][offset]:
+            raise KeyError(addr)
+        return page[0][offset]
+
+    def __setitem__(self, addr, word):
+        if addr & (WORD_BYTES - 1):
+            self.overlay[addr] = word
+            return
+
+        (page_num, offset) = self.locate(addr)
+        (words, valid) = self.writable_page(page_num)
+        words[offset] = word & WORD_MASK
+        valid[offset] = 1
+
+    def __contains__(self, addr):
+        if addr & (WORD_BYTES - 1):
+            return addr in self.overlay
+
+        (page_num, offset) = self.locate(addr)
+        page = self.pages.get(page_num)
+        return page is not None and page[1][offset] == 1
+
+    def get(self, addr, default=None):
+        try:
+            return self[addr]
+        except KeyError:
+            return default
+
+    def keys(self):
+        for page_num in sorted(self.pages):
+            valid = self.pages[page_num][1]
+            base = page_num * PAGE_WORDS * WORD_BYTES
+            for offset in range(PAGE_WORDS):
+                if valid[offset]:
+                    yield base + offset * WORD_BYTES
+        yield from self.overlay.keys()
+
+    def blocks(self, block_mask):
+        """ Addresses of all blocks holding at least one word """
+        return set([ addr & block_mask for addr in self.keys() ])
+
+    def read_block(self, addr, num, fill=0):
+        """ Reads num consecutive words from addr, words never written
+        are set to fill (as the adapter did with nop_data)
+        """
+        if addr & (WORD_BYTES - 1):
+            return [ self.overlay.setdefault(addr + i * WORD_BYTES, fill) for i in range(num) ]
+
+        (page_num, offset) = self.locate(addr)
+        page = self.pages.get(page_num)
+        if page is not None and offset + num <= PAGE_WORDS and all(page[1][offset:offset + num]):
+            return page[0][offset:offset + num].tolist()
+
+        words = []
+        for i in range(num):
+            get_addr = addr + i * WORD_BYTES
+            if get_addr not in self:
+                self[get_addr] = fill
+            words.append(self[get_addr])
+        return words
+
+    def write_block(self, addr, words):
+        if addr & (WORD_BYTES - 1) or self.locate(addr)[1] + len(words) > PAGE_WORDS:
+            for (i, word) in enumerate(words):
+                self[addr + i * WORD_BYTES] = word
+            return
+
+        (page_num, offset) = self.locate(addr)
+        (page_words, valid) = self.writable_page(page_num)
+        if not isinstance(words, array) or words.typecode != 'Q':
+            words = array('Q', [ word & WORD_MASK for word in words ])
+        page_words[offset:offset + len(words)] = words
+        valid[offset:offset + len(words)] = b'\x01' * len(words)
+
+    def write_masked(self, addr, data, bit_mask):
+        """ Replaces the bits of bit_mask in the word at addr with data """
+        self[addr] = (self.get(addr, 0) & ~bit_mask) | (data & bit_mask)
+
+    def fork(self):
+        """ Copy-on-write copy, pages are shared until either side writes to them """
+        memory = rtlMemory()
+        memory.pages = self.pages.copy()
+        memory.overlay = self.overlay.copy()
+
+        self.shared.update(self.pages)
+        memory.shared = set(self.pages)
+
+        return memory
+
+    def copy(self):
+        return self.fork()
@@ -6,6 +6,7 @@ from cocotb.triggers import RisingEdge
 
 from adapters.tilelink.adapter import tlAdapter
 from adapters.tilelink.definitions import *
+from adapters.memory import rtlMemory
 
 INT_MEIP = 0x4
 INT_SEIP = 0x8
@@ -20,10 +21,11 @@ class intPorts():
             setattr(self, attr, None)
 
 class tileAdapter(): #adapt to new instrumented dut structure with two tiles
-    def __init__(self, dut, port_names, monitor, debug=False):
+    def __init__(self, dut, port_names, monitor, debug=False, dispatch=False):
         self.dut = dut
         self.debug = debug
         self.drive = False
+        self.dispatch = dispatch
 
 
         #sort ports by "a_"/"b_" beforehand
@@ -51,8 +53,8 @@ class tileAdapter(): #adapt to new instrumented dut structure with two tiles
                 protocol = TL_C
 
         #create two adapters for each copy of the instrumented dut
-        self.tl_adapter_a = tlAdapter(dut, tl_port_names_a, protocol, 64, debug)
-        self.tl_adapter_b = tlAdapter(dut, tl_port_names_b, protocol, 64, debug)
+        self.tl_adapter_a = tlAdapter(dut, tl_port_names_a, protocol, 64, debug, dispatch)
+        self.tl_adapter_b = tlAdapter(dut, tl_port_names_b, protocol, 64, debug, dispatch)
 
         self.int_ports = intPorts()
         self.set_int_ports('a_', int_port_names_a)
@@ -142,17 +144,32 @@ class tileAdapter(): #adapt to new instrumented dut structure with two tiles
         #     yield RisingEdge(self.dut.clock)
 
 
+    @coroutine
+    def dispatcher(self):
+        """ One coroutine servicing the A, C and E channels of both tiles on every clock """
+        clkedge = RisingEdge(self.dut.clock)
+
+        running = True
+        while running:
+            running_a = self.tl_adapter_a.service_channels()
+            running_b = self.tl_adapter_b.service_channels()
+            running = running_a or running_b
+            if running:
+                yield clkedge
+
     def probe_tohost(self, tohost_addr):
         self.tl_adapter_a.probe_block(tohost_addr)
         self.tl_adapter_b.probe_block(tohost_addr)
 
     def start(self, memory_a, memory_b, ints): #two memory sections, containing both instructions and data
-        if memory_a.__class__.__name__ != 'dict' or memory_b.__class__.__name__ != 'dict':
-            raise Exception('RocketTile Adapter must receive address map to drive DUT')
+        if not isinstance(memory_a, rtlMemory) or not isinstance(memory_b, rtlMemory):
+            raise Exception('RocketTile Adapter must receive rtlMemory to drive DUT')
 
         self.drive = True
         self.tl_adapter_a.start(memory_a)
         self.tl_adapter_b.start(memory_b)
+        if self.dispatch:
+            self.channel_dispatcher = cocotb.fork(self.dispatcher())
         self.intr_handler = cocotb.fork(self.interrupt_handler(ints))
 
     @coroutine
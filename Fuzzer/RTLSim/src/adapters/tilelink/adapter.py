@@ -4,10 +4,11 @@ import math
 import random
 import queue
 from cocotb.decorators import coroutine
-from cocotb.triggers import Timer, RisingEdge
+from cocotb.triggers import Timer, RisingEdge, Event
 
 from adapters.tilelink.definitions import *
 from adapters.tilelink.utils import *
+from adapters.memory import rtlMemory
 
 """ Tilelink adapter
 , which acts as a tilelink slave 
@@ -40,11 +41,33 @@ TL-C
 
 """
 
+""" Clock order
+The polling adapter waited on every clock edge in all its coroutines, which
+then ran in fork order, the host (test and tile adapter) after them. The
+event driven coroutines keep its timing: a coroutine woken by code which ran
+later in this order did not see the wakeup before the next clock, so it
+waits for one clock edge before it acts. The dispatcher calls the channel
+handlers like the A, C and E monitors did.
+This keeps the clock in which a wakeup is acted on, not the order in which
+coroutines resume within a clock: one resumed from an event waits on the
+edge behind the others afterwards, and the dispatcher runs after
+host_interface. State shared within a cycle (ongoing_tlc, block_perm) can be
+seen in a different order than with the polling adapter.
+"""
+MONITORS = 0
+D_DRIVER = 1
+B_DRIVER = 2
+RETRIEVER = 3
+HOST_IF = 4
+HOST = 5
+
 class tlAdapter():
-    def __init__(self, dut, port_names, protocol=TL_UL, block_size=64, debug=False):
+    def __init__(self, dut, port_names, protocol=TL_UL, block_size=64, debug=False, dispatch=False):
         self.dut = dut
         self.protocol = protocol
         self.drive = False
+        self.dispatch = dispatch
+        self.channels = []
         self.stopped = True
         self.ongoing = False
 
@@ -73,6 +96,9 @@ class tlAdapter():
         if self.a_datalen != self.d_datalen:
             raise Exception('{} a_data and d_data must have same width'.format(dut.name))
 
+        (self.bit_masks, self.mask_offsets, self.mask_widths) = byte_mask_tables(self.a_datalen)
+        self.burst_lens_d = burst_len_table(self.a_ports.size_len, self.d_datalen)
+
         if self.protocol == TL_C:
             self.b_datalen = self.b_ports.data_len // 8
             self.c_datalen = self.c_ports.data_len // 8
@@ -82,6 +108,8 @@ class tlAdapter():
             if self.a_datalen != self.c_datalen:
                 raise Exception('{} a_data and d_data must have same width'.format(dut.name))
 
+            self.burst_lens_c = burst_len_table(self.c_ports.size_len, self.c_datalen)
+
         self.d_queue = tlDQueue()
         self.b_queue = tlBQueue()
 
@@ -93,6 +121,14 @@ class tlAdapter():
         self.probe_en = 1
         self.probe_addr = 0
 
+        """ Wake up host_interface and data_retriever instead of polling every clock """
+        self.probe_event = Event()
+        self.probe_waker = MONITORS
+        self.retrieve_event = Event()
+
+        """ Clock order of the code running now """
+        self.order = MONITORS
+
     def set_src_msgs(self, src_msgs, src, msgs):
         assert src not in src_msgs.keys(), \
             '{} already in src_msgs'.format(src)
@@ -109,12 +145,7 @@ class tlAdapter():
         sink = kwargs.get('sink', 0)
 
         d_msgs = []
-        for i in range(burst_len):
-            get_addr = addr_aligned + i * self.d_datalen
-            if get_addr not in memory.keys():
-                memory[get_addr] = self.nop_data
-
-            get_data = memory[get_addr]
+        for get_data in memory.read_block(addr_aligned, burst_len, self.nop_data):
             d_msgs.append(tlDMessage(message, param=param, size=size, source=source, \
                                      sink=sink, data=get_data))
 
@@ -122,16 +153,18 @@ class tlAdapter():
 
     def enableProbe(self):
         self.probe_en = 1
+        self.probe_waker = self.order
+        self.probe_event.set()
 
+    def run_as(self, order):
+        self.order = order
+        self.d_queue.order = order
+        self.b_queue.order = order
 
-    def updateMem(self, memory, burst_data):
-        for addr, value in burst_data:
-            bit_mask = value[0]
-            data = value[1]
-
-            memory[addr] = (memory.get(get_addr, 0) & (~bit_mask)) | (get_data & bit_mask)
 
-        memory.update(burst_data)
+    def updateMem(self, memory, burst_data):
+        for addr, (bit_mask, data) in burst_data.items():
+            memory.write_masked(addr, data, bit_mask)
 
     def updatePerm(self, block_perm, block_addr, param):
         if param == toT:
@@ -168,24 +201,24 @@ class tlAdapter():
 
         self.d_queue.push_msgs(d_msgs)
 
-    def ArithmeticAck_cb(self, operand1, memory, burst_len, addr_aligned, bit_mask, offset, size, source):
+    def ArithmeticAck_cb(self, param, operand1, memory, burst_len, addr_aligned, mask, bit_mask, offset, size, source):
         operand2 = (memory[addr_aligned] & bit_mask) >> offset
         result = (self._arithmetic_op(param, operand1, operand2, mask) << offset) & \
             self.a_ports.data_mask
 
         assert burst_len == 1, 'ArithmeticAck_cb, burst_len should be 1'
 
-        memory[addr_aligned] = (memory.get(addr_aligned, 0) & (~bit_mask)) | (result & bit_mask)
+        memory.write_masked(addr_aligned, result, bit_mask)
         self.AccessAckData_cb(memory, burst_len, addr_aligned, size, source)
 
-    def LogicalAck_cb(self, operand1, memory, burst_len, addr_aligned, bit_mask, offset, size, source):
+    def LogicalAck_cb(self, param, operand1, memory, burst_len, addr_aligned, mask, bit_mask, offset, size, source):
         operand2 = (memory[addr_aligned] & bit_mask) >> offset
         result = (self._logical_op(param, operand1, operand2, mask) << offset) & \
             self.a_ports.data_mask
 
         assert burst_len == 1, 'LogicalAck_cb, burst_len should be 1'
 
-        memory[addr_aligned] = (memory.get(addr_aligned, 0) & (~bit_mask)) | (result & bit_mask)
+        memory.write_masked(addr_aligned, result, bit_mask)
         self.AccessAckData_cb(memory, burst_len, addr_aligned, size, source)
 
     def Grant_cb(self, param, sink, size, source, block_perm, block_addr):
@@ -206,14 +239,7 @@ class tlAdapter():
 
 
     def _arithmetic_op(self, param, operand1, operand2, mask):
-        # Count the number of nonzero bits in mask
-        size_op = 0
-        while mask >= 1:
-            if mask % 2 == 0:
-                mask = mask // 2
-            else:
-                size_op = size_op + 8
-                mask = mask // 2
+        size_op = self.mask_widths[mask]
         op_mask = (1 << size_op) - 1
         signed_op1 = operand1
         signed_op2 = operand2
@@ -228,25 +254,27 @@ class tlAdapter():
         elif param ==  MAX:
             return max(signed_op1, signed_op2)
         elif param == MINU:
-            uoperand1 = operand1 & (0xffffffff << 32 | 0xffffffff)
-            uoperand2 = operand2 & (0xffffffff << 32 | 0xffffffff)
+            uoperand1 = operand1 & op_mask
+            uoperand2 = operand2 & op_mask
             return min(uoperand1, uoperand2)
         elif param == MAXU:
-            uoperand1 = operand1 & (0xffffffff << 32 | 0xffffffff)
-            uoperand2 = operand2 & (0xffffffff << 32 | 0xffffffff)
+            uoperand1 = operand1 & op_mask
+            uoperand2 = operand2 & op_mask
             return max(uoperand1, uoperand2)
         elif param == ADD:
             return (signed_op1 + signed_op2)
 
-    def _logical_op(self, param, operand1, operand2):
+    def _logical_op(self, param, operand1, operand2, mask):
+        op_mask = (1 << self.mask_widths[mask]) - 1
+
         if param == XOR:
-            return operand1 ^ operand2
+            return (operand1 ^ operand2) & op_mask
         elif param == OR:
-            return operand1 | operand2
+            return (operand1 | operand2) & op_mask
         elif param == AND:
-            return operand1 & operand2
+            return (operand1 & operand2) & op_mask
         elif param == SWAP:
-            return operand1
+            return operand1 & op_mask
 
     def probe_blocks(self, block_perm, b_srcs, b_callback):
         probe_addrs = [ addr for addr in block_perm.keys() if block_perm[addr] != TIP ]
@@ -266,15 +294,20 @@ class tlAdapter():
 
         else:
             self.drive = False
+            # let the port drivers waiting for messages see the stop
+            self.d_queue.wake()
+            self.b_queue.wake()
+            self.probe_waker = self.order
+            self.probe_event.set()
 
 
     def drive_input(self, memory):
-        assert memory.__class__.__name__ == 'dict', \
-            'tlAdapter.drive_input need dict'
+        assert isinstance(memory, rtlMemory), \
+            'tlAdapter.drive_input need rtlMemory'
 
         block_perm = {}
         # TODO, check the resolution of block permissions
-        for addr in set([i & self.block_mask for i in memory.keys()]):
+        for addr in memory.blocks(self.block_mask):
             block_perm[addr] = TIP
 
         self.b_queue.clear()
@@ -287,11 +320,21 @@ class tlAdapter():
 
         b_callback = srcToCallback('b_callback', b_src_list)
 
-        self.a_monitor = cocotb.fork(self.a_port_monitor(memory, block_perm, d_sinks, \
-                                                         b_srcs, b_callback))
-        self.c_monitor = cocotb.fork(self.c_port_monitor(memory, block_perm, b_srcs, \
-                                                         b_callback))
-        self.e_monitor = cocotb.fork(self.e_port_monitor(memory, d_sinks))
+        if self.dispatch:
+            # channels are serviced by the dispatcher of the tile adapter
+            self.channels = [ (self.a_ports, CallBack(self.a_port_fire, memory, block_perm, d_sinks, \
+                                                      b_srcs, b_callback, {}, {})),
+                              (self.c_ports, CallBack(self.c_port_fire, memory, block_perm, b_srcs, \
+                                                      b_callback, {})),
+                              (self.e_ports, CallBack(self.e_port_fire, memory, d_sinks)) ]
+            for (ports, _) in self.channels:
+                ports.ready.value = 1
+        else:
+            self.a_monitor = cocotb.fork(self.a_port_monitor(memory, block_perm, d_sinks, \
+                                                             b_srcs, b_callback))
+            self.c_monitor = cocotb.fork(self.c_port_monitor(memory, block_perm, b_srcs, \
+                                                             b_callback))
+            self.e_monitor = cocotb.fork(self.e_port_monitor(memory, d_sinks))
 
         self.d_driver = cocotb.fork(self.d_port_driver())
         self.b_driver = cocotb.fork(self.b_port_driver())
@@ -299,322 +342,335 @@ class tlAdapter():
         self.retriever = cocotb.fork(self.data_retriever(block_perm, b_srcs, b_callback))
         self.host_if = cocotb.fork(self.host_interface(block_perm, b_srcs, b_callback))
 
-    @coroutine
-    def a_port_monitor(self, memory, block_perm, d_sinks, b_srcs, b_callback):
-
-        clkedge = RisingEdge(self.dut.clock)
+    def a_port_fire(self, memory, block_perm, d_sinks, b_srcs, b_callback, ongoings, bursts):
+        """ Handles the beat fired on channel A this cycle """
         a_ports = self.a_ports
 
-        ongoings = {} # On going TL-A transactions (src - count)
+        opcode = a_ports.get('opcode')
+        param = a_ports.get('param')
+        size = a_ports.get('size')
+        source = a_ports.get('source')
+        addr = a_ports.get('address')
+        mask = a_ports.get('mask')
+        data = a_ports.get('data')
 
-        a_ports.ready.value = 1
-        while self.drive:
-            if a_ports.fire():
-                opcode = a_ports.get('opcode')
-                param = a_ports.get('param')
-                size = a_ports.get('size')
-                source = a_ports.get('source')
-                addr = a_ports.get('address')
-                mask = a_ports.get('mask')
-                data = a_ports.get('data')
-
-                A_assertions(opcode, param, size, addr, mask, self.debug)
-
-                assert not ongoings or source in ongoings.keys(), \
-                    'Messages in A channel can not be interleaved'
-
-                addr_aligned = addr & self.addr_mask_d
-                block_addr = addr & self.block_mask
-                burst_len = int(max(pow(2, size) / self.d_datalen, 1))
-                bit_mask = int(''.join([ '{:02x}'.format(0xff * int(i)) \
-                                        for i in ('{:0b}'.format(mask))]), 16)
-
-                block_perm[block_addr] = block_perm.get(block_addr, TIP)
-
-                " TL-UL "
-                if opcode == GET:
-                    " Check block permission "
-                    if block_perm[block_addr] != TIP:
-                        callback = CallBack(self.AccessAckData_cb, memory, burst_len, \
-                                                 addr_aligned, size, source)
-                        self.retrieveBlock(b_srcs, b_callback, callback, toT, size, \
-                                           addr, mask)
-
-                    else:
-                        d_msgs = self.get_d_messages('AccessAckData', memory, burst_len, addr_aligned, \
-                                                     size=size, source=source)
-                        self.d_queue.push_msgs(d_msgs)
-
-                if opcode == PUT_FULL_DATA:
-                    count = ongoings.get(source, 0)
-                    get_addr = addr_aligned + count * self.a_datalen
-
-                    # TODO, Block_perm should not change during burst
-                    if block_perm[block_addr] != TIP:
-                        if count == 0:
-                            burst_data = {}
-                            callback = CallBack(self.AccessAck_cb, memory, ongoings, \
-                                                burst_len, burst_data, size, source)
-                            self.retrieveBlock(b_srcs, b_callback, callback, toN, size, \
-                                               addr, mask)
-
-                        burst_data[get_addr] = (bit_mask, data)
-                    else:
-                        masked_data = memory.get(get_addr, 0) & (~bit_mask)
-                        get_data = masked_data | (data & bit_mask)
-
-                        memory[get_addr] = get_data
-
-                        if count + 1 == burst_len:
-                            self.d_queue.push('AccessAck', None, size=size, source=source)
-                            if count: ongoings.pop(source)
-                        else:
-                            ongoings[source] = count + 1
-
-                if opcode == PUT_PARTIAL_DATA:
-                    count = ongoings.get(source, 0)
-                    get_addr = addr_aligned + count * self.a_datalen
-
-                    # TODO, Block_perm should not change during burst
-                    if block_perm[block_addr] != TIP:
-                        if count == 0:
-                            burst_data = {}
-                            callback = CallBack(self.AccessAck_cb, memory, ongoings, \
-                                                burst_len, burst_data, size, source)
-                            self.retrieveBlock(b_srcs, b_callback, callback, toN, size, \
-                                               addr, mask)
-
-                        burst_data[get_addr] = (bit_mask, data)
-                    else:
-                        masked_data = memory.get(get_addr, 0) & (~bit_mask)
-                        get_data = masked_data | (data & bit_mask)
-
-                        memory[get_addr] = get_data
-
-                        if count + 1 == burst_len:
-                            self.d_queue.push('AccessAck', None, size=size, source=source)
-                            if count: ongoings.pop(source)
-                        else:
-                            ongoings[source] = count + 1
-
-                " TL-UH "
-                if opcode == ARITHMETIC_DATA and \
-                   self.protocol >= TL_UH:
-
-                    count = ongoings.get(source, 0)
-
-                    # TODO, extend to multiple block
-                    assert burst_len == 1, \
-                        'ARITHMETIC_DATA can not span over multiple block'
-
-                    total_mask = 0
-                    offset = int(math.log((mask & -mask), 2) * 8)
-
-                    get_addr = addr_aligned + count * self.a_datalen
-                    get_data = data & bit_mask
-
-                    operand1 = get_data >> offset
-
-                    # TODO, Block_perm should not change during burst
-                    if block_perm[block_addr] != TIP:
-                        callback = CallBack(self.ArithmeticAck_cb, operand1, memory, burst_len, \
-                                            addr_aligned, bit_mask, offset, size, source)
-                        self.retrieveBlock(b_srcs, b_callback, callback, toN, size, \
-                                           addr, mask)
-
-                    else:
-                        if get_addr not in memory.keys():
-                            memory[get_addr] = self.nop_data
-                        # TODO, operand2 offset?
-                        operand2 = (memory[get_addr] & bit_mask) >> offset
-                        result = (self._arithmetic_op(param, operand1, operand2, mask) << offset) & \
-                            self.a_ports.data_mask # TODO, check _arithmetic_op
+        A_assertions(opcode, param, size, addr, mask, self.debug)
 
-                        memory[get_addr] = (memory[get_addr] & (~bit_mask)) | (result & bit_mask)
-                        self.d_queue.push('AccessAckData', None, size=size, source=source, data=operand2)
-
-                if opcode == LOGICAL_DATA and \
-                   self.protocol >= TL_UH:
+        assert not ongoings or source in ongoings.keys(), \
+            'Messages in A channel can not be interleaved'
 
-                    count = ongoings.get(source, 0)
+        addr_aligned = addr & self.addr_mask_d
+        block_addr = addr & self.block_mask
+        burst_len = self.burst_lens_d[size]
+        bit_mask = self.bit_masks[mask]
 
-                    # TODO, extend to multiple block
-                    assert burst_len == 1, \
-                        'LOGICAL_DATA can not span over multiple block'
+        block_perm[block_addr] = block_perm.get(block_addr, TIP)
 
-                    total_mask = 0
-                    offset = int(math.log((mask & -mask), 2) * 8)
+        " TL-UL "
+        if opcode == GET:
+            " Check block permission "
+            if block_perm[block_addr] != TIP:
+                callback = CallBack(self.AccessAckData_cb, memory, burst_len, \
+                                         addr_aligned, size, source)
+                self.retrieveBlock(b_srcs, b_callback, callback, toT, size, \
+                                   addr, mask)
 
-                    get_addr = addr_aligned + count * self.a_datalen
-                    get_data = data & bit_mask
+            else:
+                d_msgs = self.get_d_messages('AccessAckData', memory, burst_len, addr_aligned, \
+                                             size=size, source=source)
+                self.d_queue.push_msgs(d_msgs)
+
+        if opcode == PUT_FULL_DATA:
+            count = ongoings.get(source, 0)
+            get_addr = addr_aligned + count * self.a_datalen
+
+            # TODO, Block_perm should not change during burst
+            if block_perm[block_addr] != TIP:
+                if count == 0:
+                    burst_data = bursts[source] = {}
+                    callback = CallBack(self.AccessAck_cb, memory, ongoings, \
+                                        burst_len, burst_data, size, source)
+                    self.retrieveBlock(b_srcs, b_callback, callback, toN, size, \
+                                       addr, mask)
 
-                    operand1 = get_data >> offset
+                bursts[source][get_addr] = (bit_mask, data)
+            else:
+                memory.write_masked(get_addr, data, bit_mask)
 
-                    # TODO, Block_perm should not change during burst
-                    if block_perm[block_addr] != TIP:
+                if count + 1 == burst_len:
+                    self.d_queue.push('AccessAck', None, size=size, source=source)
+                    if count: ongoings.pop(source)
+                else:
+                    ongoings[source] = count + 1
+
+        if opcode == PUT_PARTIAL_DATA:
+            count = ongoings.get(source, 0)
+            get_addr = addr_aligned + count * self.a_datalen
+
+            # TODO, Block_perm should not change during burst
+            if block_perm[block_addr] != TIP:
+                if count == 0:
+                    burst_data = bursts[source] = {}
+                    callback = CallBack(self.AccessAck_cb, memory, ongoings, \
+                                        burst_len, burst_data, size, source)
+                    self.retrieveBlock(b_srcs, b_callback, callback, toN, size, \
+                                       addr, mask)
 
-                        callback = CallBack(self.LogicalAck_cb, operand1, memory, burst_len, \
-                                            addr_aligned, bit_mask, offset, size, source)
-                        self.retrieveBlock(b_srcs, b_callback, callback, toN, size, \
-                                           addr, mask)
+                bursts[source][get_addr] = (bit_mask, data)
+            else:
+                memory.write_masked(get_addr, data, bit_mask)
 
-                    else:
-                        if get_addr not in memory.keys():
-                            memory[get_addr] = self.nop_data
-                        operand2 = (memory[get_addr] & bit_mask) >> offset
-                        result = (self._logical_op(param, operand1, operand2) << offset) & \
-                            self.a_ports.data_mask # TODO, check _logical_op
+                if count + 1 == burst_len:
+                    self.d_queue.push('AccessAck', None, size=size, source=source)
+                    if count: ongoings.pop(source)
+                else:
+                    ongoings[source] = count + 1
 
-                        memory[get_addr] = (memory[get_addr] & (~bit_mask)) | (result & bit_mask)
-                        self.d_queue.push('AccessAckData', None, size=size, source=source, data=operand2)
+        " TL-UH "
+        if opcode == ARITHMETIC_DATA and \
+           self.protocol >= TL_UH:
 
-                if opcode == INTENT and \
-                   self.protocol >= TL_UH:
+            count = ongoings.get(source, 0)
 
-                    self.d_queue.push('HintAck', None, size=size, source=source)
+            # TODO, extend to multiple block
+            assert burst_len == 1, \
+                'ARITHMETIC_DATA can not span over multiple block'
 
-                " TL-C "
-                if opcode == ACQUIRE_BLOCK and \
-                   self.protocol == TL_C:
+            total_mask = 0
+            offset = self.mask_offsets[mask]
 
-                    d_sink = d_sinks.get()
+            get_addr = addr_aligned + count * self.a_datalen
+            get_data = data & bit_mask
 
-                    if param == NtoB: d_param = toB
-                    else: d_param = toT
+            operand1 = get_data >> offset
 
-                    if block_perm[block_addr] != TIP:
-                        if param == NtoB: b_param = toB
-                        else: b_param = toN
+            # TODO, Block_perm should not change during burst
+            if block_perm[block_addr] != TIP:
+                callback = CallBack(self.ArithmeticAck_cb, param, operand1, memory, burst_len, \
+                                    addr_aligned, mask, bit_mask, offset, size, source)
+                self.retrieveBlock(b_srcs, b_callback, callback, toN, size, \
+                                   addr, mask)
 
-                        callback = CallBack(self.GrantData_cb, memory, burst_len, addr_aligned, \
-                                                 d_param, d_sink, size, source, block_perm, block_addr)
-                        self.retrieveBlock(b_srcs, b_callback, callback, b_param, size, \
-                                           addr, mask)
+            else:
+                if get_addr not in memory:
+                    memory[get_addr] = self.nop_data
+                # TODO, operand2 offset?
+                operand2 = (memory[get_addr] & bit_mask) >> offset
+                result = (self._arithmetic_op(param, operand1, operand2, mask) << offset) & \
+                    self.a_ports.data_mask # TODO, check _arithmetic_op
 
-                    else:
-                        callback_d = CallBack(self.updatePerm, block_perm, block_addr, d_param)
-                        d_msgs = self.get_d_messages('GrantData', memory, burst_len, addr_aligned, \
-                                                param=d_param, size=size, source=source, sink=d_sink)
-                        cbs = [ callback_d ] + [ None for i in range(len(d_msgs) - 1) ]
+                memory.write_masked(get_addr, result, bit_mask)
+                self.d_queue.push('AccessAckData', None, size=size, source=source, data=operand2)
 
-                        self.ongoing_tlc[d_sink] = block_addr
-                        self.d_queue.push_msg_cbs(d_msgs, cbs)
+        if opcode == LOGICAL_DATA and \
+           self.protocol >= TL_UH:
 
-                if opcode == ACQUIRE_PERM and \
-                   self.protocol == TL_C:
+            count = ongoings.get(source, 0)
 
-                    d_sink = d_sinks.get()
+            # TODO, extend to multiple block
+            assert burst_len == 1, \
+                'LOGICAL_DATA can not span over multiple block'
 
-                    if param == NtoB: d_param = toB
-                    else: d_param = toT
+            total_mask = 0
+            offset = self.mask_offsets[mask]
 
-                    if block_perm[block_addr] != TIP:
-                        if param == NtoB: b_param = toB
-                        else: b_param = toN
+            get_addr = addr_aligned + count * self.a_datalen
+            get_data = data & bit_mask
 
-                        callback = CallBack(self.Grant_cb, d_param, d_sink, size, source, \
-                                                 block_perm, block_addr)
-                        self.retrievePerm(b_srcs, b_callback, callback, b_param, size, \
-                                           addr, mask, 'ProbePerm')
+            operand1 = get_data >> offset
 
-                    else:
-                        callback_d = CallBack(self.updatePerm, block_perm, block_addr, d_param)
+            # TODO, Block_perm should not change during burst
+            if block_perm[block_addr] != TIP:
 
-                        self.ongoing_tlc[d_sink] = block_addr
-                        self.d_queue.push('Grant', callback_d, param=d_param, size=size, \
-                                          source=source, sink=d_sink)
+                callback = CallBack(self.LogicalAck_cb, param, operand1, memory, burst_len, \
+                                    addr_aligned, mask, bit_mask, offset, size, source)
+                self.retrieveBlock(b_srcs, b_callback, callback, toN, size, \
+                                   addr, mask)
 
-            yield clkedge
+            else:
+                if get_addr not in memory:
+                    memory[get_addr] = self.nop_data
+                operand2 = (memory[get_addr] & bit_mask) >> offset
+                result = (self._logical_op(param, operand1, operand2, mask) << offset) & \
+                    self.a_ports.data_mask # TODO, check _logical_op
 
-        a_ports.ready.value = 0
+                memory.write_masked(get_addr, result, bit_mask)
+                self.d_queue.push('AccessAckData', None, size=size, source=source, data=operand2)
+
+        if opcode == INTENT and \
+           self.protocol >= TL_UH:
+
+            self.d_queue.push('HintAck', None, size=size, source=source)
+
+        " TL-C "
+        if opcode == ACQUIRE_BLOCK and \
+           self.protocol == TL_C:
+
+            d_sink = d_sinks.get()
+
+            if param == NtoB: d_param = toB
+            else: d_param = toT
+
+            if block_perm[block_addr] != TIP:
+                if param == NtoB: b_param = toB
+                else: b_param = toN
+
+                callback = CallBack(self.GrantData_cb, memory, burst_len, addr_aligned, \
+                                         d_param, d_sink, size, source, block_perm, block_addr)
+                self.retrieveBlock(b_srcs, b_callback, callback, b_param, size, \
+                                   addr, mask)
+
+            else:
+                callback_d = CallBack(self.updatePerm, block_perm, block_addr, d_param)
+                d_msgs = self.get_d_messages('GrantData', memory, burst_len, addr_aligned, \
+                                        param=d_param, size=size, source=source, sink=d_sink)
+                cbs = [ callback_d ] + [ None for i in range(len(d_msgs) - 1) ]
+
+                self.ongoing_tlc[d_sink] = block_addr
+                self.d_queue.push_msg_cbs(d_msgs, cbs)
+
+        if opcode == ACQUIRE_PERM and \
+           self.protocol == TL_C:
+
+            d_sink = d_sinks.get()
+
+            if param == NtoB: d_param = toB
+            else: d_param = toT
+
+            if block_perm[block_addr] != TIP:
+                if param == NtoB: b_param = toB
+                else: b_param = toN
+
+                callback = CallBack(self.Grant_cb, d_param, d_sink, size, source, \
+                                         block_perm, block_addr)
+                self.retrievePerm(b_srcs, b_callback, callback, b_param, size, \
+                                   addr, mask, 'ProbePerm')
+
+            else:
+                callback_d = CallBack(self.updatePerm, block_perm, block_addr, d_param)
+
+                self.ongoing_tlc[d_sink] = block_addr
+                self.d_queue.push('Grant', callback_d, param=d_param, size=size, \
+                                  source=source, sink=d_sink)
 
     @coroutine
-    def c_port_monitor(self, memory, block_perm, b_srcs, b_callback):
+    def a_port_monitor(self, memory, block_perm, d_sinks, b_srcs, b_callback):
 
         clkedge = RisingEdge(self.dut.clock)
-        c_ports = self.c_ports
+        a_ports = self.a_ports
 
-        ongoings = {} # On going transactions (src - count)
+        ongoings = {} # On going TL-A transactions (src - count)
+        bursts = {} # Data of TL-A puts waiting for a probe (src - burst_data)
 
-        c_ports.ready.value = 1
+        a_ports.ready.value = 1
         while self.drive:
-            if c_ports.fire():
-                opcode = c_ports.get('opcode')
-                param = c_ports.get('param')
-                size = c_ports.get('size')
-                source = c_ports.get('source')
-                addr = c_ports.get('address')
-                data = c_ports.get('data')
-                corrupt = c_ports.get('corrupt')
+            if a_ports.fire():
+                self.a_port_fire(memory, block_perm, d_sinks, b_srcs, b_callback, ongoings, bursts)
+
+            yield clkedge
+
+        a_ports.ready.value = 0
+
+    def c_port_fire(self, memory, block_perm, b_srcs, b_callback, ongoings):
+        """ Handles the beat fired on channel C this cycle """
+        c_ports = self.c_ports
+
+        opcode = c_ports.get('opcode')
+        param = c_ports.get('param')
+        size = c_ports.get('size')
+        source = c_ports.get('source')
+        addr = c_ports.get('address')
+        data = c_ports.get('data')
+        corrupt = c_ports.get('corrupt')
 
-                C_assertions(opcode, param, size, addr, corrupt, self.debug)
+        C_assertions(opcode, param, size, addr, corrupt, self.debug)
 
-                assert not ongoings or source in ongoings.keys(), \
-                    'Messages in C channel can not be interleaved'
+        assert not ongoings or source in ongoings.keys(), \
+            'Messages in C channel can not be interleaved'
 
-                addr_aligned = addr & self.addr_mask_c
-                block_addr = addr & self.block_mask
-                burst_len = int(max(pow(2, size) / self.c_datalen, 1))
+        addr_aligned = addr & self.addr_mask_c
+        block_addr = addr & self.block_mask
+        burst_len = self.burst_lens_c[size]
 
-                if opcode == ACCESS_ACK:
-                    raise NotImplementedError()
+        if opcode == ACCESS_ACK:
+            raise NotImplementedError()
 
-                if opcode == ACCESS_ACK_DATA:
-                    raise NotImplementedError()
+        if opcode == ACCESS_ACK_DATA:
+            raise NotImplementedError()
 
-                if opcode == HINT_ACK:
-                    raise NotImplementedError()
+        if opcode == HINT_ACK:
+            raise NotImplementedError()
 
-                if opcode == PROBE_ACK:
-                    if param in [ TtoB, TtoN ]:
-                        block_perm[block_addr] = TIP
+        if opcode == PROBE_ACK:
+            if param in [ TtoB, TtoN ]:
+                block_perm[block_addr] = TIP
 
-                    b_callback.call(source)
-                    b_srcs.release(source)
+            b_callback.call(source)
+            b_srcs.release(source)
+
+        if opcode == PROBE_ACK_DATA:
+            count = ongoings.get(source, 0)
+            get_addr = addr_aligned + count * self.c_datalen
+
+            memory[get_addr] = data
+
+            if count + 1 == burst_len:
+                if param in [ TtoB, TtoN ]:
+                    block_perm[block_addr] = TIP
+
+                b_callback.call(source)
+                b_srcs.release(source)
+
+                if count: ongoings.pop(source)
+            else:
+                ongoings[source] = count + 1
 
-                if opcode == PROBE_ACK_DATA:
-                    count = ongoings.get(source, 0)
-                    get_addr = addr_aligned + count * self.c_datalen
+        if opcode == RELEASE:
+            if param in [ TtoB, TtoN ]:
+                block_perm[block_addr] = TIP
 
-                    memory[get_addr] = data
+            self.d_queue.push('ReleaseAck', None, size=size, source=source)
 
-                    if count + 1 == burst_len:
-                        if param in [ TtoB, TtoN ]:
-                            block_perm[block_addr] = TIP
+        if opcode == RELEASE_DATA:
+            count = ongoings.get(source, 0)
+            get_addr = addr_aligned + count * self.c_datalen
 
-                        b_callback.call(source)
-                        b_srcs.release(source)
+            memory[get_addr] = data
 
-                        if count: ongoings.pop(source)
-                    else:
-                        ongoings[source] = count + 1
+            if count + 1 == burst_len:
+                if param in [ TtoB, TtoN ]:
+                    block_perm[block_addr] = TIP
 
-                if opcode == RELEASE:
-                    if param in [ TtoB, TtoN ]:
-                        block_perm[block_addr] = TIP
+                self.d_queue.push('ReleaseAck', None, size=size, source=source)
 
-                    self.d_queue.push('ReleaseAck', None, size=size, source=source)
+                if count: ongoings.pop(source)
+            else:
+                ongoings[source] = count + 1
 
-                if opcode == RELEASE_DATA:
-                    count = ongoings.get(source, 0)
-                    get_addr = addr_aligned + count * self.c_datalen
 
-                    memory[get_addr] = data
+    @coroutine
+    def c_port_monitor(self, memory, block_perm, b_srcs, b_callback):
 
-                    if count + 1 == burst_len:
-                        if param in [ TtoB, TtoN ]:
-                            block_perm[block_addr] = TIP
+        clkedge = RisingEdge(self.dut.clock)
+        c_ports = self.c_ports
 
-                        self.d_queue.push('ReleaseAck', None, size=size, source=source)
+        ongoings = {} # On going transactions (src - count)
 
-                        if count: ongoings.pop(source)
-                    else:
-                        ongoings[source] = count + 1
+        c_ports.ready.value = 1
+        while self.drive:
+            if c_ports.fire():
+                self.c_port_fire(memory, block_perm, b_srcs, b_callback, ongoings)
 
             yield clkedge
 
         c_ports.ready.value = 0
 
+    def e_port_fire(self, memory, d_sinks):
+        """ Handles the beat fired on channel E this cycle """
+        sink = self.e_ports.get('sink')
+        d_sinks.release(sink)
+        self.ongoing_tlc.pop(sink)
+
     @coroutine
     def e_port_monitor(self, memory, d_sinks):
 
@@ -624,9 +680,7 @@ class tlAdapter():
         e_ports.ready.value = 1
         while self.drive:
             if e_ports.fire():
-                sink = e_ports.get('sink')
-                d_sinks.release(sink)
-                self.ongoing_tlc.pop(sink)
+                self.e_port_fire(memory, d_sinks)
 
             yield clkedge
 
@@ -668,7 +722,9 @@ class tlAdapter():
                 else:
                     yield clkedge
             else:
-                yield clkedge
+                yield self.d_queue.wait()
+                if self.d_queue.waker > D_DRIVER:
+                    yield clkedge
 
         d_ports.clear()
 
@@ -702,25 +758,53 @@ class tlAdapter():
                 else:
                     yield clkedge
             else:
-                yield clkedge
+                yield self.b_queue.wait()
+                if self.b_queue.waker > B_DRIVER:
+                    yield clkedge
 
         b_ports.clear()
 
+    def service_channels(self):
+        """ Dispatch mode: handles the beats fired on A, C and E this cycle,
+        returns False once the adapter stopped driving
+        """
+        if not self.drive:
+            for (ports, _) in self.channels:
+                ports.ready.value = 0
+            self.channels = []
+            return False
+
+        for (ports, handler) in self.channels:
+            if ports.fire():
+                handler.call()
+
+        return True
+
     @coroutine
     def data_retriever(self, block_perm, b_srcs, b_callback):
-        clkedge = RisingEdge(self.dut.clock)
-
-        while not self.retrieve:
-            yield clkedge
+        if not self.retrieve:
+            # stop() is called by the host
+            yield self.retrieve_event.wait()
+            yield RisingEdge(self.dut.clock)
 
+        self.run_as(RETRIEVER)
         self.probe_blocks(block_perm, b_srcs, b_callback)
+        self.run_as(MONITORS)
 
     @coroutine
     def host_interface(self, block_perm, b_srcs, b_callback):
         clkedge = RisingEdge(self.dut.clock)
 
         while self.drive:
-            if (self.probe & self.probe_en) and self.probe_addr not in self.ongoing_tlc.values():
+            # sleep until probe_block or enableProbe, poll while a probe is pending
+            if not (self.probe & self.probe_en):
+                self.probe_event.clear()
+                yield self.probe_event.wait()
+                if self.probe_waker > HOST_IF:
+                    yield clkedge
+                continue
+
+            if self.probe_addr not in self.ongoing_tlc.values():
                 block_addr = self.probe_addr & self.block_mask
                 mask = (1 << self.b_datalen) - 1
                 size = int(math.log(self.block_size, 2))
@@ -730,8 +814,10 @@ class tlAdapter():
 
                 if block_perm[block_addr] != TIP:
                     callback = CallBack(self.enableProbe)
+                    self.run_as(HOST_IF)
                     self.retrieveBlock(b_srcs, b_callback, callback, toN, size, \
                                        self.probe_addr, mask)
+                    self.run_as(MONITORS)
 
                     self.probe = 0
                     self.probe_en = 0
@@ -742,15 +828,29 @@ class tlAdapter():
     def probe_block(self, probe_addr):
         self.probe = 1
         self.probe_addr = probe_addr
+        self.probe_waker = HOST
+        self.probe_event.set()
 
     def start(self, memory):
         self.drive = True
         self.retrieve = False
+        self.retrieve_event.clear()
+
+        # a persistent simulator reuses the adapter, a test may have ended
+        # with a transaction or the tohost probe in flight
+        self.ongoing_tlc = {}
+        self.probe = 0
+        self.probe_en = 1
+        self.probe_addr = 0
+        self.probe_waker = MONITORS
+        self.probe_event.clear()
+        self.order = MONITORS
 
         self.drive_input(memory)
 
     def stop(self):
         self.retrieve = True
+        self.retrieve_event.set()
 
     def onGoing(self):
         return self.a_ports.valid.value | self.c_ports.valid.value
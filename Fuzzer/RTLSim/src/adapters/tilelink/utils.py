@@ -1,5 +1,6 @@
-import random
-import queue
+import rng
+from collections import deque
+from cocotb.triggers import Event
 
 from adapters.tilelink.definitions import *
 
@@ -52,6 +53,31 @@ class Ports:
             port.value = 0
 
 
+""" Lookup tables of a data bus, built once per adapter
+bit_masks[mask]     bit mask selecting the bytes of the byte mask
+mask_offsets[mask]  bit offset of the lowest byte in the byte mask
+mask_widths[mask]   number of bits selected by the byte mask
+"""
+def byte_mask_tables(num_bytes):
+    bit_masks = [ 0 ] * (1 << num_bytes)
+    mask_offsets = [ 0 ] * (1 << num_bytes)
+    mask_widths = [ 0 ] * (1 << num_bytes)
+
+    for mask in range(1, 1 << num_bytes):
+        low = mask & -mask
+        low_byte = low.bit_length() - 1
+
+        bit_masks[mask] = bit_masks[mask ^ low] | (0xff << (8 * low_byte))
+        mask_offsets[mask] = 8 * low_byte
+        mask_widths[mask] = mask_widths[mask ^ low] + 8
+
+    return (bit_masks, mask_offsets, mask_widths)
+
+""" Number of beats of a message of 2^size bytes, for every size of the size field """
+def burst_len_table(size_len, num_bytes):
+    return [ max((1 << size) // num_bytes, 1) for size in range(1 << size_len) ]
+
+
 """ CallBack functions which tilelink adapter should run """
 class CallBack():
     def __init__(self, func, *args, **kwargs):
@@ -164,13 +190,28 @@ class tlBMessage():
         self.address = kwargs['address']
         self.mask = kwargs['mask']
 
+""" Message queues are only used from coroutines of the simulator thread,
+so they are plain deques. `pending` is set while messages are queued, the
+port drivers wait on it instead of polling the queue every clock. `waker` is
+the clock order (see tlAdapter) of the code which made the queue non-empty
+or woke it, `order` the one of the code running now.
+"""
 class Queue():
     def __init__(self):
-        self.queue = queue.Queue()
+        self.queue = deque()
+        self.pending = Event()
+        self.order = 0
+        self.waker = 0
 
     def clear(self):
-        while not self.queue.empty():
-            self.queue.get()
+        self.queue.clear()
+        self.pending.clear()
+
+    def put(self, entry):
+        if not self.queue:
+            self.waker = self.order
+        self.queue.append(entry)
+        self.pending.set()
 
     def push(self, message, **kwargs):
         raise NotImplementedError()
@@ -181,20 +222,31 @@ class Queue():
     def push_msgs(self, messages):
         for msg in messages:
             self.check_msg(msg)
-            self.queue.put((msg, None))
+            self.put((msg, None))
 
     def push_msg_cbs(self, msgs, cbs):
         assert len(msgs) == len(cbs), \
             'push_msg_cbs the number of msgs and cbs should be same'
         for (msg, cb) in zip(msgs, cbs):
             self.check_msg(msg)
-            self.queue.put((msg, cb))
+            self.put((msg, cb))
 
     def pop(self):
-        return self.queue.get()
+        entry = self.queue.popleft()
+        if not self.queue:
+            self.pending.clear()
+        return entry
 
     def empty(self):
-        return self.queue.empty()
+        return not self.queue
+
+    def wait(self):
+        """ Trigger which fires once a message is queued or wake() is called """
+        return self.pending.wait()
+
+    def wake(self):
+        self.waker = self.order
+        self.pending.set()
 
 class tlDQueue(Queue):
     def __init__(self):
@@ -202,10 +254,10 @@ class tlDQueue(Queue):
 
     def push(self, message, callback, **kwargs):
         if message == 'Bubble':
-            self.queue.put((None, None))
+            self.put((None, None))
         else:
             entry = (tlDMessage(message, **kwargs), callback)
-            self.queue.put(entry)
+            self.put(entry)
 
     def check_msg(self, message):
         assert message.__class__.__name__ == 'tlDMessage', \
@@ -217,9 +269,9 @@ class tlBQueue(Queue):
 
     def push(self, message, **kwargs):
         if message == 'Bubble':
-            self.queue.put(None)
+            self.put(None)
         else:
-            self.queue.put(tlBMessage(message, **kwargs))
+            self.put(tlBMessage(message, **kwargs))
 
     def check_msg(self, message):
         assert message.__class__.__name__ == 'tlBMessage', \
@@ -230,13 +282,13 @@ class FreeList():
         self.name = name
         self.init_list = init_list
         self.free_list = init_list.copy()
-        self.event_queue = queue.Queue()
+        self.event_queue = deque()
 
     def get(self):
         assert self.free_list, \
             '{} is empty'.format(self.name)
 
-        ret = random.choice(self.free_list)
+        ret = rng.adapter.choice(self.free_list)
 
         self.free_list.remove(ret)
 
@@ -246,7 +298,7 @@ class FreeList():
         return not bool(self.free_list)
 
     def reserve(self, callback):
-        self.event_queue.put(callback)
+        self.event_queue.append(callback)
 
     def release(self, ret):
         assert ret in self.init_list, \
@@ -256,8 +308,8 @@ class FreeList():
 
         self.free_list.append(ret)
 
-        if not self.event_queue.empty():
-            event = self.event_queue.get()
+        if self.event_queue:
+            event = self.event_queue.popleft()
             event.call()
 
         return
@@ -2,6 +2,7 @@ import os
 import math
 from copy import deepcopy
 import tempfile
+import rng
 
 from RTLSim.host import NO_LEAK, TIME_OUT, LEAK
 from src.word import PREFIX, MAIN, SUFFIX
@@ -13,7 +14,7 @@ from Config import ROCKET_CONF, BOOM_CONF
 
 def Replay(target, in_file=None,
              template='Template', proc_num=0,
-             debug=False, contract='ct', isa='RV64IM'):
+             debug=False, contract='ct', isa='RV64IM', seed=None):
     with tempfile.TemporaryDirectory() as out:
         assert target in ['Rocket', 'Boom' ], \
             '{} is not toplevel'.format(target)
@@ -26,6 +27,10 @@ def Replay(target, in_file=None,
 
 
 
+        adapter_seed = rng.derive_seed(rng.seed(seed), 'adapter')
+        if seed is None and load_seed(in_file) is not None:
+            adapter_seed = load_seed(in_file)
+
         (mutator, preprocessor, hscHost) = \
             setupHSC(template, out, proc_num, debug, contract, isa)
 
@@ -45,7 +50,7 @@ def Replay(target, in_file=None,
             print('[Replay] {} leads to Sail non-zero exit'.format(in_file))
             return
         
-        (ret, cov_map, _, _) = run_rtl_test(bin_dir, v_file, toplevel, rtl_input, 0, None)
+        (ret, cov_map, _, _, _) = run_rtl_test(bin_dir, v_file, toplevel, rtl_input, 0, None, seed=adapter_seed)
 
         if ret == ERROR:
             debug_print('[RTLHost] exception {}'.format(e), debug, True)
@@ -56,4 +61,4 @@ def Replay(target, in_file=None,
         elif ret == TIME_OUT:
             debug_print('[HSCFuzz] Bug [RTL Timeout]', debug, True)
                 
-        print('[HSCFuzz] Stop Fuzzing, total {} cov_points'.format(cov_map.count(1)))
+        print('[HSCFuzz] Stop Fuzzing, total {} cov_points'.format(len(cov_map)))
@@ -1,15 +1,14 @@
 import os
+import socket
 from cocotb.decorators import coroutine
 from RTLSim.host import NO_LEAK, TIME_OUT, LEAK, rtlInput, rvRTLhost
 
 from src.run_utils import *
+from src.utils import ERROR
+from src.cov_utils import save_cov
+import rng
 
-@coroutine
-def Run(dut, toplevel, input=None, debug=False):
-    #start = time.perf_counter()
-    assert toplevel in ['RocketTile', 'BoomTile' ], \
-        '{} is not toplevel'.format(toplevel)
-    
+def load_input(input):
     (sim_input, (data_a, data_b), assert_intr) = read_siminput(input)
 
     max_cycles = 6000
@@ -25,7 +24,26 @@ def Run(dut, toplevel, input=None, debug=False):
 
     rtl_input = rtlInput(hex_name, None, data_a, data_b, symbols, max_cycles)
 
-    rtlHost = rvRTLhost(dut, toplevel, None, debug=debug)
+    return (rtl_input, assert_intr)
+
+@coroutine
+def Run(dut, toplevel, input=None, debug=False, server=None, cov_hash='shake', hdl_monitor=0,
+        dispatch=0, seed=-1):
+    #start = time.perf_counter()
+    assert toplevel in ['RocketTile', 'BoomTile' ], \
+        '{} is not toplevel'.format(toplevel)
+
+    if server:
+        yield Serve(dut, toplevel, server, debug, cov_hash, hdl_monitor, dispatch, seed)
+        return
+
+    if seed >= 0:
+        rng.adapter.seed(seed)
+
+    (rtl_input, assert_intr) = load_input(input)
+
+    rtlHost = rvRTLhost(dut, toplevel, None, debug=debug, cov_hash=cov_hash, hdl_monitor=hdl_monitor,
+                        dispatch=dispatch)
 
     #start_sim = time.perf_counter()
     try:
@@ -51,15 +69,52 @@ def Run(dut, toplevel, input=None, debug=False):
         
         # output coverage somehow
 
+    dir, fname = os.path.split(input)
+    fname = fname.split('.si')[0]
     cov_name = fname + '.cov'
     cov_out =  os.path.join(dir, cov_name)
-    fd = open(cov_out, 'wb')
-    cov_map.tofile(fd)
-    fd.close()
+    save_cov(cov_out, cov_map)
     #end = time.perf_counter()
     #debug_print('[HSCFuzz] Init time {}'.format(start_sim - start), True)
     #debug_print('[HSCFuzz] RTLSim time {}'.format(end_sim - start_sim), True)
     #debug_print('[HSCFuzz] Output time {}'.format(end - end_sim), True)
-    debug_print('[HSCFuzz] Stop Fuzzing, total {} cov_points'.format(cov_map.count(1)), debug)
+    debug_print('[HSCFuzz] Stop Fuzzing, total {} cov_points'.format(len(cov_map)), debug)
+
+@coroutine
+def Serve(dut, toplevel, server, debug=False, cov_hash='shake', hdl_monitor=0, dispatch=0, seed=-1):
+    """ Simulation server
+    Simulates SimInputs received over the unix socket `server` one after
+    another, reusing the simulator and the host. Each request is a SimInput
+    path terminated by a newline, each reply is a '<ret> <len>' line followed
+    by <len> bytes of coverage, the hit indices as uint32. An empty request or EOF stops the server.
+    The adapter stream is reseeded for every SimInput, as a fresh simulator would be.
+    """
+    rtlHost = rvRTLhost(dut, toplevel, None, debug=debug, cov_hash=cov_hash, hdl_monitor=hdl_monitor,
+                        dispatch=dispatch)
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(server)
+    rfile = sock.makefile('rb')
+
+    debug_print('[RTLHost] Serving on {}'.format(server), debug)
+    while True:
+        input = rfile.readline().decode().strip()
+        if not input:
+            break
+
+        # run_test resets the DUT (metaReset, reset) before every simulation
+        if seed >= 0:
+            rng.adapter.seed(seed)
+        try:
+            (rtl_input, assert_intr) = load_input(input)
+            (ret, (cov_bits, cov_map)) = yield rtlHost.run_test(rtl_input, assert_intr)
+            cov_bytes = cov_map.tobytes()
+        except Exception as e:
+            debug_print('[RTLHost] exception {}'.format(e), debug, True)
+            ret = ERROR
+            cov_bytes = b''
 
+        sock.sendall('{} {}\n'.format(ret, len(cov_bytes)).encode() + cov_bytes)
 
+    rfile.close()
+    sock.close()
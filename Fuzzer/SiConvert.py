@@ -0,0 +1,46 @@
+import os
+import argparse
+
+from src.si_format import load_si, save_si
+
+""" simInput converter
+Converts .si files (or all .si files of directories) between the binary and
+the human readable text format, the input format is detected from the file.
+"""
+
+def convert(in_name, out_name, binary):
+    (template, parts, ints, data) = load_si(in_name)
+    if not data[0] and not data[1]:
+        data = []
+
+    save_si(out_name, template, parts, ints, data, binary)
+
+parser = argparse.ArgumentParser(prog="SiConvert",
+                                 description="Convert simInputs between the binary and the text format")
+parser.add_argument('inputs', nargs='+', help='.si files or directories of .si files')
+parser.add_argument('-t', '--to', choices=['text', 'binary'], default='text', help='Output format')
+parser.add_argument('-o', '--output', type=str, default=None,
+                    help='Output directory (default: convert in place)')
+
+args = parser.parse_args()
+binary = args.to == 'binary'
+
+si_names = []
+for name in args.inputs:
+    if os.path.isdir(name):
+        si_names += [ name + '/' + si_name for si_name in sorted(os.listdir(name))
+                      if si_name.endswith('.si') ]
+    else:
+        si_names.append(name)
+
+if args.output:
+    os.makedirs(args.output, exist_ok=True)
+
+for si_name in si_names:
+    out_name = si_name
+    if args.output:
+        out_name = args.output + '/' + os.path.basename(si_name)
+
+    convert(si_name, out_name, binary)
+
+print('[SiConvert] {} simInput(s) converted to {}'.format(len(si_names), args.to))
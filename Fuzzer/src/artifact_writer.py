@@ -0,0 +1,84 @@
+import time
+import queue
+import threading
+
+""" Artifact writer
+Writes the fuzzer's logs and artifacts (corpus entries, mismatch copies) on a
+background thread, so the scheduling loop does not wait for the (possibly NFS
+backed) output directory. Logs are appended through buffered handles kept
+open until close() and flushed every flush_interval seconds. The queue is
+bounded: if the disk falls behind by max_queue jobs, submitting blocks
+instead of buffering without limit.
+
+Jobs run in submission order. Everything a job writes must not change after
+it is submitted (simInputs are immutable, temporary inputs are not cleaned up
+before their copy). The first exception of a job is raised again by the next
+append()/submit() or by close().
+"""
+
+class artifactWriter():
+    def __init__(self, max_queue=1024, flush_interval=5):
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.handles = {} # log name -> buffered append handle
+        self.error = None
+
+        self.thread = threading.Thread(target=self.run, name='artifactWriter', daemon=True)
+        self.thread.start()
+
+    def check(self):
+        if self.error:
+            raise self.error
+
+    def append(self, file_name, line):
+        """ Appends line to the log file_name """
+        self.check()
+        self.queue.put((self.write_log, (file_name, line)))
+
+    def submit(self, fn, *args):
+        """ Runs fn(*args) on the writer thread """
+        self.check()
+        self.queue.put((fn, args))
+
+    def write_log(self, file_name, line):
+        fd = self.handles.get(file_name)
+        if fd is None:
+            fd = open(file_name, 'a')
+            self.handles[file_name] = fd
+        fd.write(line)
+
+    def flush(self):
+        for fd in self.handles.values():
+            fd.flush()
+
+    def run(self):
+        last_flush = time.time()
+        while True:
+            try:
+                job = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                job = ()
+
+            if job is None:
+                break
+
+            if job and self.error is None:
+                (fn, args) = job
+                try:
+                    fn(*args)
+                except Exception as e:
+                    self.error = e
+
+            if time.time() - last_flush >= self.flush_interval:
+                self.flush()
+                last_flush = time.time()
+
+        self.flush()
+        for fd in self.handles.values():
+            fd.close()
+
+    def close(self):
+        """ Waits until every submitted job is done, closes the logs """
+        self.queue.put(None)
+        self.thread.join()
+        self.check()
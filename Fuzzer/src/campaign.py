@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import base64
+import socket
+import hashlib
+import threading
+import socketserver
+from array import array
+
+import rng
+from cov_utils import covMap, to_cov
+
+""" Distributed campaign
+One coordinator (HSCFuzz.py --coordinate PORT) and any number of workers
+(HSCFuzz.py --coordinator HOST:PORT) exchange newline terminated JSON messages
+over TCP, every worker message is answered by exactly one reply:
+ hello {worker}               -> welcome {id, seed}
+ sync  {cov, corpus, leaks}   -> sync {cov, corpus, leaks}
+the sync request carries the coverage indices new to the worker, its new
+corpus entries and its leaks ({si, seed}) since its last sync, the reply
+the coverage indices and corpus entries the other workers contributed since
+then and, for every leak, whether it was not reported before. A corpus entry
+is {si, cov, new_bits, exec_time}, its coverage goes along so the receiving
+corpus rates it like one of its own.
+
+The coordinator keeps the coverage of the campaign, writes every corpus entry
+to <out>/corpus and every distinct leak (by content hash) to
+<out>/leaks/sim_input, with the adapter seed it was found under. A worker
+joining late starts from the whole campaign.
+"""
+
+def send_msg(wfile, msg):
+    wfile.write(json.dumps(msg).encode() + b'\n')
+    wfile.flush()
+
+def recv_msg(rfile):
+    line = rfile.readline()
+    if not line:
+        return None
+    return json.loads(line)
+
+def encode_blob(buf):
+    return base64.b64encode(buf).decode()
+
+def decode_blob(blob):
+    return base64.b64decode(blob)
+
+def blob_hash(buf):
+    return hashlib.blake2b(buf, digest_size=16).hexdigest()
+
+class campaignCoordinator():
+    def __init__(self, out, seed=None):
+        self.out = out
+        if seed is None:
+            seed = time.time_ns() & 0xffffffff
+        self.seed = seed
+
+        self.lock = threading.Lock()
+        self.coverage = covMap()
+        self.cov_log = array('I') # covered points, in the order they were reported
+        self.corpus = [] # (worker id, corpus entry)
+        self.leaks = {} # content hash -> worker id
+        self.cursors = {} # worker id -> (cov_log, corpus) positions already sent
+        self.workers = 0
+
+        self.cNum = len(os.listdir(out + '/corpus'))
+        self.lNum = len([ f for f in os.listdir(out + '/leaks/sim_input') if f.endswith('.si') ])
+        self.dupNum = 0
+
+    def save(self, name, buf):
+        fd = open(name, 'wb')
+        fd.write(buf)
+        fd.close()
+
+    def hello(self, msg):
+        with self.lock:
+            id = self.workers
+            self.workers += 1
+            self.cursors[id] = (0, 0)
+
+        # a worker's streams only depend on the campaign seed and its id
+        seed = rng.derive_seed(self.seed, 'worker{}'.format(id)) & 0xffffffff
+        print('[Coordinator] Worker {} ({}) joined, seed {}'.format(id, msg['worker'], seed))
+
+        return (id, { 'type': 'welcome', 'id': id, 'seed': seed })
+
+    def sync(self, id, msg):
+        own = to_cov(msg['cov'])
+
+        with self.lock:
+            self.cov_log.extend(self.coverage.merge(own))
+
+            for entry in msg['corpus']:
+                self.corpus.append((id, entry))
+                self.save(self.out + '/corpus/id_{}.si'.format(self.cNum), decode_blob(entry['si']))
+                self.cNum += 1
+
+            accepted = []
+            for leak in msg['leaks']:
+                buf = decode_blob(leak['si'])
+                key = blob_hash(buf)
+                if key in self.leaks:
+                    self.dupNum += 1
+                    accepted.append(False)
+                    continue
+
+                self.leaks[key] = id
+                self.save(self.out + '/leaks/sim_input/id_{}.si'.format(self.lNum), buf)
+                self.save(self.out + '/leaks/sim_input/id_{}.seed'.format(self.lNum), '{}\n'.format(leak['seed']).encode())
+                print('[Coordinator] Leak #{} from worker {}'.format(self.lNum, id))
+                self.lNum += 1
+                accepted.append(True)
+
+            (cov_pos, corpus_pos) = self.cursors[id]
+            own = set(own)
+            cov = [ idx for idx in self.cov_log[cov_pos:] if idx not in own ]
+            corpus = [ entry for (origin, entry) in self.corpus[corpus_pos:] if origin != id ]
+            self.cursors[id] = (len(self.cov_log), len(self.corpus))
+
+        return { 'type': 'sync', 'cov': cov, 'corpus': corpus, 'leaks': accepted }
+
+    def stats(self):
+        return '{} workers, {} cov_points, {} corpus entries, {} leaks ({} duplicates)'. \
+            format(self.workers, self.coverage.count(), len(self.corpus), len(self.leaks), self.dupNum)
+
+class campaignHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        coordinator = self.server.coordinator
+        id = None
+        while True:
+            msg = recv_msg(self.rfile)
+            if msg is None:
+                break
+
+            if msg['type'] == 'hello':
+                (id, reply) = coordinator.hello(msg)
+            else:
+                assert msg['type'] == 'sync' and id is not None, \
+                    'Unexpected {} message'.format(msg['type'])
+                reply = coordinator.sync(id, msg)
+
+            send_msg(self.wfile, reply)
+
+        if id is not None:
+            print('[Coordinator] Worker {} left'.format(id))
+
+class campaignServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, coordinator):
+        super().__init__(address, campaignHandler)
+        self.coordinator = coordinator
+
+class campaignClient():
+    def __init__(self, address, name=None):
+        (host, port) = address.rsplit(':', 1)
+        self.sock = socket.create_connection((host, int(port)))
+        self.rfile = self.sock.makefile('rb')
+        self.wfile = self.sock.makefile('wb')
+
+        if name is None:
+            name = '{}:{}'.format(socket.gethostname(), os.getpid())
+        reply = self.request({ 'type': 'hello', 'worker': name })
+        self.id = reply['id']
+        self.seed = reply['seed']
+
+        self.cov = []
+        self.corpus = []
+        self.leaks = []
+        self.last_sync = time.time()
+
+    def request(self, msg):
+        send_msg(self.wfile, msg)
+        reply = recv_msg(self.rfile)
+        assert reply is not None, 'Coordinator closed the connection'
+        return reply
+
+    def add_cov(self, new):
+        self.cov.extend(new)
+
+    def add_corpus(self, buf, cov, new_bits, exec_time):
+        self.corpus.append({ 'si': encode_blob(buf), 'cov': list(cov), 'new_bits': new_bits,
+                             'exec_time': exec_time })
+
+    def add_leak(self, seed, buf):
+        self.leaks.append({ 'si': encode_blob(buf), 'seed': seed })
+
+    def due(self, interval):
+        return time.time() - self.last_sync >= interval
+
+    def sync(self):
+        """ Sends everything added since the last sync, returns the coverage
+        indices and the corpus entries, as (.si contents, cov, new_bits,
+        exec_time), of the other workers and the leak verdicts
+        """
+        reply = self.request({ 'type': 'sync', 'cov': self.cov, 'corpus': self.corpus, 'leaks': self.leaks })
+        self.cov = []
+        self.corpus = []
+        self.leaks = []
+        self.last_sync = time.time()
+
+        corpus = [ (decode_blob(entry['si']), array('I', entry['cov']), entry['new_bits'], entry['exec_time'])
+                   for entry in reply['corpus'] ]
+
+        return (array('I', reply['cov']), corpus, reply['leaks'])
+
+    def close(self):
+        self.rfile.close()
+        self.wfile.close()
+        self.sock.close()
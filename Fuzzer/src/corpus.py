@@ -0,0 +1,141 @@
+import math
+import rng
+
+""" Corpus manager
+Keeps the seeds of the mutator with their metadata and schedules them:
+ - favored: AFL-style, for every coverage index the shortest seed (program
+   length) is its top rated seed, the favored set greedily covers all
+   indices seen so far with top rated seeds
+ - energy: favored seeds, seeds which contributed many new bits and short
+   seeds are chosen more often, seeds lose energy the more they are chosen
+ - eviction: a full corpus evicts a redundant seed (top rated for no index),
+   the one with the lowest energy, instead of the oldest one. If no seed is
+   redundant, the indices of the evicted one go to the best remaining seed
+   covering them
+
+The cost of a seed is its program length, not its exec_time: scheduling on
+wall-clock time would make a seeded campaign depend on the load of the
+machine. exec_time is only kept as metadata.
+"""
+
+FAVORED_FACTOR = 4
+MAX_ENERGY = 32
+
+class corpusEntry():
+    __slots__ = ('sim_input', 'cov', 'new_bits', 'exec_time', 'length',
+                 'num_top', 'favored', 'chosen')
+
+    def __init__(self, sim_input, cov, new_bits, exec_time):
+        self.sim_input = sim_input
+        self.cov = cov
+        self.new_bits = new_bits
+        self.exec_time = exec_time
+        self.length = sim_input.num_prefix + sim_input.num_words + sim_input.num_suffix
+
+        self.num_top = 0 # coverage indices for which this is the top rated seed
+        self.favored = False
+        self.chosen = 0
+
+    def fav_factor(self):
+        return self.length
+
+class corpusManager():
+    def __init__(self, max_size=1000):
+        self.max_size = max_size
+        self.entries = []
+        self.top_rated = {}
+        self.cull_needed = False
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, sim_input, cov=(), new_bits=0, exec_time=0):
+        entry = corpusEntry(sim_input, cov, new_bits, exec_time)
+        self.entries.append(entry)
+        self.rate(entry, cov)
+
+        if len(self.entries) > self.max_size:
+            self.evict()
+
+        return entry
+
+    def rate(self, entry, indices):
+        """ Makes entry the top rated seed of those indices it beats the current one for """
+        for idx in indices:
+            top = self.top_rated.get(idx)
+            if top is None or entry.fav_factor() < top.fav_factor():
+                if top is not None:
+                    top.num_top -= 1
+                self.top_rated[idx] = entry
+                entry.num_top += 1
+                self.cull_needed = True
+
+    def cull(self):
+        """ Greedily picks top rated seeds until every index seen is covered """
+        for entry in self.entries:
+            entry.favored = False
+
+        covered = set()
+        for (idx, entry) in self.top_rated.items():
+            if idx not in covered:
+                entry.favored = True
+                covered.update(entry.cov)
+
+        self.cull_needed = False
+
+    def avg_length(self):
+        if not self.entries:
+            return 0
+        return sum([ entry.length for entry in self.entries ]) / len(self.entries)
+
+    def energy(self, entry, avg_length):
+        energy = 1.0
+        if entry.favored:
+            energy *= FAVORED_FACTOR
+
+        energy *= 1 + math.log2(1 + entry.new_bits)
+
+        if avg_length:
+            if entry.length * 2 < avg_length:
+                energy *= 2
+            elif entry.length > avg_length * 2:
+                energy /= 2
+
+        energy /= 1 + entry.chosen / 8
+
+        return min(energy, MAX_ENERGY)
+
+    def choose(self):
+        assert self.entries, 'corpus is empty'
+
+        if self.cull_needed:
+            self.cull()
+
+        avg_length = self.avg_length()
+        weights = [ self.energy(entry, avg_length) for entry in self.entries ]
+
+        entry = rng.sched.choices(self.entries, weights)[0]
+        entry.chosen += 1
+
+        return entry.sim_input
+
+    def evict(self):
+        """ Drops the lowest energy seed, among the redundant ones if there are any """
+        if self.cull_needed:
+            self.cull()
+
+        avg_length = self.avg_length()
+        redundant = [ entry for entry in self.entries if entry.num_top == 0 ]
+        candidates = redundant if redundant else self.entries
+
+        victim = min(candidates, key=lambda entry: self.energy(entry, avg_length))
+        self.entries.remove(victim)
+
+        if victim.num_top:
+            # the remaining seeds covering its indices are rated again for them
+            orphans = set([ idx for idx in victim.cov if self.top_rated.get(idx) is victim ])
+            for idx in orphans:
+                self.top_rated.pop(idx)
+            for entry in self.entries:
+                self.rate(entry, orphans.intersection(entry.cov))
+            self.cull_needed = True
@@ -0,0 +1,97 @@
+"""
+Sparse coverage
+A test only reaches a few thousand of the 2^24 coverage points, so per test
+coverage is kept as a sorted array of the hit indices (uint32) and only the
+global map of the campaign is a full bitmap (covMap), or a byte map shared
+between processes (sharedCovMap).
+"""
+import os
+import mmap
+from array import array
+from itertools import repeat
+from bitarray import bitarray
+
+COV_SIZE = 2 ** 24 # UP
+
+assert array('I').itemsize == 4, 'array type I is not 32 bit on this platform'
+
+def to_cov(hits):
+    """ Turns an iterable of hit indices into a sparse coverage """
+    return array('I', sorted(set(hits)))
+
+def cov_from_bytes(cov_bytes):
+    cov = array('I')
+    cov.frombytes(cov_bytes)
+    return cov
+
+def save_cov(cov_name, cov):
+    fd = open(cov_name, 'wb')
+    cov.tofile(fd)
+    fd.close()
+
+def load_cov(cov_name):
+    fd = open(cov_name, 'rb')
+    cov = cov_from_bytes(fd.read())
+    fd.close()
+    return cov
+
+class covMap():
+    """ Coverage of the whole campaign, merging costs O(hits of the test) """
+    def __init__(self, size=COV_SIZE):
+        self.map = bitarray(repeat(0, size))
+        self.points = 0
+
+    def __contains__(self, idx):
+        return self.map[idx] == 1
+
+    def count(self):
+        return self.points
+
+    def new_points(self, cov):
+        return array('I', [ idx for idx in cov if not self.map[idx] ])
+
+    def merge(self, cov):
+        """ Adds a test's coverage and returns the indices which were not covered before """
+        new = self.new_points(cov)
+        for idx in new:
+            self.map[idx] = 1
+        self.points += len(new)
+        return new
+
+class sharedCovMap():
+    """ Coverage of a campaign shared between processes, a file backed mmap
+    with one byte per coverage point. Bytes only ever change from 0 to 1 and
+    a byte store is atomic, so merge() and the "is this new?" query need no
+    lock. Two processes merging the same point at the same time may both
+    report it as new, which costs at most a redundant corpus entry.
+    """
+    def __init__(self, path, size=COV_SIZE):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        self.mm = mmap.mmap(fd, size)
+        os.close(fd)
+
+        self.path = path
+        self.map = memoryview(self.mm)
+
+    def __contains__(self, idx):
+        return self.map[idx] == 1
+
+    def count(self):
+        """ Points covered by all processes, scans the whole map """
+        return bytes(self.map).count(1)
+
+    def new_points(self, cov):
+        return array('I', [ idx for idx in cov if not self.map[idx] ])
+
+    def merge(self, cov):
+        """ Adds a test's coverage and returns the indices which were not covered before """
+        new = self.new_points(cov)
+        for idx in new:
+            self.map[idx] = 1
+        return new
+
+    def close(self):
+        self.map.release()
+        self.mm.close()
@@ -0,0 +1,159 @@
+import struct
+
+""" ELF64 definitions """
+SHT_SYMTAB    = 0x2
+SHT_NOBITS    = 0x8
+
+SHF_WRITE     = 0x1
+SHF_ALLOC     = 0x2
+SHF_EXECINSTR = 0x4
+
+SHN_UNDEF     = 0x0
+SHN_ABS       = 0xfff1
+
+STB_LOCAL     = 0x0
+STB_WEAK      = 0x2
+
+STT_OBJECT    = 0x1
+STT_SECTION   = 0x3
+STT_FILE      = 0x4
+
+class elfSection():
+    __slots__ = ('name', 'tpe', 'flags', 'addr', 'offset', 'size', 'link')
+
+    def __init__(self, name, tpe, flags, addr, offset, size, link):
+        self.name = name
+        self.tpe = tpe
+        self.flags = flags
+        self.addr = addr
+        self.offset = offset
+        self.size = size
+        self.link = link
+
+    def loadable(self):
+        return (self.flags & SHF_ALLOC) and self.tpe != SHT_NOBITS and self.size > 0
+
+""" elfReader
+Reads the statically linked little-endian ELF64 test programs in-process,
+replacing the elf2hex and nm subprocesses of the preprocessor.
+"""
+class elfReader():
+    def __init__(self, elf_name):
+        fd = open(elf_name, 'rb')
+        self.data = fd.read()
+        fd.close()
+
+        assert self.data[:4] == b'\x7fELF' and self.data[4] == 2 and self.data[5] == 1, \
+            '{} is not a little-endian ELF64 file'.format(elf_name)
+
+        (shoff,) = struct.unpack_from('<Q', self.data, 0x28)
+        (shentsize, shnum, shstrndx) = struct.unpack_from('<HHH', self.data, 0x3a)
+
+        headers = [ struct.unpack_from('<IIQQQQIIQQ', self.data, shoff + i * shentsize)
+                    for i in range(shnum) ]
+        strtab = headers[shstrndx][4]
+
+        self.sections = []
+        for (name, tpe, flags, addr, offset, size, link, _, _, _) in headers:
+            self.sections.append(elfSection(self.get_str(strtab, name), tpe, flags,
+                                            addr, offset, size, link))
+
+    def get_str(self, strtab, idx):
+        end = self.data.index(b'\x00', strtab + idx)
+        return self.data[strtab + idx:end].decode()
+
+    def get_section(self, addr):
+        for section in self.sections:
+            if section.loadable() and section.addr <= addr < section.addr + section.size:
+                return section
+
+        return None
+
+    def get_image(self):
+        """ Memory image of all loaded sections, as objcopy -O binary """
+        sections = [ section for section in self.sections if section.loadable() ]
+        base = min([ section.addr for section in sections ])
+        end = max([ section.addr + section.size for section in sections ])
+
+        image = bytearray(end - base)
+        for section in sections:
+            start = section.addr - base
+            image[start:start + section.size] = \
+                self.data[section.offset:section.offset + section.size]
+
+        return (base, image)
+
+    def get_hex(self, bit_width=64):
+        """ Hex lines of the memory image, as elf2hex --bit-width """
+        width = bit_width // 8
+        (_, image) = self.get_image()
+        image += bytes(-len(image) % width)
+
+        return [ image[i:i + width][::-1].hex() + '\n' for i in range(0, len(image), width) ]
+
+    def write_hex(self, hex_name, bit_width=64):
+        fd = open(hex_name, 'w')
+        fd.writelines(self.get_hex(bit_width))
+        fd.close()
+
+    def get_nm_type(self, bind, tpe, shndx):
+        if shndx == SHN_ABS:
+            char = 'a'
+        elif shndx >= len(self.sections):
+            char = '?'
+        else:
+            section = self.sections[shndx]
+            if section.flags & SHF_EXECINSTR: char = 't'
+            elif section.tpe == SHT_NOBITS: char = 'b'
+            elif section.flags & SHF_WRITE: char = 'd'
+            elif section.flags & SHF_ALLOC: char = 'r'
+            else: char = 'n'
+
+        if bind == STB_WEAK:
+            return 'V' if tpe == STT_OBJECT else 'W'
+        if bind == STB_LOCAL:
+            return char
+
+        return char.upper()
+
+    def get_symbols(self):
+        """ Defined symbols as (address, nm type, name), sorted by name as nm does """
+        symbols = []
+        for symtab in [ section for section in self.sections if section.tpe == SHT_SYMTAB ]:
+            strtab = self.sections[symtab.link].offset
+            for offset in range(symtab.offset + 24, symtab.offset + symtab.size, 24):
+                (name, info, _, shndx, value, _) = struct.unpack_from('<IBBHQQ', self.data, offset)
+                bind = info >> 4
+                tpe = info & 0xf
+
+                if shndx == SHN_UNDEF or tpe in [ STT_SECTION, STT_FILE ]:
+                    continue
+
+                symbols.append((value, self.get_nm_type(bind, tpe, shndx), self.get_str(strtab, name)))
+
+        return sorted(symbols, key=lambda symbol: symbol[2])
+
+    def write_symbols(self, sym_name):
+        symbols = self.get_symbols()
+
+        fd = open(sym_name, 'w')
+        for (value, tpe, name) in symbols:
+            fd.write('{:016x} {} {}\n'.format(value, tpe, name))
+        fd.close()
+
+        return dict([ (name, value) for (value, _, name) in symbols ])
+
+    def write_patched(self, elf_name, patches):
+        """ Writes a copy of the ELF with the memory at each (address, bytes) patch replaced """
+        data = bytearray(self.data)
+        for (addr, patch) in patches:
+            section = self.get_section(addr)
+            assert section and addr + len(patch) <= section.addr + section.size, \
+                'patch at {:016x} is not inside one loaded section'.format(addr)
+
+            offset = section.offset + addr - section.addr
+            data[offset:offset + len(patch)] = patch
+
+        fd = open(elf_name, 'wb')
+        fd.write(data)
+        fd.close()
@@ -1,5 +1,5 @@
 import os
-import random
+import rng
 
 from riscv_definitions import *
 from word import *
@@ -75,23 +75,23 @@ class rvInstGenerator():
         self.used_imms = set([])
 
     def _get_xregs(self, region=(0, 31), no_zero=False, thres=0.2):
-        if region == (0, 31) and len(self.used_xNums) > 0 and random.random() < thres:
-            xNum = random.choice(list(self.used_xNums))
+        if region == (0, 31) and len(self.used_xNums) > 0 and rng.inst.random() < thres:
+            xNum = rng.inst.choice(list(self.used_xNums))
         else:
-            xNum = random.choice(self.xNums[region[0]:region[1]])
+            xNum = rng.inst.choice(self.xNums[region[0]:region[1]])
             used_xNums = list(self.used_xNums) + [ xNum ]
             self.used_xNums = set(used_xNums)
 
         if no_zero and xNum == 0:
-            xNum = random.choice(list(self.xNums)[1:])
+            xNum = rng.inst.choice(list(self.xNums)[1:])
 
         return 'x' + str(xNum)
 
     def _get_fregs(self, thres=0.2):
-        if len(self.used_fNums) > 0 and random.random() < thres:
-            fNum = random.choice(list(self.used_fNums))
+        if len(self.used_fNums) > 0 and rng.inst.random() < thres:
+            fNum = rng.inst.choice(list(self.used_fNums))
         else:
-            fNum = random.choice(self.fNums)
+            fNum = rng.inst.choice(self.fNums)
             used_fNums = list(self.used_fNums) + [ fNum ]
             self.used_fNums = set(used_fNums)
         return 'f' + str(fNum)
@@ -102,12 +102,12 @@ class rvInstGenerator():
             sign = ''
             width = int(iName[4:])
         else:
-            sign = random.choice(['', '-'])
+            sign = rng.inst.choice(['', '-'])
             width = int(iName[3:]) - 1
 
         mask = (1 << width) - 1
 
-        rand = random.random()
+        rand = rng.inst.random()
         if rand < alignthres:
             align_mask = ~(align - 1)
         else:
@@ -115,39 +115,39 @@ class rvInstGenerator():
 
         mask = mask & align_mask
 
-        rand = random.random()
+        rand = rng.inst.random()
         if len(self.used_imms) > 0 and rand < thres:
-            imm = random.choice(list(self.used_imms))
+            imm = rng.inst.choice(list(self.used_imms))
             return sign + str(mask & imm)
         elif rand < thres + zfthres:
-            imm = random.choice([ 0x0, 0xffffffff ])
+            imm = rng.inst.choice([ 0x0, 0xffffffff ])
             return sign + str(mask & imm)
         else:
-            imm = random.randint(0, mask)
+            imm = rng.inst.randint(0, mask)
             used_imms = list(self.used_imms) + [ imm ]
             self.used_imms = set(used_imms)
             return sign + str(mask & imm)
 
     def _get_symbol(self, tpe, my_label, max_label, part):
         if tpe == MEM_W:
-            n = random.randint(0, 5) # TODO, num_mem_sections = 6
-            k = random.randint(0, 27)
+            n = rng.inst.randint(0, 5) # TODO, num_mem_sections = 6
+            k = rng.inst.randint(0, 27)
             symbol = 'd_' + str(n) + '_' + str(k)
         elif tpe == MEM_R:
-            rand = random.random()
+            rand = rng.inst.random()
             if rand < 0.2:
-                n = random.randint(0, max_label)
+                n = rng.inst.randint(0, max_label)
                 symbol = part + str(n)
             else:
-                n = random.randint(0, 5)
-                k = random.randint(0, 27)
+                n = rng.inst.randint(0, 5)
+                k = rng.inst.randint(0, 27)
                 symbol = 'd_' + str(n) + '_' + str(k)
         else:
             if tpe in [ CF_J, CF_RET ]:
-                num = random.randint(my_label + 1, max_label)
+                num = rng.inst.randint(my_label + 1, max_label)
                 symbol = part + str(num)
             else:
-                num = random.randint(my_label + 1, max_label)
+                num = rng.inst.randint(my_label + 1, max_label)
                 symbol = part + str(num)
 
         return symbol
@@ -157,15 +157,15 @@ class rvInstGenerator():
     """
     def get_word(self, part):
         if part == PREFIX:
-            opcode = random.choice(list(rv_zicsr.keys()))
+            opcode = rng.inst.choice(list(rv_zicsr.keys()))
             label_num = self.prefix_num
             self.prefix_num += 1
         elif part == MAIN:
-            opcode = random.choice(self.opcodes)
+            opcode = rng.inst.choice(self.opcodes)
             label_num = self.main_num
             self.main_num += 1
         else: # SUFFIX
-            opcode = random.choice(self.opcodes)
+            opcode = rng.inst.choice(self.opcodes)
             label_num = self.suffix_num
             self.suffix_num += 1
 
@@ -7,6 +7,8 @@ import cocotb
 from cocotb.decorators import coroutine
 from cocotb.triggers import RisingEdge, Timer
 
+from cov_utils import sharedCovMap
+
 NORMAL          = 0
 ERR_COMPILE     = 1
 ERR_HSC_ASSERT  = 2
@@ -52,12 +54,12 @@ class procManager():
         self.cNum = len(os.listdir(out + '/corpus'))
 
         self.num_cores = multicore
+        self.cov_map = sharedCovMap(out + '/covmap.shm')
        
         self.mNum_shm = None
         self.cNum_shm = None
         self.mNum_sem = None
         self.cNum_sem = None
-        self.covMap_sem = None
         self.proc_states = None
         self.state_sem = None
 
@@ -68,7 +70,6 @@ class procManager():
                 self.cNum_shm = ipc.SharedMemory(key, ipc.IPC_CREX, 0x01b4, ipc.PAGE_SIZE)
                 self.mNum_sem = ipc.Semaphore(key+3, ipc.IPC_CREX, 0x01b4, 0)
                 self.cNum_sem = ipc.Semaphore(key+2, ipc.IPC_CREX, 0x01b4, 0)
-                self.covMap_sem = ipc.Semaphore(key+4, ipc.IPC_CREX, 0x01b4, 1)
                 self.proc_states = ipc.SharedMemory(key+5, ipc.IPC_CREX, 0x01b4, ipc.PAGE_SIZE)
                 self.state_sem = ipc.Semaphore(key+6, ipc.IPC_CREX, 0x01b4, 1)
             except ipc.ExistentialError:
@@ -76,7 +77,6 @@ class procManager():
                 self.delete_ipc(self.mNum_shm)
                 self.delete_ipc(self.cNum_sem)
                 self.delete_ipc(self.mNum_sem)
-                self.delete_ipc(self.covMap_sem)
             else:
                 break
 
@@ -116,8 +116,8 @@ class procManager():
         self.cNum_shm.remove()
         self.mNum_sem.remove()
         self.cNum_sem.remove()
-        self.covMap_sem.remove()
         self.proc_states.remove()
+        self.cov_map.close()
 
 
     def read_num(self, name):
@@ -139,56 +139,33 @@ class procManager():
         sem.V()
 
     def P(self, name):
-        assert name in ['mNum', 'cNum', 'covMap', 'state'], \
-            '{} is not mNum/cNum/covMap/state'
+        assert name in ['mNum', 'cNum', 'state'], \
+            '{} is not mNum/cNum/state'
 
         sem = getattr(self, name + '_sem')
         sem.P()
 
     def V(self, name):
-        assert name in ['mNum', 'cNum', 'covMap', 'state'], \
-            '{} is not mNum/cNum/covMap/state'
+        assert name in ['mNum', 'cNum', 'state'], \
+            '{} is not mNum/cNum/state'
 
         sem = getattr(self, name + '_sem')
         sem.V()
 
-    def store_covmap(self, proc_num, start_time, start_iter, num_iter):
-        self.covMap_sem.P()
-        cov_sum = 0
-        cov_files = []
-        covmaps = os.listdir(self.out + '/covmap-{:02}'.format(proc_num))
-
-        for cov_file in covmaps:
-            cov_map = [ 0 for i in
-                        range(os.path.getsize(self.out + '/covmap-{:02}/{}'.
-                                              format(proc_num, cov_file)))]
-            if os.path.isfile(self.out + '/covmap/{}'.format(cov_file)):
-                fd = open(self.out + '/covmap/{}'.format(cov_file), 'r')
-                line = fd.readline()
-                fd.close()
-
-                for n in range(len(cov_map)):
-                    cov_map[n] = int(line[n])
-
-            fd = open(self.out + '/covmap-{:02}/{}'.format(proc_num, cov_file), 'r')
-            line = fd.readline()
-            fd.close()
-
-            for n in range(len(cov_map)):
-                cov_map[n] = cov_map[n] | int(line[n])
-                cov_sum = cov_sum + cov_map[n]
-
-            cov_string = ''.join(str(e) for e in cov_map)
-            fd = open(self.out + '/covmap/{}'.format(cov_file), 'w')
-            fd.write(cov_string)
+    def store_covmap(self, cov, start_time, num_iter):
+        """ Merges a test's sparse coverage into the shared map, logs the
+        coverage of all processes when it grew and returns the new indices
+        """
+        new = self.cov_map.merge(cov)
+
+        if new:
+            elapsed_time = time.time() - start_time
+            fd = open(self.cov_log, 'a')
+            fd.write('{:<10}\t{:<10}\t{:<10}\n'.
+                     format(elapsed_time, num_iter, self.cov_map.count()))
             fd.close()
 
-        elapsed_time = time.time() - start_time
-        fd = open(self.cov_log, 'a')
-        fd.write('{:<10}\t{:<10}\t{:<10}\n'.
-                 format(elapsed_time, start_iter + num_iter, cov_sum))
-        fd.close()
-        self.covMap_sem.V()
+        return new
 
     @coroutine
     def clock_gen(self, clock, period=2):
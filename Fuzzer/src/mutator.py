@@ -1,9 +1,13 @@
 import os
-import random
-from copy import deepcopy
-from Config import DATA_EQ_REGISTERS, DATA_GUIDANCE, DATA_50_50
+import hashlib
+import rng
+from array import array
+from collections import OrderedDict
+from Config import DATA_EQ_REGISTERS, DATA_GUIDANCE, DATA_50_50, SI_BINARY, MAX_DATA_SEEDS
 
 from inst_generator import Word, rvInstGenerator, PREFIX, MAIN, SUFFIX
+from corpus import corpusManager
+from si_format import load_si, parse_si, save_si, encode_si, templates, P_M, P_S, P_U, V_U
 
 #TODO adapt mutator to new data generation -> two executables/data sections/ change si file configuration, importance of data sections higher here
 
@@ -12,19 +16,38 @@ GENERATION = 0
 MUTATION   = 1
 MERGE      = 2
 
-""" Template versions """
-P_M = 0
-P_S = 1
-P_U = 2
+""" Data seeds
+data_a/data_b are array('Q') of DATA_WORDS words, generated as whole
+buffers from one rng.data.getrandbits call each. In the 50/50 mode every b word from
+start on is replaced by a fresh random word with probability 0.5, selected by
+a per-word byte mask expanded to a 64 bit lane mask
+"""
+DATA_WORDS = 64 * 6 # TODO, Num_data_sections = 6
+SELECT_50_50 = bytes(128) + b'\xff' * 128
 
-# V_M = 3
-# V_S = 3
-V_U = 3
+def random_words(num):
+    return array('Q', rng.data.getrandbits(64 * num).to_bytes(8 * num, 'little'))
 
-templates = [ 'p-m', 'p-s', 'p-u',
-              'v-u']
+def random_data_pair(eq_50_50, start, num=DATA_WORDS):
+    a = random_words(num)
+    if not eq_50_50:
+        return (a, random_words(num))
+
+    fresh = random_words(num)
+    select = bytearray(rng.data.getrandbits(8 * num).to_bytes(num, 'little').translate(SELECT_50_50))
+    select[:start] = bytes(start)
+    lanes = int.from_bytes(array('q', array('b', select)).tobytes(), 'little')
+
+    a_bits = int.from_bytes(a.tobytes(), 'little')
+    fresh_bits = int.from_bytes(fresh.tobytes(), 'little')
+    b_bits = (a_bits & ~lanes) | (fresh_bits & lanes)
+
+    return (a, array('Q', b_bits.to_bytes(8 * num, 'little')))
 
 class simInput():
+    __slots__ = ('prefix', 'words', 'suffix', 'ints', 'num_prefix', 'num_words',
+                 'num_suffix', 'data_seed', 'template')
+
     def __init__(self, prefix: list, words: list, suffix: list, ints: list, data_seed: int, template: int):
         self.prefix = prefix
         self.words = words
@@ -38,33 +61,34 @@ class simInput():
         self.data_seed = data_seed
         self.template = template
 
-    def save(self, name, data=[]):
-        prefix_insts = self.get_prefix()
-        insts = self.get_insts()
-        suffix_insts = self.get_suffix()
-
-        fd = open(name, 'w')
-        fd.write('{}\n\n'.format(templates[self.template]))
-
-        for inst in prefix_insts[:-1]:
-            fd.write('{:<50}\n'.format(inst))
-
-        for (inst, INT) in zip(insts, self.ints):
-            fd.write('{:<50}{:04b}\n'.format(inst, INT))
-
-        for inst in suffix_insts[:-1]:
-            fd.write('{:<50}\n'.format(inst))
-
+    def parts(self):
+        parts = []
+        for words in [ self.prefix, self.words, self.suffix ]:
+            parts.append([ (word.label, [ inst[8:].rstrip() for inst in word.get_insts() ])
+                           for word in words ])
+        return parts
+
+    def save(self, name, data=[], binary=SI_BINARY):
+        save_si(name, self.template, self.parts(), self.ints, data, binary)
+
+    def dump(self, data=[]):
+        """ The binary .si file contents """
+        return encode_si(self.template, self.parts(), self.ints, data)
+
+    def content_hash(self, data=None):
+        """ Hash of everything a simulation depends on: template, populated
+        instructions, interrupts and the contents (not the id) of the data seed
+        """
+        h = hashlib.blake2b(digest_size=16)
+        h.update(templates[self.template].encode())
+        for inst in self.get_prefix() + self.get_insts() + self.get_suffix():
+            h.update(inst.rstrip().encode() + b'\n')
+        h.update(bytes(self.ints))
         if data:
-            (a, b) = data
-            fd.write('data_a:\n')
-            for word in a:
-                fd.write('{:016x}\n'.format(word))
-            fd.write('data_b:\n')
-            for word in b:
-                fd.write('{:016x}\n'.format(word))
+            for words in data:
+                h.update(array('Q', words).tobytes())
 
-        fd.close()
+        return h.hexdigest()
 
     def get_seed(self):
         return self.data_seed
@@ -98,9 +122,9 @@ class simInput():
 
 
 class rvMutator():
-    def __init__(self, isa='RV64I', max_data_seeds=100, corpus_size=1000, no_guide=False):
+    def __init__(self, isa='RV64I', max_data_seeds=MAX_DATA_SEEDS, corpus_size=1000, no_guide=False):
         self.corpus_size = corpus_size
-        self.corpus = []
+        self.corpus = corpusManager(corpus_size)
 
         self.phases = [GENERATION, MUTATION, MERGE]
         self.phase = GENERATION
@@ -114,36 +138,26 @@ class rvMutator():
 
         self.max_data = max_data_seeds
         self.random_data = {}
-        self.data_seeds = []
+        self.data_seeds = OrderedDict() # LRU of data seeds, least recently used first
         self.seed_energy = {}
 
         self.inst_generator = rvInstGenerator(isa)
 
     def add_data(self, new_data=([],[])): #TODO config seq-ct or seq-arch and random or 50-50 approach
         if len(self.data_seeds) == self.max_data:
-            seed = self.data_seeds.pop(0)
+            (seed, _) = self.data_seeds.popitem(last=False)
+            self.seed_energy.pop(seed, None)
         else:
             seed = len(self.data_seeds)
 
-        if new_data[0] and new_data[1]:
+        if len(new_data[0]) and len(new_data[1]):
             self.random_data[seed] = new_data
         else:
-            rand = random.random()
-            if rand < 0.5 or not DATA_50_50:
-                self.random_data[seed] =   ([random.randint(0, 0xffffffffffffffff) for i in range(64 * 6)],
-                                            [random.randint(0, 0xffffffffffffffff) for i in range(64 * 6)]) # TODO, Num_data_sections = 6
-            else:
-                a = [random.randint(0, 0xffffffffffffffff) for i in range(64 * 6)]
-                b = a.copy()
-                
-                start = 32 if DATA_EQ_REGISTERS else 0
-                for i in range(start, len(a)):
-                    rand = random.random()
-                    if rand < 0.5:
-                        b[i] = random.randint(0, 0xffffffffffffffff)
-
-                self.random_data[seed] = (a ,b)
-        self.data_seeds.append(seed)
+            rand = rng.data.random()
+            eq_50_50 = DATA_50_50 and rand >= 0.5
+            start = 32 if DATA_EQ_REGISTERS else 0
+            self.random_data[seed] = random_data_pair(eq_50_50, start)
+        self.data_seeds[seed] = None
 
         return seed
     
@@ -162,38 +176,15 @@ class rvMutator():
             print("seed {} succeeded and upgraded to {}".format(seed, self.seed_energy[seed]))
 
     def update_data_seeds(self, seed):
-        assert self.data_seeds.count(seed) == 1, \
-            '{} entrie(s) of {} exist in Mutator data_seeds'. \
-            format(self.data_seeds.count(seed), seed)
+        assert seed in self.data_seeds, \
+            '{} does not exist in Mutator data_seeds'.format(seed)
 
-        idx = self.data_seeds.index(seed)
-        self.data_seeds.pop(idx)
-        self.data_seeds.append(seed)
+        self.data_seeds.move_to_end(seed)
 
     def refresh_seed(self, seed):
         self.seed_energy[seed] = 0
-        rand = random.random()
-        if rand < 0.5:
-            self.random_data[seed] =   ([random.randint(0, 0xffffffffffffffff) for i in range(64 * 6)],
-                                        [random.randint(0, 0xffffffffffffffff) for i in range(64 * 6)]) # TODO, Num_data_sections = 6
-        else:
-            a = [random.randint(0, 0xffffffffffffffff) for i in range(64 * 6)]
-            b = a.copy()
-            for i in range(32, len(a)):
-                rand = random.random()
-                if rand < 0.5:
-                    b[i] = random.randint(0, 0xffffffffffffffff)
-
-            self.random_data[seed] = (a ,b)
-
-    def read_label(self, line, tuples):
-        label = line[:8].split(':')[0]
-        label_num = int(label[2:])
-
-        insts = []
-        tuples.append((label_num, insts))
-
-        return tuples
+        rand = rng.data.random()
+        self.random_data[seed] = random_data_pair(rand >= 0.5, 32)
 
     def tuples_to_words(self, tuples, part):
         words = []
@@ -210,71 +201,13 @@ class rvMutator():
         return words
 
     def read_siminput(self, si_name):
-        fd = open(si_name, 'r')
-        lines = fd.readlines()
-        fd.close()
-
-        ints = []
-        prefix_tuples = []
-        word_tuples = []
-        suffix_tuples = []
-        data = ([],[])
-
-        num_prefix = 0
-        num_word = 0
-        num_suffix = 0
-
-        part = None
-        tmp_tuples = None
-        num_tmp = None
-
-        template_word = lines.pop(0).split('\n')[0]
-        template = templates.index(template_word)
-        lines.pop(0)
-        while True:
-            try: line = lines.pop(0)
-            except: break
-
-            if 'data_a:' in line:
-                part = None
-                while True:
-                    try: word = lines.pop(0)
-                    except: break
-                    if not 'data_b:' in word:
-                        data[0].append(int(word, 16))
-                    else:
-                        while True:
-                            try: word = lines.pop(0)
-                            except: break
-                            data[1].append(int(word, 16))
-                        break
-                break
-            elif line[:2] == PREFIX:
-                part = PREFIX
-                num_prefix += 1
-                tmp_tuples = self.read_label(line, prefix_tuples)
-                num_tmp = num_prefix
-
-                tmp_tuples[num_tmp - 1][1].append(line[8:50])
-            elif line[:2] == MAIN:
-                part = MAIN
-                num_word += 1
-                tmp_tuples = self.read_label(line, word_tuples)
-                num_tmp = num_word
-               
-                tmp_tuples[num_tmp - 1][1].append(line[8:50])
-            elif line[:2] == SUFFIX:
-                part = SUFFIX
-                num_suffix += 1
-                tmp_tuples = self.read_label(line, suffix_tuples)
-                num_tmp = num_suffix
-
-                tmp_tuples[num_tmp - 1][1].append(line[8:50])
-            else:
-                tmp_tuples[num_tmp - 1][1].append(line[8:50])
+        return self.build_siminput(load_si(si_name))
+
+    def parse_siminput(self, buf):
+        return self.build_siminput(parse_si(buf))
 
-            if part == MAIN:
-                ints.append(int(line[-5:-1], 2))
+    def build_siminput(self, si):
+        (template, (prefix_tuples, word_tuples, suffix_tuples), ints, data) = si
 
         prefix = self.tuples_to_words(prefix_tuples, PREFIX)
         words = self.tuples_to_words(word_tuples, MAIN)
@@ -349,8 +282,7 @@ class rvMutator():
             tmps = []
             for word in target:
                 if word.insts != ['nop']:
-                    new_word = deepcopy(word)
-                    tmps.append(new_word)
+                    tmps.append(word)
 
                 if part == MAIN:
                     if word.insts != ['nop']:
@@ -372,33 +304,31 @@ class rvMutator():
         start = max(num_files - update_num, 0)
         for i in range(start, num_files):
             try:
-                (sim_input, _) = self.read_siminput(corpus_dir +
-                                                    '/id_{}.si'.format(i))
+                (sim_input, _, _) = self.read_siminput(corpus_dir +
+                                                       '/id_{}.si'.format(i))
                 self.add_corpus(sim_input)
             except:
                 continue
 
     def reset_labels(self, words, part):
-        n = 0
-
+        # words may be shared with the corpus, relabeled ones are replaced
         label_map = {}
+        new_words = []
         for (n, word) in enumerate(words):
-            tup = word.reset_label(n, part)
+            (new_word, tup) = word.reset_label(n, part)
             if tup:
                 label_map[tup[0]] = tup[1]
+            new_words.append(new_word)
 
-        max_label = len(words)
+        max_label = len(new_words)
 
-        for word in words:
-            word.repop_label(label_map, max_label, part)
-
-        return words
+        return [ word.repop_label(label_map, max_label, part) for word in new_words ]
 
     def mutate_words(self, seed_words, part, max_num):
         words = []
 
         for word in seed_words:
-            rand = random.random()
+            rand = rng.sched.random()
             if rand < 0.5:
                 words.append(word)
             elif rand < 0.75:
@@ -434,22 +364,22 @@ class rvMutator():
 
         elif self.phase in [ MUTATION, MERGE ]:
             if self.phase == MUTATION:
-                seed_si = random.choice(self.corpus)
-                seed_prefix = deepcopy(seed_si.prefix)
-                seed_words = deepcopy(seed_si.words)
-                seed_suffix = deepcopy(seed_si.suffix)
+                seed_si = self.corpus.choose()
+                seed_prefix = seed_si.prefix
+                seed_words = seed_si.words
+                seed_suffix = seed_si.suffix
                 data_seed = seed_si.get_seed()
                 template = seed_si.get_template()
             else:
                 seed_words = []
-                seed_si1 = random.choice(self.corpus)
-                seed_si2 = random.choice(self.corpus)
-
-                seed_prefix = deepcopy(seed_si1.prefix)
-                si1_words = deepcopy(seed_si1.words)
-                si2_words = deepcopy(seed_si2.words)
-                seed_suffix = deepcopy(seed_si1.suffix)
-                idx = random.randint(0, min(len(si1_words),
+                seed_si1 = self.corpus.choose()
+                seed_si2 = self.corpus.choose()
+
+                seed_prefix = seed_si1.prefix
+                si1_words = seed_si1.words
+                si2_words = seed_si2.words
+                seed_suffix = seed_si1.suffix
+                idx = rng.sched.randint(0, min(len(si1_words),
                                             len(si2_words)))
 
                 for i in range(idx):
@@ -476,8 +406,8 @@ class rvMutator():
 
         ints = [ 0 for i in range(i_len) ]
         if assert_intr:
-            idx = random.randint(0, min(len(ints), 10) - 1)
-            INT = random.randint(0x1, 0xf)
+            idx = rng.sched.randint(0, min(len(ints), 10) - 1)
+            INT = rng.sched.randint(0x1, 0xf)
             ints[idx] = INT
 
         if data_seed == -1:
@@ -486,7 +416,7 @@ class rvMutator():
             self.update_data_seeds(data_seed)
 
         if template == -1:
-            template = random.randint(0, P_U) #V_U)
+            template = rng.sched.randint(0, P_U) #V_U)
 
         sim_input = simInput(prefix, words, suffix, ints, data_seed, template)
         data = self.random_data[data_seed]
@@ -497,7 +427,7 @@ class rvMutator():
         if it < self.corpus_size / 10 or self.no_guide:
             self.phase = GENERATION
         else:
-            rand = random.random()
+            rand = rng.sched.random()
             if rand < 0.1:
                 self.phase = GENERATION
             elif rand < 0.55:
@@ -505,9 +435,7 @@ class rvMutator():
             else:
                 self.phase = MERGE
 
-    def add_corpus(self, sim_input):
-        self.corpus.append(sim_input)
+    def add_corpus(self, sim_input, cov=(), new_bits=0, exec_time=0):
+        self.corpus.add(sim_input, cov, new_bits, exec_time)
 
         self.num_words = min(self.num_words + 1, self.max_nWords)
-        if len(self.corpus) > self.corpus_size:
-            self.corpus.pop(0)
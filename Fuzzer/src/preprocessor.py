@@ -1,28 +1,66 @@
 import os
+import re
 import subprocess
 import shutil
 import random
+import struct
 
 from HSCSim.host import hscInput
+from elf_reader import elfReader
 from RTLSim.host import rtlInput
 from mutator import simInput, templates, P_M, P_S, P_U, V_U
+from word import PREFIX, MAIN, SUFFIX
+
+""" Split link
+Inputs of the preprocessed templates are not assembled with the whole
+template. The template is assembled once into an object, in which the
+.text.init code following each fuzzed code region starts a section of its
+own and the data sections hold placeholders. Per input only the fuzzed
+code is assembled, each region in a section together with the template
+lines that have to follow it without padding (glue: up to the next
+alignment or section change), and linked against the template object. The
+link script orders the sections as in the template and pads with nops like
+the assembler does. The data sections are then patched into the linked
+binary.
+
+Labels that are referenced across the two objects are made global, so their
+nm types in the .symbols file are upper case. Before it is used, the split
+link of a template is checked against a full compile of the template with
+empty fuzzed regions. If that differs, inputs of the template are
+assembled as a whole.
+"""
+
+ALIGN_DIRECTIVES = [ '.align', '.p2align', '.balign', '.org' ]
+SECTION_DIRECTIVES = [ '.section', '.text', '.data', '.bss', '.previous', '.pushsection', '.popsection' ]
+NOP_FILL = '0x13000000' # addi x0, x0, 0 in the byte order of a link script fill pattern
 
 class rvPreProcessor():
-    def __init__(self, cc, elf2hex, template='Template', out_base ='.', proc_num=0):
+    def __init__(self, cc, elf2hex, template='Template', out_base ='.', proc_num=0, in_process=True, cross_check=False):
         self.cc = cc
         self.elf2hex = elf2hex
         self.template = template
         self.base = out_base
         self.proc_num = proc_num
 
+        # in_process: hex and symbols are read from the ELF by elfReader instead of elf2hex and nm
+        # cross_check: additionally run elf2hex and nm and compare their outputs
+        self.in_process = in_process
+        self.cross_check = cross_check
+
         self.er_num = 0
-        self.cc_args = [ cc, '-march=rv64g', '-mabi=lp64', '-static', '-mcmodel=medany',
-                         '-fvisibility=hidden', '-nostdlib', '-nostartfiles',
-                         '-I', '{}/include'.format(template),
-                         '-T', '{}/include/link.ld'.format(template) ]
+        self.link_script = '{}/include/link.ld'.format(template)
+        self.cc_flags = [ cc, '-march=rv64g', '-mabi=lp64', '-static', '-mcmodel=medany',
+                          '-fvisibility=hidden', '-nostdlib', '-nostartfiles',
+                          '-I', '{}/include'.format(template) ]
+        self.cc_args = self.cc_flags + [ '-T', self.link_script ]
 
         self.elf2hex_args = [ elf2hex, '--bit-width', '64', '--input' ]
 
+        # (version, args) -> template split at the fuzzed regions
+        self.template_cache = {}
+        # (version, args, section size) -> (template object, link script, glues, glue labels), None if not split
+        self.link_cache = {}
+
     def get_symbols(self, elf_name, sym_name):
         # symbol_file = self.base + '/.input.symbols'
         fd = open(sym_name, 'w')
@@ -41,6 +79,53 @@ class rvPreProcessor():
 
         return symbols
 
+    def get_hex_symbols(self, elf_name, hex_name, sym_name):
+        if not self.in_process:
+            elf2hex_args = self.elf2hex_args + [ elf_name, '--output', hex_name]
+            subprocess.call(elf2hex_args)
+            return self.get_symbols(elf_name, sym_name)
+
+        reader = elfReader(elf_name)
+        reader.write_hex(hex_name)
+        symbols = reader.write_symbols(sym_name)
+
+        if self.cross_check:
+            elf2hex_args = self.elf2hex_args + [ elf_name, '--output', hex_name + '.check' ]
+            subprocess.call(elf2hex_args)
+            nm_symbols = self.get_symbols(elf_name, sym_name + '.check')
+
+            fd = open(hex_name + '.check', 'r')
+            nm_hex = fd.readlines()
+            fd.close()
+
+            assert nm_hex == reader.get_hex(), \
+                'elfReader hex of {} differs from elf2hex'.format(elf_name)
+            assert nm_symbols == symbols, \
+                'elfReader symbols of {} differ from nm'.format(elf_name)
+
+            os.remove(hex_name + '.check')
+            os.remove(sym_name + '.check')
+
+        return symbols
+
+    def patch_data(self, elf_name_a, elf_name_b, symbols, data_b, num_data_sections, section_size):
+        """ Derives the b binary from the a binary by writing data_b to the
+        _random_dataN sections, the only part in which they differ. Also
+        fills the placeholder data of a split link binary.
+        """
+        patches = []
+        for n in range(num_data_sections):
+            data_start = symbols['_random_data{}'.format(n)]
+            data_end = symbols['_end_data{}'.format(n)]
+            assert data_end - data_start == 8 * section_size, \
+                '_random_data{} does not hold {} dwords'.format(n, section_size)
+
+            start = n * section_size
+            patches.append((data_start, struct.pack('<{}Q'.format(section_size),
+                                                    *data_b[start:start + section_size])))
+
+        elfReader(elf_name_a).write_patched(elf_name_b, patches)
+
     def write_isa_intr(self, isa_input, rtl_input, epc):
         fd = open(rtl_input.intrfile, 'r')
         tuples = [ line.split(':') for line in fd.readlines() ]
@@ -54,44 +139,248 @@ class rvPreProcessor():
         fd.write('{:016x}:{:04b}\n'.format(epc, val))
         fd.close()
 
-    def generate_assembly(self, template_lines, sim_input, data, num_data_sections, section_size):
-        prefix_insts = sim_input.get_prefix()
-        insts = sim_input.get_insts()
-        suffix_insts = sim_input.get_suffix()
+    def split_template(self, template_lines, num_data_sections):
+        """ Splits template lines into (lines, region) segments, where region is
+        the fuzzed region (PREFIX, MAIN, SUFFIX or data section number) whose
+        label ends the segment, or None for the last segment
+        """
+        markers = { '_fuzz_prefix:': PREFIX, '_fuzz_main:': MAIN, '_fuzz_suffix:': SUFFIX }
+        for n in range(num_data_sections):
+            markers['_random_data{}:'.format(n)] = n
+
+        segments = []
+        lines = []
+        for line in template_lines:
+            lines.append(line)
+
+            tokens = line.split()
+            if tokens and tokens[0] in markers:
+                segments.append((lines, markers[tokens[0]]))
+                lines = []
+
+        segments.append((lines, None))
+        return segments
+
+    def get_template(self, version, extra_args, num_data_sections):
+        """ Template of a version, run through the C preprocessor only once.
+        Inputs then only add the fuzzed regions and skip cpp when compiled.
+        The v-u template is compiled with per-input C sources and is only
+        read from disk once.
+        """
+        preprocess = version not in [ V_U ]
+        key = (version, tuple(extra_args) if preprocess else None)
+
+        if key not in self.template_cache:
+            test_template = self.template + '/rv64-{}.S'.format(templates[version])
+
+            p = None
+            if preprocess:
+                cpp_args = [ self.cc, '-E', '-P', '-x', 'assembler-with-cpp',
+                             '-I', '{}/include'.format(self.template) ] + extra_args + [ test_template ]
+                p = subprocess.run(cpp_args, stdout=subprocess.PIPE)
+
+            if p and p.returncode == 0:
+                template_lines = p.stdout.decode().splitlines(True)
+            else:
+                preprocess = False
+                fd = open(test_template, 'r')
+                template_lines = fd.readlines()
+                fd.close()
+
+            self.template_cache[key] = (self.split_template(template_lines, num_data_sections), preprocess)
+
+        return self.template_cache[key]
+
+    def get_regions(self, sim_input):
+        return { PREFIX: sim_input.get_prefix(),
+                 MAIN: sim_input.get_insts(),
+                 SUFFIX: sim_input.get_suffix() }
+
+    def generate_data(self, n, data, section_size):
+        start = n * section_size
+        end = start + section_size
+
+        lines = []
+        k = 0
+        for i in range(start, end, 2):
+            label = ''
+            if i > start + 2 and i < end - 4:
+                label = 'd_{}_{}:'.format(n, k)
+                k += 1
 
+            lines.append('{:<16}.dword 0x{:016x}, 0x{:016x}\n'.\
+                         format(label, data[i], data[i+1]))
+        return lines
+
+    def generate_assembly(self, segments, regions, data, section_size):
         assembly = []
-        for line in template_lines:
-            assembly.append(line)
-            if '_fuzz_prefix:' in line:
-                for inst in prefix_insts:
-                    assembly.append(inst + ';\n')
+        for (lines, region) in segments:
+            assembly += lines
 
-            if '_fuzz_main:' in line:
-                for inst in insts:
+            if region in [ PREFIX, MAIN, SUFFIX ]:
+                for inst in regions[region]:
                     assembly.append(inst + ';\n')
 
-            if '_fuzz_suffix:' in line:
-                for inst in suffix_insts:
-                    assembly.append(inst + ';\n')
+            elif region is not None:
+                assembly += self.generate_data(region, data, section_size)
+        return assembly
 
-            for n in range(num_data_sections):
-                start = n * section_size
-                end = start + section_size
-                if '_random_data{}'.format(n) in line:
-                    k = 0
-                    for i in range(start, end, 2):
-                        label = ''
-                        if i > start + 2 and i < end - 4:
-                            label = 'd_{}_{}:'.format(n, k)
-                            k += 1
-
-                        assembly.append('{:<16}.dword 0x{:016x}, 0x{:016x}\n'.\
-                                        format(label, data[i], data[i+1]))
+    def get_labels(self, lines):
+        labels = []
+        for line in lines:
+            for statement in line.split(';'):
+                m = re.match(r'\s*([A-Za-z_.$][\w.$]*):', statement)
+                if m and not m.group(1).startswith('.L'):
+                    labels.append(m.group(1))
+        return labels
+
+    def get_glue_end(self, lines, end):
+        """ Index of the first line from which the template may be placed in
+        a section of its own, i.e. which aligns or changes the section
+        """
+        for i, line in enumerate(lines[:end]):
+            for statement in line.split(';'):
+                tokens = [ token for token in statement.split() if not token.endswith(':') ]
+                if tokens and tokens[0] in ALIGN_DIRECTIVES + SECTION_DIRECTIVES:
+                    return i
+        return end
+
+    def split_link_template(self, segments, num_data_sections, section_size):
+        """ Template object source, with placeholder data, the fuzzed code
+        regions in template order with their glue, and the declarations of
+        the glue labels
+        """
+        template = []
+        glues = []
+        region = None
+        for (lines, next_region) in segments:
+            if region in [ PREFIX, MAIN, SUFFIX ]:
+                # the marker ending the segment stays in the template object
+                i = self.get_glue_end(lines, len(lines) - (next_region is not None))
+                glues.append((region, lines[:i]))
+                template.append('.section .text.init.tmpl{},"ax",@progbits\n'.format(len(glues)))
+                lines = lines[i:]
+
+            template += lines
+
+            region = next_region
+            if region not in [ None, PREFIX, MAIN, SUFFIX ]:
+                template += self.generate_data(region, [ 0 ] * num_data_sections * section_size, section_size)
+
+        template = [ '.global {}\n'.format(label) for label in self.get_labels(template) ] + template
+        glue_labels = self.get_labels([ line for (_, glue) in glues for line in glue ])
+
+        return (template, glues, [ '.global {}\n'.format(label) for label in glue_labels ])
+
+    def generate_fuzz_assembly(self, split, regions):
+        (_, _, glues, header) = split
+
+        assembly = list(header)
+        for (k, (region, glue)) in enumerate(glues):
+            assembly.append('.section .text.init.fuzz{},"ax",@progbits\n'.format(k + 1))
+            for inst in regions[region]:
+                assembly.append(inst + ';\n')
+            assembly += glue
         return assembly
 
-    def compile_asm(self, extra_args, asm_name, elf_name):
-        cc_args = self.cc_args + extra_args + [ asm_name, '-o', elf_name ]
+    def same_binary(self, elf_name, check_name):
+        """ Same memory image and symbol addresses """
+        reader = elfReader(elf_name)
+        check_reader = elfReader(check_name)
+        symbols = [ (name, value) for (value, _, name) in reader.get_symbols() ]
+        check_symbols = [ (name, value) for (value, _, name) in check_reader.get_symbols() ]
+
+        return reader.get_image() == check_reader.get_image() and symbols == check_symbols
+
+    def get_split_template(self, version, extra_args, num_data_sections, section_size):
+        """ Template object and link script of a preprocessed template, built
+        once and checked against a full compile, None if the template has to
+        be assembled as a whole
+        """
+        key = (version, tuple(extra_args), section_size)
+        if key in self.link_cache:
+            return self.link_cache[key]
+
+        (segments, preprocessed) = self.get_template(version, extra_args, num_data_sections)
+        self.link_cache[key] = None
+        if not preprocessed:
+            return None
+
+        (template, glues, header) = self.split_link_template(segments, num_data_sections, section_size)
+
+        fd = open(self.link_script, 'r')
+        link_script = fd.read()
+        fd.close()
+
+        sections = ' '.join([ '*(.text.init)' ] + [ '*(.text.init.fuzz{}) *(.text.init.tmpl{})'.format(k, k)
+                                                     for k in range(1, len(glues) + 1) ])
+        if '{ *(.text.init) }' not in link_script:
+            return None
+        link_script = link_script.replace('{ *(.text.init) }', '{{ {} }} ={}'.format(sections, NOP_FILL))
+
+        name = self.base + '/.template_{}_{}'.format(self.proc_num, len(self.link_cache) - 1)
+        split = (name + '.o', name + '.ld', glues, header)
+
+        fd = open(name + '.ld', 'w')
+        fd.write(link_script)
+        fd.close()
+
+        fd = open(name + '.tmpl.S', 'w')
+        fd.writelines(template)
+        fd.close()
+
+        if self.run_cc(self.cc_flags + extra_args + [ '-c', '-x', 'assembler', name + '.tmpl.S', '-o', name + '.o' ]) != 0:
+            print('[Preprocessor] Assembling the {} template object failed, compiling inputs as a whole'.
+                  format(templates[version]))
+            self.remove_split(name)
+            return None
+
+        regions = { PREFIX: [], MAIN: [], SUFFIX: [] }
+        data = [ 0 ] * num_data_sections * section_size
+
+        fd = open(name + '.S', 'w')
+        fd.writelines(self.generate_assembly(segments, regions, data, section_size))
+        fd.close()
+
+        fd = open(name + '.fuzz.S', 'w')
+        fd.writelines(self.generate_fuzz_assembly(split, regions))
+        fd.close()
+
+        if self.compile_asm(extra_args, name + '.S', name + '.elf', True) != 0 or \
+           self.link_asm(split, name + '.fuzz.S', name + '.link.elf') != 0 or \
+           not self.same_binary(name + '.link.elf', name + '.elf'):
+            print('[Preprocessor] Split link of the {} template differs from its compile, compiling inputs as a whole'.
+                  format(templates[version]))
+            self.remove_split(name)
+            return None
+
+        self.remove_split(name, [ '.tmpl.S', '.S', '.fuzz.S', '.elf', '.link.elf' ])
+
+        self.link_cache[key] = split
+        return split
+
+    def remove_split(self, name, suffixes=[ '.o', '.ld', '.tmpl.S', '.S', '.fuzz.S', '.elf', '.link.elf' ]):
+        for suffix in suffixes:
+            if os.path.exists(name + suffix):
+                os.remove(name + suffix)
 
+    def compile_asm(self, extra_args, asm_name, elf_name, preprocessed=False):
+        if preprocessed:
+            cc_args = self.cc_args + extra_args + [ '-x', 'assembler', asm_name, '-x', 'none', '-o', elf_name ]
+        else:
+            cc_args = self.cc_args + extra_args + [ asm_name, '-o', elf_name ]
+
+        return self.run_cc(cc_args)
+
+    def link_asm(self, split, asm_name, elf_name):
+        """ Assembles the fuzzed regions and links them with the template object """
+        (obj_name, script_name, _, _) = split
+        cc_args = self.cc_flags + [ '-T', script_name, '-x', 'assembler', asm_name, '-x', 'none', obj_name,
+                                    '-o', elf_name ]
+
+        return self.run_cc(cc_args)
+
+    def run_cc(self, cc_args):
         cc_ret = -1
         while True:
             cc_ret = subprocess.call(cc_args)
@@ -108,7 +397,6 @@ class rvPreProcessor():
             'Number of memory blocks should be power of 2'
 
         version = sim_input.get_template()
-        test_template = self.template + '/rv64-{}.S'.format(templates[version])
 
         if intr: DINTR = ['-DINTERRUPT']
         else: DINTR = []
@@ -144,29 +432,54 @@ class rvPreProcessor():
 
         sim_input.save(si_name, (data_a, data_b))
 
-        fd = open(test_template, 'r')
-        template_lines = fd.readlines()
-        fd.close()
+        (segments, preprocessed) = self.get_template(version, extra_args, num_data_sections)
+        split = None
+        if preprocessed:
+            split = self.get_split_template(version, extra_args, num_data_sections, section_size)
 
-        assembly_a = self.generate_assembly(template_lines, sim_input, data_a, num_data_sections, section_size)
+        regions = self.get_regions(sim_input)
 
-        assembly_b = self.generate_assembly(template_lines, sim_input, data_b, num_data_sections, section_size)
+        if split:
+            fd = open(asm_name_a, 'w')
+            fd.writelines(self.generate_fuzz_assembly(split, regions))
+            fd.close()
 
-        fd = open(asm_name_a, 'w')
-        fd.writelines(assembly_a)
-        fd.close()
-        fd = open(asm_name_b, 'w')
-        fd.writelines(assembly_b)
-        fd.close()
+            # linked with placeholder data, the a binary is patched from it
+            cc_ret = self.link_asm(split, asm_name_a, elf_name_b)
+        else:
+            fd = open(asm_name_a, 'w')
+            fd.writelines(self.generate_assembly(segments, regions, data_a, section_size))
+            fd.close()
 
-        cc_ret_a = self.compile_asm(extra_args, asm_name_a, elf_name_a)
-        cc_ret_b = self.compile_asm(extra_args, asm_name_b, elf_name_b)
+            cc_ret = self.compile_asm(extra_args, asm_name_a, elf_name_a, preprocessed)
         
-        if cc_ret_a == 0 and cc_ret_b == 0:
+        if cc_ret == 0:
 
-            elf2hex_args = self.elf2hex_args + [ elf_name_a, '--output', hex_name]
-            subprocess.call(elf2hex_args)
-            symbols= self.get_symbols(elf_name_a, sym_name)
+            if split:
+                symbols = dict([ (name, value) for (value, _, name) in elfReader(elf_name_b).get_symbols() ])
+                self.patch_data(elf_name_b, elf_name_a, symbols, data_a, num_data_sections, section_size)
+
+            symbols = self.get_hex_symbols(elf_name_a, hex_name, sym_name)
+            self.patch_data(elf_name_a, elf_name_b, symbols, data_b, num_data_sections, section_size)
+
+            if self.cross_check:
+                checks = [ (asm_name_b, elf_name_b, data_b) ]
+                if split:
+                    checks.append((asm_name_a + '.check', elf_name_a, data_a))
+
+                for (asm_name, elf_name, data) in checks:
+                    fd = open(asm_name, 'w')
+                    fd.writelines(self.generate_assembly(segments, regions, data, section_size))
+                    fd.close()
+
+                    assert self.compile_asm(extra_args, asm_name, elf_name + '.check', preprocessed) == 0, \
+                        'compiling {} failed'.format(asm_name)
+                    assert self.same_binary(elf_name, elf_name + '.check'), \
+                        '{} differs from the compiled one'.format(elf_name)
+
+                    os.remove(elf_name + '.check')
+                if split:
+                    os.remove(asm_name_a + '.check')
 
             if intr:
                 fuzz_main = symbols['_fuzz_main']
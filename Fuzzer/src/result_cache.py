@@ -0,0 +1,80 @@
+from collections import OrderedDict
+
+""" Result cache
+Bounded LRU of simulation results keyed by simInput.content_hash() (template,
+populated instructions, interrupts and data contents), so an input identical
+to one which was already run is neither preprocessed, contract-checked nor
+simulated again. An entry holds the contract check verdict (proc_state) and
+the RTL verdict with its coverage, each None while unknown (e.g. in flight).
+"""
+
+class cacheEntry():
+    __slots__ = ('hsc', 'rtl', 'cov')
+
+    def __init__(self):
+        self.hsc = None
+        self.rtl = None
+        self.cov = None
+
+class resultCache():
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+
+        self.lookups = 0
+        self.hits = 0
+        self.hsc_hits = 0
+        self.rtl_hits = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def lookup(self, key):
+        """ Returns the entry of key, None on a miss """
+        self.lookups += 1
+
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        if entry.hsc is not None:
+            self.hsc_hits += 1
+        if entry.rtl is not None:
+            self.rtl_hits += 1
+
+        return entry
+
+    def entry(self, key):
+        """ Returns the entry of key, created (evicting the least recently used one) if missing """
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = cacheEntry()
+            self.entries[key] = entry
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        else:
+            self.entries.move_to_end(key)
+
+        return entry
+
+    def put_hsc(self, key, ret):
+        self.entry(key).hsc = ret
+
+    def put_rtl(self, key, ret, cov=None):
+        entry = self.entry(key)
+        entry.rtl = ret
+        entry.cov = cov
+
+    def hit_rate(self):
+        if not self.lookups:
+            return 0
+        return self.hits / self.lookups
+
+    def stats(self):
+        return '{} entries, {} lookups, {} hits ({:.1%}), {} contract checks and {} RTL simulations saved'. \
+            format(len(self.entries), self.lookups, self.hits, self.hit_rate(), self.hsc_hits, self.rtl_hits)
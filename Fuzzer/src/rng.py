@@ -0,0 +1,42 @@
+import time
+import random
+import hashlib
+
+""" RNG streams
+Independent random.Random streams, all derived from one campaign seed, so
+that drawing more or less in one part of the fuzzer does not shift the
+others and a campaign is reproducible from its seed:
+ - inst:    instruction and word generation (inst_generator, word)
+ - data:    data seeds (mutator)
+ - sched:   phases, corpus scheduling and mutation decisions (mutator, corpus)
+ - adapter: TileLink source/sink arbitration (FreeList), seeded in the
+            simulator from the SEED option (see derive_seed)
+
+The streams are seeded in place, modules use them as rng.inst.random() etc.
+"""
+
+STREAMS = [ 'inst', 'data', 'sched', 'adapter' ]
+
+inst = random.Random()
+data = random.Random()
+sched = random.Random()
+adapter = random.Random()
+
+campaign_seed = None
+
+def derive_seed(seed, stream):
+    digest = hashlib.sha256('{}/{}'.format(seed, stream).encode()).digest()
+    return int.from_bytes(digest[:8], 'little')
+
+def seed(new_seed=None):
+    """ Seeds all streams from new_seed (from the time if None), returns the seed """
+    global campaign_seed
+
+    if new_seed is None:
+        new_seed = time.time_ns() & 0xffffffff
+    campaign_seed = new_seed
+
+    for stream in STREAMS:
+        globals()[stream].seed(derive_seed(new_seed, stream))
+
+    return new_seed
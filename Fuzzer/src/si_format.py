@@ -0,0 +1,194 @@
+import sys
+import struct
+from array import array
+
+from word import PREFIX, MAIN, SUFFIX
+
+""" simInput file (.si) formats
+text:   the human readable form, template name, the labeled instructions of
+        prefix, main (with a 4 bit interrupt vector per line) and suffix,
+        followed by the optional data_a/data_b sections in hex
+binary: a header (magic, version, template, counts) followed by
+          - the distinct instructions, '\\n' separated
+          - label and number of instructions of every word
+          - an instruction index per instruction line
+          - the interrupt vector, one byte per main instruction line
+          - data_a and data_b as 64 bit words
+        all little endian
+
+load_si()/parse_si() read both and return (template, (prefix, words, suffix), ints, data),
+where every part is a list of (label, insts) tuples and data a pair of array('Q')
+"""
+
+""" Template versions """
+P_M = 0
+P_S = 1
+P_U = 2
+
+# V_M = 3
+# V_S = 3
+V_U = 3
+
+templates = [ 'p-m', 'p-s', 'p-u',
+              'v-u']
+
+PARTS = [ PREFIX, MAIN, SUFFIX ]
+
+SI_MAGIC = b'\x7fRSI'
+SI_VERSION = 1
+
+# magic, version, template, num_prefix, num_words, num_suffix,
+# strings_size, num_lines, num_ints, num_data_a, num_data_b
+SI_HEADER = struct.Struct('<4sHH8I')
+
+def to_le(arr):
+    if sys.byteorder != 'little':
+        arr.byteswap()
+    return arr
+
+def read_array(typecode, buf, offset, num):
+    arr = array(typecode)
+    end = offset + num * arr.itemsize
+    arr.frombytes(buf[offset:end])
+    return (to_le(arr), end)
+
+def encode_si(template, parts, ints, data):
+    strings = {}
+    labels = array('I')
+    lens = array('H')
+    lines = array('I')
+
+    for part in parts:
+        for (label, insts) in part:
+            labels.append(label)
+            lens.append(len(insts))
+            for inst in insts:
+                lines.append(strings.setdefault(inst, len(strings)))
+
+    strings = '\n'.join(strings.keys()).encode()
+    (data_a, data_b) = data if data else ([], [])
+
+    header = SI_HEADER.pack(SI_MAGIC, SI_VERSION, template,
+                            len(parts[0]), len(parts[1]), len(parts[2]),
+                            len(strings), len(lines), len(ints),
+                            len(data_a), len(data_b))
+
+    return b''.join([ header, strings,
+                      to_le(labels).tobytes(), to_le(lens).tobytes(), to_le(lines).tobytes(),
+                      bytes(ints),
+                      to_le(array('Q', data_a)).tobytes(), to_le(array('Q', data_b)).tobytes() ])
+
+def decode_si(buf):
+    (magic, version, template, num_prefix, num_words, num_suffix,
+     strings_size, num_lines, num_ints, num_data_a, num_data_b) = SI_HEADER.unpack_from(buf, 0)
+
+    assert magic == SI_MAGIC, 'Not a binary simInput'
+    assert version == SI_VERSION, \
+        'Unsupported simInput version {} (expected {})'.format(version, SI_VERSION)
+
+    offset = SI_HEADER.size
+    strings = bytes(buf[offset:offset + strings_size]).decode().split('\n')
+    offset += strings_size
+
+    num_total = num_prefix + num_words + num_suffix
+    (labels, offset) = read_array('I', buf, offset, num_total)
+    (lens, offset) = read_array('H', buf, offset, num_total)
+    (lines, offset) = read_array('I', buf, offset, num_lines)
+
+    ints = list(buf[offset:offset + num_ints])
+    offset += num_ints
+
+    (data_a, offset) = read_array('Q', buf, offset, num_data_a)
+    (data_b, offset) = read_array('Q', buf, offset, num_data_b)
+
+    parts = []
+    (n, k) = (0, 0)
+    for num in [ num_prefix, num_words, num_suffix ]:
+        part = []
+        for i in range(n, n + num):
+            part.append((labels[i], [ strings[idx] for idx in lines[k:k + lens[i]] ]))
+            k += lens[i]
+        parts.append(part)
+        n += num
+
+    return (template, tuple(parts), ints, (data_a, data_b))
+
+def parse_si_text(lines):
+    template = templates.index(lines[0].split('\n')[0])
+
+    parts = ([], [], [])
+    ints = []
+    data = ([], [])
+
+    part = None
+    words = None
+    data_words = None
+    for line in lines[2:]:
+        if data_words is not None:
+            if 'data_b:' in line:
+                data_words = data[1]
+            else:
+                data_words.append(int(line, 16))
+            continue
+
+        if 'data_a:' in line:
+            data_words = data[0]
+            continue
+
+        if line[:2] in PARTS:
+            part = line[:2]
+            words = parts[PARTS.index(part)]
+            label = line[:8].split(':')[0]
+            words.append((int(label[2:]), []))
+
+        words[-1][1].append(line[8:50].rstrip())
+
+        if part == MAIN:
+            ints.append(int(line[-5:-1], 2))
+
+    return (template, parts, ints, (array('Q', data[0]), array('Q', data[1])))
+
+def format_si_text(template, parts, ints, data):
+    out = [ '{}\n\n'.format(templates[template]) ]
+
+    ints = iter(ints)
+    for (part, words) in zip(PARTS, parts):
+        for (label, insts) in words:
+            for (i, inst) in enumerate(insts):
+                head = part + '{}:'.format(label) if i == 0 else ''
+                line = '{:<8}{:<42}'.format(head, inst)
+                if part == MAIN:
+                    out.append('{:<50}{:04b}\n'.format(line, next(ints, 0)))
+                else:
+                    out.append('{:<50}\n'.format(line))
+
+    if data:
+        (a, b) = data
+        out.append('data_a:\n')
+        out += [ '{:016x}\n'.format(word) for word in a ]
+        out.append('data_b:\n')
+        out += [ '{:016x}\n'.format(word) for word in b ]
+
+    return ''.join(out)
+
+def parse_si(buf):
+    if buf[:len(SI_MAGIC)] == SI_MAGIC:
+        return decode_si(memoryview(buf))
+
+    return parse_si_text(buf.decode().splitlines(keepends=True))
+
+def load_si(si_name):
+    fd = open(si_name, 'rb')
+    buf = fd.read()
+    fd.close()
+
+    return parse_si(buf)
+
+def save_si(si_name, template, parts, ints, data, binary=True):
+    if binary:
+        fd = open(si_name, 'wb')
+        fd.write(encode_si(template, parts, ints, data))
+    else:
+        fd = open(si_name, 'w')
+        fd.write(format_si_text(template, parts, ints, data))
+    fd.close()
@@ -1,11 +1,14 @@
 import os
+from array import array
 import shutil
+import socket
 import subprocess
 import sys
+import time
 from typing import Tuple
-from bitarray import bitarray
 import psutil
 import signal
+from multiprocessing.util import Finalize
 from threading import Timer
 
 from HSCSim.host import rvHSChost
@@ -15,6 +18,9 @@ from src.preprocessor import rvPreProcessor
 from src.signature_checker import sigChecker
 from src.mutator import simInput, rvMutator
 from src.multicore_manager import proc_state, procManager
+from src.cov_utils import cov_from_bytes, save_cov, load_cov
+
+from Config import COV_HASH_BY_TOPLEVEL, HDL_MONITOR, DISPATCH
 
 ISA_TIME_LIMIT = 1
 
@@ -86,6 +92,12 @@ def save_file(file_name, mode, line):
     fd.write(line)
     fd.close()
 
+def read_file(file_name, mode='rb'):
+    fd = open(file_name, mode)
+    ret = fd.read()
+    fd.close()
+    return ret
+
 def save_mismatch(base, out, id, bug_id): #, elf, asm, hexfile, mNum):
     # sim_input.save(out + '/sim_input/id_{}.si'.format(num), data)
 
@@ -102,11 +114,25 @@ def save_mismatch(base, out, id, bug_id): #, elf, asm, hexfile, mNum):
     # shutil.copy(elf_name_b, out + '/elf/id_{}_b.elf'.format(num))
     # shutil.copy(hex_name, out + '/hex/id_{}.hex'.format(num))
 
-def save_leak(base, out, id, bug_id): #, elf, asm, hexfile, mNum):
+def save_leak(base, out, id, bug_id, seed=None): #, elf, asm, hexfile, mNum):
     # sim_input.save(out + '/sim_input/id_{}.si'.format(num), data)
 
     shutil.copy(os.path.join(base, '.input_{}.si'.format(id)), out + '/sim_input/id_{}.si'.format(bug_id))
     shutil.copy(os.path.join(base, '.input_{}.cov'.format(id)), out + '/sim_input/id_{}.cov'.format(bug_id))
+    if seed is not None:
+        save_seed(out + '/sim_input/id_{}.si'.format(bug_id), seed)
+
+# The adapter seed a leak was found under is kept next to its .si file, so
+# Replay and Minimize simulate it under the same TileLink arbitration
+def save_seed(si_name, seed):
+    save_file(si_name.split('.si')[0] + '.seed', 'w', '{}\n'.format(seed))
+
+def load_seed(si_name):
+    """ The adapter seed saved with si_name, None if there is none """
+    seed_name = si_name.split('.si')[0] + '.seed'
+    if not os.path.isfile(seed_name):
+        return None
+    return int(read_file(seed_name, 'r'))
 
 
 def setupHSC(template, out, proc_num, debug, contract='ct', isa='RV64I', no_guide=False):
@@ -134,53 +160,167 @@ def setupHSC(template, out, proc_num, debug, contract='ct', isa='RV64I', no_guid
 
 # from hashlib import shake_128
 
-def run_rtl_test(bin_dir, v_file, toplevel, sim_input_name, id, sim_input):
-    
-    res_file = 'results_{}.xml'.format(id)
-
-    debug = 0
-    cmd = 'make SIM_BUILD={} VFILE={} TOPLEVEL={} DEBUG={} INPUT={} COCOTB_RESULTS_FILE={}'.format(bin_dir, v_file, toplevel, debug, sim_input_name, res_file)
-    p = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=sys.stdout.fileno())
-
-    leak = any(filter(lambda x: '[Leakage]' in str(x), p.stdout.splitlines()))
-    # if debug == 1:
-    #     temp = b''
-    #     for l in filter(lambda x: "idx" in str(x),p.stdout.splitlines()):
-    #         if l != temp:
-    #             print(l)
-    #             temp = l
+def make_cmd(bin_dir, v_file, toplevel, debug, seed=None):
+    if HDL_MONITOR:
+        cmd = 'make SIM_BUILD={}_monitor VFILE={} TOPLEVEL={} DEBUG={} HDL_MONITOR=1'.format(bin_dir, v_file, toplevel, debug)
+    else:
+        cmd = 'make SIM_BUILD={} VFILE={} TOPLEVEL={} DEBUG={} COV_HASH={}'.format(bin_dir, v_file, toplevel, debug, COV_HASH_BY_TOPLEVEL[toplevel])
+    if DISPATCH:
+        cmd += ' DISPATCH=1'
+    if seed is not None:
+        cmd += ' SEED={}'.format(seed)
+    return cmd
+
+class rtlServer():
+    """ Persistent RTL simulator
+    Starts one simulator in server mode (see Runner.Serve) and sends it
+    SimInputs over a unix socket, so Verilator, cocotb and the RTL host are
+    only set up once per worker instead of once per test.
+    """
+    def __init__(self, bin_dir, v_file, toplevel, sock_name, seed=None):
+        self.sock_name = sock_name
+        self.seed = seed
+        self.res_file = 'results_server_{}.xml'.format(os.getpid())
+
+        if os.path.exists(sock_name):
+            os.remove(sock_name)
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(sock_name)
+        listener.listen(1)
+
+        debug = 0
+        cmd = make_cmd(bin_dir, v_file, toplevel, debug, seed) + ' SERVER={} COCOTB_RESULTS_FILE={}'.format(sock_name, self.res_file)
+        self.proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.DEVNULL, stderr=sys.stdout.fileno())
+
+        # the simulator may fail before it connects (build, plusargs), so
+        # the accept only waits for as long as it is alive
+        listener.settimeout(1)
+        self.conn = None
+        try:
+            while self.conn is None:
+                try:
+                    (self.conn, _) = listener.accept()
+                except socket.timeout:
+                    if self.proc.poll() is not None:
+                        raise OSError('RTL simulator server exited with {} before connecting'.
+                                      format(self.proc.returncode))
+        finally:
+            listener.close()
+            if self.conn is None:
+                self.remove_files()
+
+        self.conn.settimeout(None)
+        self.rfile = self.conn.makefile('rb')
+
+    def run(self, sim_input_name):
+        try:
+            self.conn.sendall('{}\n'.format(os.path.abspath(sim_input_name)).encode())
+            header = self.rfile.readline().split()
+            ret = int(header[0])
+            cov_bytes = self.rfile.read(int(header[1]))
+        except (OSError, IndexError, ValueError):
+            return (ERROR, array('I'))
+
+        return (ret, cov_from_bytes(cov_bytes))
+
+    def close(self):
+        try: self.conn.sendall(b'\n')
+        except OSError: pass
+
+        self.rfile.close()
+        self.conn.close()
+        self.proc.wait()
+
+        self.remove_files()
+
+    def remove_files(self):
+        if os.path.exists(self.sock_name):
+            os.remove(self.sock_name)
+        if os.path.exists(self.res_file):
+            os.remove(self.res_file)
+
+# simulator server of this (worker) process, started on first use
+rtl_server = None
+
+def close_rtl_server():
+    global rtl_server
+
+    if rtl_server is not None:
+        rtl_server.close()
+        rtl_server = None
+
+def get_rtl_server(bin_dir, v_file, toplevel, dir, seed=None):
+    global rtl_server
+
+    # the simulator seeds the adapter from the seed it was started with
+    if rtl_server is not None and (rtl_server.proc.poll() is not None or rtl_server.seed != seed):
+        close_rtl_server()
+
+    if rtl_server is None:
+        sock_name = os.path.join(os.path.abspath(dir), '.rtl_server_{}.sock'.format(os.getpid()))
+        rtl_server = rtlServer(bin_dir, v_file, toplevel, sock_name, seed)
+        # pool workers leave through os._exit(), which skips atexit but runs
+        # multiprocessing finalizers, so the socket and results file are removed
+        Finalize(None, close_rtl_server, exitpriority=10)
+
+    return rtl_server
+
+def run_rtl_test(bin_dir, v_file, toplevel, sim_input_name, id, sim_input, persistent=False, seed=None,
+                 record=True):
     dir, fname = os.path.split(sim_input_name)
     fname = fname.split('.si')[0]
     cov_name = fname + '.cov'
     cov_out =  os.path.join(dir, cov_name)
 
-    # fd = open(os.path.join(dir, fname + '.symbols'), 'rb')
-    # ct = fd.read()
-    # print(shake_128(ct).hexdigest(8))
-    # fd = open(os.path.join(dir, fname + '.hex'), 'rb')
-    # ct = fd.read()
-    # print(shake_128(ct).hexdigest(8))
-
-    b = bitarray()
-    fd = open(cov_out, 'rb')
-    b.fromfile(fd)
-    fd.close()
-
-    if leak:
-        save_leak(dir, dir + '/leaks', id, id)
-
-
-    os.remove(cov_out)
-    os.remove(sim_input_name)
-    os.remove(os.path.join(dir, fname + '_a.S'))
-    os.remove(os.path.join(dir, fname + '_b.S'))
-    os.remove(os.path.join(dir, fname + '_a.elf'))
-    os.remove(os.path.join(dir, fname + '_b.elf'))
-    os.remove(os.path.join(dir, fname + '.hex'))
-    os.remove(os.path.join(dir, fname + '.symbols'))
-    os.remove(os.path.join(os.getcwd(), res_file))
-
-    return (LEAK if leak else NO_LEAK, b, id, sim_input) #TODO detect timeout and errors
+    start = time.time()
+    if persistent:
+        try:
+            server = get_rtl_server(bin_dir, v_file, toplevel, dir, seed)
+            (ret, b) = server.run(sim_input_name)
+        except OSError as e:
+            print('[RTLHost] {}'.format(e))
+            (ret, b) = (ERROR, array('I'))
+        leak = ret == LEAK
+        if leak and record:
+            save_cov(cov_out, b)
+    else:
+        res_file = 'results_{}.xml'.format(id)
+
+        debug = 0
+        cmd = make_cmd(bin_dir, v_file, toplevel, debug, seed) + ' INPUT={} COCOTB_RESULTS_FILE={}'.format(sim_input_name, res_file)
+        p = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=sys.stdout.fileno())
+
+        leak = any(filter(lambda x: '[Leakage]' in str(x), p.stdout.splitlines()))
+        ret = LEAK if leak else NO_LEAK
+        # if debug == 1:
+        #     temp = b''
+        #     for l in filter(lambda x: "idx" in str(x),p.stdout.splitlines()):
+        #         if l != temp:
+        #             print(l)
+        #             temp = l
+
+        # fd = open(os.path.join(dir, fname + '.symbols'), 'rb')
+        # ct = fd.read()
+        # print(shake_128(ct).hexdigest(8))
+        # fd = open(os.path.join(dir, fname + '.hex'), 'rb')
+        # ct = fd.read()
+        # print(shake_128(ct).hexdigest(8))
+
+        b = load_cov(cov_out)
+
+        os.remove(os.path.join(os.getcwd(), res_file))
+
+    exec_time = time.time() - start
+
+    if leak and record:
+        save_leak(dir, dir + '/leaks', id, id, seed)
+
+    if os.path.exists(cov_out):
+        os.remove(cov_out)
+    cleanup(sim_input_name)
+
+    return (ret, b, id, sim_input, exec_time) #TODO detect timeout and errors
 
 def cleanup(sim_input_name):
     
@@ -188,9 +328,9 @@ def cleanup(sim_input_name):
     fname = fname.split('.si')[0]
 
     os.remove(sim_input_name)
-    os.remove(os.path.join(dir, fname + '_a.S'))
-    os.remove(os.path.join(dir, fname + '_b.S'))
-    os.remove(os.path.join(dir, fname + '_a.elf'))
-    os.remove(os.path.join(dir, fname + '_b.elf'))
-    os.remove(os.path.join(dir, fname + '.hex'))
-    os.remove(os.path.join(dir, fname + '.symbols'))
\ No newline at end of file
+    # The b binary is patched from the a binary, so _b.S only exists
+    # when the preprocessor cross-checks against a full compile
+    for suffix in [ '_a.S', '_b.S', '_a.elf', '_b.elf', '.hex', '.symbols' ]:
+        name = os.path.join(dir, fname + suffix)
+        if os.path.exists(name):
+            os.remove(name)
\ No newline at end of file
@@ -1,5 +1,5 @@
 import os
-import random
+import rng
 
 from riscv_definitions import *
 
@@ -16,6 +16,13 @@ MAIN   = '_l'
 SUFFIX = '_s'
 
 class Word():
+    """ Words are shared between the simInputs of the corpus and their
+    mutations, populate() is the only method modifying a Word (a fresh one),
+    reset_label() and repop_label() return a new Word if anything changes
+    """
+    __slots__ = ('label', 'tpe', 'insts', 'len_insts', 'xregs', 'fregs', 'imms',
+                 'symbols', 'operands', 'populated', 'ret_insts')
+
     def __init__(self, label: int, insts: list, tpe=NONE, xregs=[], fregs=[], imms=[], symbols=[], populated=False):
         self.label = label
         self.tpe = tpe
@@ -31,6 +38,16 @@ class Word():
         self.populated = populated
         self.ret_insts = []
 
+    def copy(self, label, ret_insts):
+        word = Word.__new__(Word)
+        for attr in self.__slots__:
+            setattr(word, attr, getattr(self, attr))
+
+        word.label = label
+        word.ret_insts = ret_insts
+
+        return word
+
     def pop_inst(self, inst, opvals):
         for (op, val) in opvals.items():
             inst = inst.replace(op, val)
@@ -57,34 +74,51 @@ class Word():
         self.ret_insts = ret_insts
 
     def reset_label(self, new_label, part):
+        """ Returns (word, (old_label, new_label)), the tuple is None for
+        words which are not populated yet
+        """
         old_label = self.label
-        self.label = new_label
 
         if self.populated:
-            self.ret_insts[0] = '{:8}{:<42}'.format(part + str(self.label) + ':',
-                                                    self.ret_insts[0][8:])
-            return (old_label, new_label)
+            word = self
+            if new_label != old_label:
+                ret_insts = self.ret_insts.copy()
+                ret_insts[0] = '{:8}{:<42}'.format(part + str(new_label) + ':',
+                                                   ret_insts[0][8:])
+                word = self.copy(new_label, ret_insts)
+            return (word, (old_label, new_label))
         else:
-            return None
+            word = self if new_label == old_label else self.copy(new_label, [])
+            return (word, None)
 
     def repop_label(self, label_map, max_label, part):
-        if self.populated:
-            for i in range(len(self.ret_insts)):
-                inst = self.ret_insts[i]
-                tmps = inst.split(', ' + part)
+        if not self.populated:
+            return self
 
-                if len(tmps) > 1:
-                    label = tmps[1].split(' ')[0]
+        ret_insts = None
+        for i in range(len(self.ret_insts)):
+            inst = self.ret_insts[i]
+            tmps = inst.split(', ' + part)
 
-                    old = int(label)
-                    new = label_map.get(old, random.randint(self.label + 1, max_label))
+            if len(tmps) > 1:
+                label = tmps[1].split(' ')[0]
 
-                    new_inst = inst[8:].replace(part + '{}'.format(old), part + '{}'.format(new))
-                    inst = '{:<8}{:<50}'.format(inst[0:8], new_inst)
+                old = int(label)
+                new = label_map.get(old, rng.inst.randint(self.label + 1, max_label))
+                if new == old:
+                    continue
 
-                    self.ret_insts[i] = inst
-        else:
-            return
+                new_inst = inst[8:].replace(part + '{}'.format(old), part + '{}'.format(new))
+                inst = '{:<8}{:<50}'.format(inst[0:8], new_inst)
+
+                if ret_insts is None:
+                    ret_insts = self.ret_insts.copy()
+                ret_insts[i] = inst
+
+        if ret_insts is None:
+            return self
+
+        return self.copy(self.label, ret_insts)
 
     def get_insts(self):
         assert self.populated, \
@@ -128,7 +162,7 @@ def word_ret(opcode, syntax, xregs, fregs, imms, symbols):
 
 def word_mem_r(opcode, syntax, xregs, fregs, imms, symbols):
     tpe = MEM_R
-    rand = random.random()
+    rand = rng.inst.random()
     if rand < 0.1:
         mask_addr = [ 'lui xreg2, 0xffe00',
                       'xor xreg1, xreg1, xreg2' ]
@@ -143,7 +177,7 @@ def word_mem_r(opcode, syntax, xregs, fregs, imms, symbols):
 
 def word_mem_w(opcode, syntax, xregs, fregs, imms, symbols):
     tpe = MEM_W
-    rand = random.random()
+    rand = rng.inst.random()
     if rand < 0.1:
         mask_addr = [ 'lui xreg2, 0xffe00',
                       'xor xreg1, xreg1, xreg2' ]
@@ -158,7 +192,7 @@ def word_mem_w(opcode, syntax, xregs, fregs, imms, symbols):
 
 def word_atomic(opcode, syntax, xregs, fregs, imms, symbols):
     tpe = MEM_W
-    rand = random.random()
+    rand = rng.inst.random()
     if rand < 0.1:
         mask_addr = [ 'lui xreg2, 0xffe00',
                       'xor xreg1, xreg1, xreg2' ]
@@ -180,7 +214,7 @@ def word_atomic(opcode, syntax, xregs, fregs, imms, symbols):
     return (tpe, insts)
 
 def word_csr_r(opcode, syntax, xregs, fregs, imms, symbols):
-    csr = random.choice(csr_names)
+    csr = rng.inst.choice(csr_names)
 
     if 'pmpaddr' in csr:
         tpe = MEM_R
@@ -191,9 +225,9 @@ def word_csr_r(opcode, syntax, xregs, fregs, imms, symbols):
     else:
         tpe = CSR
         insts = [ 'xor xreg1, xreg1, xreg1']
-        for i in range(random.randint(0, 3)):
-            set_bits = random.choice([1, 3])
-            offset = random.randint(0, 31)
+        for i in range(rng.inst.randint(0, 3)):
+            set_bits = rng.inst.choice([1, 3])
+            offset = rng.inst.randint(0, 31)
             insts = insts + \
                 ['addi xreg{}, zero, {}'.format(i+2, set_bits),
                  'slli xreg{}, xreg{}, {}'.format(i+2, i+2, offset),
@@ -206,7 +240,7 @@ def word_csr_r(opcode, syntax, xregs, fregs, imms, symbols):
 
 def word_csr_i(opcode, syntax, xregs, fregs, imms, symbols):
     tpe = CSR
-    csr = random.choice(csr_names)
+    csr = rng.inst.choice(csr_names)
 
     insts = [ syntax.format(csr) ]
 
@@ -214,7 +248,7 @@ def word_csr_i(opcode, syntax, xregs, fregs, imms, symbols):
 
 def word_sfence(opcode, syntax, xregs, fregs, imms, symbols):
     tpe = NONE
-    pt_symbol = random.choice([ 'pt0', 'pt1', 'pt2', 'pt3' ])
+    pt_symbol = rng.inst.choice([ 'pt0', 'pt1', 'pt2', 'pt3' ])
 
     imms += [ ('uimm1', 1), ('uimm6', 8) ]
     insts = [ 'li xreg0, uimm1',
@@ -226,7 +260,7 @@ def word_sfence(opcode, syntax, xregs, fregs, imms, symbols):
 
 def word_fp(opcode, syntax, xregs, fregs, imms, symbols):
     tpe = NONE
-    # rm = random.choice([ 'rne', 'rtz', 'rdn',
+    # rm = rng.inst.choice([ 'rne', 'rtz', 'rdn',
     #                      'rup', 'rmm', 'dyn'])
     # Unset rounding mode testing
     rm = 'rne'